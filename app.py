@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 
 # Importazioni modularizzate
-from database.connection import get_data, save_data, insert_single_mapping
+from database.connection import insert_single_mapping
+from database.data_context import DataContext
 from services.portfolio_service import calculate_portfolio_view, calculate_liquidity, get_historical_portfolio
 from ui.components import make_sidebar
 from ui.dashboard_components import render_kpis, render_composition_tabs, render_assets_table, render_historical_chart
@@ -11,20 +12,11 @@ st.set_page_config(page_title="Portfolio Pro", layout="wide", page_icon="🚀")
 make_sidebar()
 st.title("🚀 Dashboard Portafoglio")
 
-@st.cache_data(show_spinner="Caricamento dati...")
-def load_all_data():
-    """Carica tutti i dataframe necessari in un'unica funzione con cache."""
-    return {
-        "transactions": get_data("transactions"),
-        "mapping": get_data("mapping"),
-        "prices": get_data("prices"),
-        "budget": get_data("budget"),
-        "asset_allocation": get_data("asset_allocation")
-    }
+# Contesto dati del rerun: ogni tabella viene letta e normalizzata una sola volta
+ctx = DataContext()
+with st.spinner("Caricamento dati..."):
+    df_trans, df_map, df_prices, df_budget, df_alloc = ctx.transactions, ctx.mapping, ctx.prices, ctx.budget, ctx.asset_allocation
 
-data = load_all_data()
-
-df_trans, df_map, df_prices, df_budget, df_alloc = data.values()
 if df_trans.empty:
     st.info("👋 Benvenuto! Il database è vuoto. Vai su 'Gestione Dati' per importare il CSV.")
     st.stop()
@@ -68,7 +60,12 @@ if missing_isins:
     st.stop() 
 
 # --- CALCOLI PRINCIPALI ---
-with st.spinner("Calcolo indicatori..."):
+@st.cache_data(show_spinner=False)
+def compute_dashboard_views(df_trans, df_map, df_prices, df_budget):
+    """
+    Calcola vista asset, vista completa (con liquidità) e storico.
+    In cache: i rerun dei fragment e quelli senza modifiche ai dati non ripetono i calcoli.
+    """
     # 1. Calcola la vista degli ASSET (senza liquidità) per i KPI.
     assets_view = calculate_portfolio_view(df_trans, df_map, df_prices)
     
@@ -78,13 +75,18 @@ with st.spinner("Calcolo indicatori..."):
     # 3. Calcola lo storico.
     hdf = get_historical_portfolio(df_trans, df_map, df_prices)
 
-# 4. Crea una vista COMPLETA (full_view) per i grafici, aggiungendo la liquidità.
-full_view = assets_view.copy()
-if final_liquidity > 0:
-    liquidita_row = pd.DataFrame([{'product': liquidity_label, 'ticker': 'CASH', 'category': 'Liquidità', 'quantity': 1, 'local_value': 0, 'net_invested': final_liquidity, 'curr_price': final_liquidity, 'mkt_val': final_liquidity, 'pnl': 0, 'pnl%': 0}])
-    full_view = pd.concat([full_view, liquidita_row], ignore_index=True)
+    # 4. Crea una vista COMPLETA (full_view) per i grafici, aggiungendo la liquidità.
+    full_view = assets_view.copy()
+    if final_liquidity > 0:
+        liquidita_row = pd.DataFrame([{'product': liquidity_label, 'ticker': 'CASH', 'category': 'Liquidità', 'quantity': 1, 'local_value': 0, 'net_invested': final_liquidity, 'curr_price': final_liquidity, 'mkt_val': final_liquidity, 'pnl': 0, 'pnl%': 0}])
+        full_view = pd.concat([full_view, liquidita_row], ignore_index=True)
+    return assets_view, full_view, hdf
+
+with st.spinner("Calcolo indicatori..."):
+    assets_view, full_view, hdf = compute_dashboard_views(df_trans, df_map, df_prices, df_budget)
 
 # --- RENDERIZZAZIONE COMPONENTI UI ---
+# Tab X-Ray, grafico storico e tabella asset sono fragment: i loro widget rieseguono solo la propria sezione
 render_kpis(assets_view)
 render_composition_tabs(full_view, df_alloc)
 render_historical_chart(hdf)
@@ -0,0 +1,147 @@
+"""
+Riga di comando per i job di manutenzione dei dati, senza interfaccia Streamlit (es. da cron).
+
+Uso:
+    python cli.py sync-prices
+    python cli.py snapshot [--date AAAA-MM-GG]
+    python cli.py backfill-networth [--start AAAA-MM-GG] [--end AAAA-MM-GG] [--freq ME] [--overwrite]
+    python cli.py refresh-allocations [--isin ISIN ...] [--older-than-days N]
+    python cli.py scheduler [--once]
+
+Va lanciato dalla cartella del progetto, così legge gli stessi .streamlit/secrets.toml dell'app
+(oppure con PORTFOLIO_DB_BACKEND=sqlite per il database locale).
+I log sono una riga JSON per evento su stderr (--log-format text per leggerli a occhio).
+
+Il comando scheduler esegue i job pianificati agli orari di services/scheduler.py, come processo
+a parte rispetto all'app (--once: esegue i job dovuti ed esce, adatto a un cron ogni pochi minuti).
+
+Codici di uscita: 0 completato, 1 fallito, 3 completato in parte (alcuni elementi non riusciti).
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_PARTIAL = 3
+EXIT_CODES = {'ok': EXIT_OK, 'partial': EXIT_PARTIAL, 'failed': EXIT_FAILED}
+
+
+class JsonFormatter(logging.Formatter):
+    """Una riga JSON per record: istante, livello, job, evento, messaggio e campi strutturati."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'job': getattr(record, 'job', None),
+            'event': getattr(record, 'event', None),
+            'message': record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(log_format: str = 'json', verbose: bool = False) -> logging.Logger:
+    """Configura il logger dei job su stderr e zittisce gli avvisi di Streamlit senza runtime."""
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s [%(job)s] %(message)s"))
+    logger = logging.getLogger('portfolio.jobs')
+    logger.handlers[:] = [handler]
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.propagate = False
+    # Senza runtime Streamlit le cache avvisano a ogni chiamata: si tengono solo gli errori.
+    # La configurazione si legge prima, altrimenti alla lettura Streamlit riporterebbe il livello a info.
+    from streamlit import config as streamlit_config, logger as streamlit_logger
+    streamlit_config.get_config_options()
+    streamlit_logger.set_log_level('error')
+    return logger
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Job di manutenzione del portafoglio senza interfaccia.")
+    parser.add_argument('--log-format', choices=['json', 'text'], default='json', help="Formato dei log (default: json)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Registra anche l'avanzamento")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('sync-prices', help="Scarica da Yahoo Finance i prezzi mancanti di tutti gli asset mappati")
+
+    p = sub.add_parser('snapshot', help="Salva lo snapshot del patrimonio netto a una data")
+    p.add_argument('--date', help="Data dello snapshot AAAA-MM-GG (default: oggi)")
+
+    p = sub.add_parser('backfill-networth', help="Riempie i buchi dello storico del patrimonio")
+    p.add_argument('--start', help="Prima data AAAA-MM-GG (default: primo movimento)")
+    p.add_argument('--end', help="Ultima data AAAA-MM-GG (default: oggi)")
+    p.add_argument('--freq', default='ME', help="Frequenza delle date in formato pandas (default: ME, fine mese)")
+    p.add_argument('--overwrite', action='store_true', help="Ricalcola anche le date già presenti")
+
+    p = sub.add_parser('refresh-allocations', help="Riscarica da JustETF l'allocazione degli asset posseduti")
+    p.add_argument('--isin', action='append', help="Limita agli ISIN indicati (ripetibile)")
+    p.add_argument('--older-than-days', type=int, help="Salta le allocazioni aggiornate da meno di N giorni")
+
+    p = sub.add_parser('scheduler', help="Esegue i job pianificati (prezzi, snapshot, allocazioni) agli orari previsti")
+    p.add_argument('--once', action='store_true', help="Esegue solo i job dovuti ora ed esce")
+    return parser
+
+
+def run_command(args: argparse.Namespace, reporter) -> dict:
+    """Esegue il job richiesto e ne restituisce l'esito."""
+    from services import jobs
+    if args.command == 'scheduler':
+        return run_scheduler(args.once)
+    if args.command == 'sync-prices':
+        return jobs.run_sync_prices(reporter=reporter)
+    if args.command == 'snapshot':
+        return jobs.run_snapshot(args.date, reporter=reporter)
+    if args.command == 'backfill-networth':
+        return jobs.run_backfill_networth(args.start, args.end, freq=args.freq, overwrite=args.overwrite, reporter=reporter)
+    return jobs.run_refresh_allocations(args.isin, older_than_days=args.older_than_days, reporter=reporter)
+
+
+def run_scheduler(once: bool) -> dict:
+    """Scheduler come processo a parte; con once l'esito peggiore tra i job eseguiti."""
+    from database.connection import get_db_connection
+    from services.scheduler import Scheduler
+    scheduler = Scheduler(get_db_connection().engine)
+    if not once:
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            pass
+        return {'job': 'scheduler', 'status': 'ok'}
+    results = scheduler.run_pending()
+    statuses = {r['status'] for r in results}
+    status = 'failed' if 'failed' in statuses else 'partial' if 'partial' in statuses else 'ok'
+    return {'job': 'scheduler', 'status': status, 'eseguiti': [r['job'] for r in results]}
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    logger = setup_logging(args.log_format, args.verbose)
+
+    from services.reporting import LogReporter
+    reporter = LogReporter(args.command, logger)
+    t0 = time.perf_counter()
+    try:
+        result = run_command(args, reporter)
+    except Exception as e:
+        logger.exception(f"Job interrotto: {e}", extra={'job': args.command, 'event': 'result',
+                                                       'fields': {'status': 'failed'}})
+        return EXIT_FAILED
+    duration_ms = round((time.perf_counter() - t0) * 1000, 1)
+    fields = {k: v for k, v in result.items() if k != 'job'}
+    logger.info("Job terminato", extra={'job': args.command, 'event': 'result',
+                                        'fields': {**fields, 'durata_ms': duration_ms}})
+    return EXIT_CODES[result['status']]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
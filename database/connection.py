@@ -2,38 +2,140 @@ import streamlit as st
 import pandas as pd
 import json
 import unicodedata
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 from typing import Optional, Dict, Any, Union
+from services.tracing import traced
+from database.query_log import install_query_log
+from database.pool import engine_options, install_pool_metrics, keep_warm
+from database.local_backend import (
+    JSON_COLUMNS, resolve_backend, local_db_path, install_sqlite_pragmas, create_local_schema,
+    mirror_enabled, mirror_db_path,
+)
+from database.mirror import LocalMirror, MIRROR_TABLES
 
-# --- CONNESSIONE AL DATABASE (NEON/POSTGRESQL) ---
+
+def _database_secrets() -> dict:
+    """Sezione [database] dei secrets (backend e percorso del file locale), vuota se assente."""
+    try:
+        return dict(st.secrets.get("database", {}))
+    except Exception:
+        return {}
+
+
+def get_backend() -> str:
+    """Backend configurato: 'postgresql' (Neon, predefinito) o 'sqlite' (file locale)."""
+    return resolve_backend(_database_secrets().get("backend"))
+
+
+# --- CONNESSIONE AL DATABASE (NEON/POSTGRESQL O SQLITE LOCALE) ---
 @st.cache_resource
 def get_db_connection():
     """
-    Stabilisce la connessione al DB usando i secrets di Streamlit.
-    Restituisce un oggetto connessione SQL di Streamlit.
+    Stabilisce la connessione al DB del backend configurato.
+    Restituisce un oggetto connessione SQL di Streamlit (stessa interfaccia per entrambi i backend).
+    Su Postgres il pool usa le opzioni per Neon di database/pool.py (sovrascrivibili con
+    create_engine_kwargs nei secrets); su SQLite lo schema viene creato al primo avvio.
+    Sull'engine vengono installati gli hook del log delle query e delle latenze.
+    """
+    if get_backend() == 'sqlite':
+        path = local_db_path(_database_secrets().get("path"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = st.connection("local", type="sql", url=f"sqlite:///{path}")
+        install_sqlite_pragmas(conn.engine)
+        create_local_schema(conn.engine)
+    else:
+        try:
+            secrets_kwargs = st.secrets["connections"]["postgresql"].get("create_engine_kwargs", {})
+        except Exception:
+            secrets_kwargs = {}
+        conn = st.connection("postgresql", type="sql", **engine_options(dict(secrets_kwargs)))
+    install_query_log(conn.engine)
+    install_pool_metrics(conn.engine)
+    return conn
+
+@st.cache_resource
+def get_mirror() -> Optional[LocalMirror]:
+    """
+    Mirror locale in lettura delle tabelle di Postgres (database/mirror.py), se attivato con
+    PORTFOLIO_DB_MIRROR=1 o [database] mirror = true. None con il backend SQLite, già locale.
+    """
+    config = _database_secrets()
+    if get_backend() != 'postgresql' or not mirror_enabled(config.get("mirror")):
+        return None
+    return LocalMirror(mirror_db_path(config.get("mirror_path")), get_db_connection().engine,
+                       on_change=_clear_table_cache)
+
+
+def _clear_table_cache(table_name: str) -> None:
+    """
+    Svuota le letture in cache della sola tabella aggiornata da una sincronizzazione in
+    background del mirror: senza, le righe nuove resterebbero invisibili fino al TTL di 600 s.
+    """
+    from database.data_context import load_table
+    get_data.clear(table_name)
+    load_table.clear(table_name)
+
+
+def invalidate_tables(*table_names: str, incremental: bool = False) -> None:
+    """
+    Da chiamare dopo ogni scrittura: svuota la cache di TUTTE le funzioni @st.cache_data
+    e segna le tabelle scritte come da riallineare nel mirror locale. Con incremental=True
+    (la scrittura ha solo inserito righe o aggiornato il loro high-water mark) il mirror
+    scarica solo le righe nuove invece di ricaricare l'intera tabella.
     """
-    return st.connection("postgresql", type="sql")
+    st.cache_data.clear()
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.mark_stale(*table_names, incremental=incremental)
+
+
+def warm_up_connection() -> None:
+    """
+    Segna l'attività a ogni rerun e tiene calda la connessione al DB in background
+    (database/pool.py, keep_warm): finché l'app è in uso il compute Neon resta sveglio e il
+    pool ha sempre una connessione pronta, anche quando la cache dei dati è scaduta.
+    """
+    try:
+        keep_warm(get_db_connection().engine)
+    except Exception:
+        # DB non configurato: le pagine mostrano già i propri messaggi quando leggono i dati
+        pass
 
 # --- LETTURA DATI (CON CACHE STRUTTURALE) ---
 @st.cache_data(ttl=600)
+@traced('db')
 def get_data(table_name: str) -> pd.DataFrame:
     """
     Legge un'intera tabella dal database e restituisce un DataFrame.
     Converte automaticamente le colonne 'date' in datetime.
+    Con il mirror attivo la tabella si legge dalla copia locale, sincronizzata con Postgres.
+    Su SQLite le colonne JSON arrivano come testo e vengono decodificate in dizionari,
+    come fa psycopg2 con JSONB.
     """
-    conn = get_db_connection()
     try:
-        # ttl=0 forza sempre una query fresca; la cache è gestita
-        # dal decoratore esterno @st.cache_data(ttl=600)
-        df = conn.query(f'SELECT * FROM "{table_name}";', ttl=0)
+        mirror = get_mirror()
+        if mirror is not None and table_name in MIRROR_TABLES:
+            df = mirror.read(table_name)
+            json_as_text = True
+        else:
+            conn = get_db_connection()
+            # ttl=0 forza sempre una query fresca; la cache è gestita
+            # dal decoratore esterno @st.cache_data(ttl=600)
+            df = conn.query(f'SELECT * FROM "{table_name}";', ttl=0)
+            json_as_text = conn.engine.dialect.name == 'sqlite'
         if not df.empty and 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'])
+            df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+        if json_as_text:
+            for col in JSON_COLUMNS:
+                if col in df.columns:
+                    df[col] = df[col].map(lambda v: json.loads(v) if isinstance(v, str) and v else {})
         return df
     except Exception:
         return pd.DataFrame()
 
 # --- SALVATAGGIO DATI ---
-def save_data(df: pd.DataFrame, table_name: str, method: str = 'replace') -> None:
+@traced('db')
+def save_data(df: pd.DataFrame, table_name: str, method: str = 'replace') -> bool:
     """
     Salva un DataFrame in una tabella e pulisce la cache globale.
     
@@ -41,23 +143,41 @@ def save_data(df: pd.DataFrame, table_name: str, method: str = 'replace') -> Non
         df: DataFrame da salvare.
         table_name: Nome della tabella target.
         method: 'replace' o 'append'. Default 'replace'.
+
+    Returns:
+        True se il salvataggio è riuscito (False anche con DataFrame vuoto).
     """
     if df.empty:
-        return
+        return False
 
     conn = get_db_connection()
     try:
         # Assicura che le date siano datetime corretti
         if 'date' in df.columns:
             df['date'] = pd.to_datetime(df['date'])
-            
-        df.to_sql(name=table_name, con=conn.engine, if_exists=method, index=False)
+
+        out = df
+        if conn.engine.dialect.name == 'sqlite' and 'date' in df.columns:
+            # Stesso formato 'AAAA-MM-GG' delle scritture SQL dirette, così le chiavi sulle date coincidono
+            out = df.assign(date=df['date'].dt.date)
+        out.to_sql(name=table_name, con=conn.engine, if_exists=method, index=False)
         
-        # Pulisce la cache di TUTTE le funzioni @st.cache_data.
-        st.cache_data.clear()
+        # Pulisce la cache di TUTTE le funzioni @st.cache_data (e riallinea il mirror).
+        invalidate_tables(table_name, incremental=method == 'append')
+        mirror = get_mirror()
+        if method == 'replace' and mirror is not None:
+            # La tabella intera è già qui: la si copia nel mirror invece di riscaricarla
+            try:
+                mirror.apply_replace(table_name, df)
+            except Exception:
+                # Resta marcata da ricaricare: la lettura successiva la riscarica da Postgres
+                pass
+        return True
     except Exception as e:
         st.error(f"Errore durante il salvataggio della tabella '{table_name}': {e}")
+        return False
 
+@traced('db')
 def insert_single_mapping(isin: str, ticker: str, category: str, proxy_ticker: Optional[str] = None) -> Optional[int]:
     """
     Inserisce una singola riga nella tabella mapping usando SQL diretto.
@@ -81,13 +201,24 @@ def insert_single_mapping(isin: str, ticker: str, category: str, proxy_ticker: O
             )
             row = result.fetchone()
             s.commit()
-        st.cache_data.clear()
+        invalidate_tables('mapping')
         return row[0] if row else None
     except Exception as e:
         st.error(f"Errore inserimento mappatura per ISIN={isin}: {e}")
         return None
 
 
+def _with_sql_date(params: dict) -> dict:
+    """
+    Porta il campo 'date' a datetime.date: Postgres lo converte comunque in DATE, mentre SQLite
+    salverebbe un Timestamp come 'AAAA-MM-GG HH:MM:SS', diverso dalle altre date della tabella.
+    """
+    if params.get('date') is None:
+        return params
+    return {**params, 'date': pd.Timestamp(params['date']).date()}
+
+
+@traced('db')
 def insert_single_transaction(tx_dict: dict) -> bool:
     """
     Inserisce una singola transazione con SQL diretto.
@@ -102,16 +233,77 @@ def insert_single_transaction(tx_dict: dict) -> bool:
                     "VALUES (:id, :date, :product, :isin, :quantity, :local_value, :fees, :currency) "
                     "ON CONFLICT (id) DO NOTHING"
                 ),
-                tx_dict,
+                _with_sql_date(tx_dict),
             )
             s.commit()
-        st.cache_data.clear()
+        invalidate_tables('transactions', incremental=True)
         return True
     except Exception as e:
         st.error(f"Errore inserimento transazione: {e}")
         return False
 
 
+TRANSACTION_COLUMNS = ['id', 'date', 'product', 'isin', 'quantity', 'local_value', 'fees', 'currency']
+
+
+@traced('db')
+def import_transactions_staged(df: pd.DataFrame) -> Optional[list]:
+    """
+    Importa in blocco le transazioni passando da una tabella temporanea di staging.
+    Il confronto con gli ID già presenti avviene nel database (ON CONFLICT DO NOTHING),
+    quindi il client non deve scaricare lo storico per deduplicare.
+    Ritorna la lista degli ID effettivamente inseriti, o None in caso di errore.
+    """
+    if df.empty:
+        return []
+    rows = df[TRANSACTION_COLUMNS].copy()
+    rows['date'] = pd.to_datetime(rows['date']).dt.date
+    records = rows.astype(object).where(rows.notna(), None).to_dict('records')
+
+    cols = ", ".join(TRANSACTION_COLUMNS)
+    conn = get_db_connection()
+    try:
+        is_postgres = conn.engine.dialect.name == 'postgresql'
+        with conn.session as s:
+            if is_postgres:
+                # La tabella temporanea vive solo nella transazione corrente
+                s.execute(text(
+                    "CREATE TEMP TABLE transactions_staging "
+                    "(LIKE transactions INCLUDING DEFAULTS) ON COMMIT DROP"
+                ))
+            else:
+                # SQLite non ha ON COMMIT DROP: la tabella si svuota/ricrea a ogni import
+                s.execute(text("DROP TABLE IF EXISTS temp.transactions_staging"))
+                s.execute(text("CREATE TEMP TABLE transactions_staging AS SELECT * FROM transactions WHERE 0"))
+            s.execute(
+                text(
+                    f"INSERT INTO transactions_staging ({cols}) "
+                    "VALUES (:id, :date, :product, :isin, :quantity, :local_value, :fees, :currency)"
+                ),
+                records,
+            )
+            # DISTINCT ON esiste solo in Postgres; SQLite inserisce riga per riga e
+            # ON CONFLICT scarta già i duplicati interni allo staging
+            # (WHERE true evita l'ambiguità tra ON e ON CONFLICT nel parser di SQLite)
+            select_rows = (f"SELECT DISTINCT ON (id) {cols} FROM transactions_staging " if is_postgres
+                           else f"SELECT {cols} FROM transactions_staging WHERE true ")
+            result = s.execute(text(
+                f"INSERT INTO transactions ({cols}) "
+                + select_rows +
+                "ON CONFLICT (id) DO NOTHING "
+                "RETURNING id"
+            ))
+            inserted_ids = [r[0] for r in result.fetchall()]
+            s.commit()
+        if inserted_ids:
+            invalidate_tables('transactions', incremental=True)
+        return inserted_ids
+    except Exception as e:
+        st.error(f"Errore importazione transazioni: {e}")
+        return None
+
+
+@traced('db')
 def update_transaction(tx_id: str, updates: dict) -> bool:
     """
     Aggiorna i campi di una transazione esistente.
@@ -124,17 +316,18 @@ def update_transaction(tx_id: str, updates: dict) -> bool:
     conn = get_db_connection()
     try:
         set_clause = ", ".join(f"{k} = :{k}" for k in updates)
-        params = {**updates, 'tx_id': tx_id}
+        params = {**_with_sql_date(updates), 'tx_id': tx_id}
         with conn.session as s:
             s.execute(text(f"UPDATE transactions SET {set_clause} WHERE id = :tx_id"), params)
             s.commit()
-        st.cache_data.clear()
+        invalidate_tables('transactions')
         return True
     except Exception as e:
         st.error(f"Errore aggiornamento transazione: {e}")
         return False
 
 
+@traced('db')
 def delete_transactions(tx_ids: list) -> int:
     """
     Elimina una o più transazioni per ID.
@@ -147,17 +340,55 @@ def delete_transactions(tx_ids: list) -> int:
     try:
         with conn.session as s:
             result = s.execute(
-                text("DELETE FROM transactions WHERE id = ANY(:ids)"),
+                text("DELETE FROM transactions WHERE id IN :ids").bindparams(bindparam('ids', expanding=True)),
                 {'ids': list(tx_ids)}
             )
             s.commit()
-        st.cache_data.clear()
+        invalidate_tables('transactions')
         return result.rowcount
     except Exception as e:
         st.error(f"Errore eliminazione transazioni: {e}")
         return 0
 
 
+@traced('db')
+def upsert_networth_snapshots(df: pd.DataFrame) -> bool:
+    """
+    Inserisce o aggiorna per data gli snapshot del patrimonio (net_worth, assets_value,
+    liquidity) senza riscrivere lo storico: le altre date e la colonna goal restano intatte,
+    anche se la lettura dello storico fosse fallita.
+    UPDATE + INSERT invece di ON CONFLICT: una tabella riscritta da save_data (pandas) perde
+    la PRIMARY KEY su date, e ON CONFLICT non avrebbe il vincolo su cui appoggiarsi.
+    """
+    if df.empty:
+        return False
+    rows = [
+        _with_sql_date({'date': r['date'], 'net_worth': float(r['net_worth']),
+                        'assets_value': float(r['assets_value']), 'liquidity': float(r['liquidity'])})
+        for r in df.to_dict('records')
+    ]
+    conn = get_db_connection()
+    try:
+        with conn.session as s:
+            for row in rows:
+                updated = s.execute(text(
+                    "UPDATE networth_history SET net_worth = :net_worth, assets_value = :assets_value, "
+                    "liquidity = :liquidity WHERE date = :date"
+                ), row)
+                if updated.rowcount == 0:
+                    s.execute(text(
+                        "INSERT INTO networth_history (date, net_worth, assets_value, liquidity) "
+                        "VALUES (:date, :net_worth, :assets_value, :liquidity)"
+                    ), row)
+            s.commit()
+        invalidate_tables('networth_history')
+        return True
+    except Exception as e:
+        st.error(f"Errore salvataggio snapshot del patrimonio: {e}")
+        return False
+
+
+@traced('db')
 def replace_all_mappings(df: pd.DataFrame) -> bool:
     """
     Aggiorna la tabella mapping usando UPSERT + DELETE degli ISIN rimossi.
@@ -175,8 +406,8 @@ def replace_all_mappings(df: pd.DataFrame) -> bool:
             # 2. Elimina solo le righe il cui ISIN NON è più presente
             if new_isins:
                 s.execute(
-                    text("DELETE FROM mapping WHERE isin NOT IN :isins"),
-                    {'isins': tuple(new_isins)}
+                    text("DELETE FROM mapping WHERE isin NOT IN :isins").bindparams(bindparam('isins', expanding=True)),
+                    {'isins': list(new_isins)}
                 )
             else:
                 s.execute(text("DELETE FROM mapping"))
@@ -203,16 +434,18 @@ def replace_all_mappings(df: pd.DataFrame) -> bool:
                     },
                 )
             s.commit()
-        st.cache_data.clear()
+        invalidate_tables('mapping', 'prices', 'asset_allocation')
         return True
     except Exception as e:
         st.error(f"Errore sostituzione mappatura: {e}")
         return False
 
 
-def save_allocation_json(mapping_id: int, geo_dict: Dict[str, float], sec_dict: Dict[str, float]) -> None:
+@traced('db')
+def save_allocation_json(mapping_id: int, geo_dict: Dict[str, float], sec_dict: Dict[str, float]) -> bool:
     """
     Salva i dizionari di allocazione come JSON nel DB usando INSERT/UPDATE.
+    Ritorna True se il salvataggio è riuscito.
     Normalizza le chiavi in minuscolo per garantire coerenza con COUNTRY_ALIASES_IT.
     Aggiusta automaticamente le percentuali per fare 100% usando la voce "altri".
     """
@@ -277,7 +510,7 @@ def save_allocation_json(mapping_id: int, geo_dict: Dict[str, float], sec_dict:
                 # UPDATE se esiste
                 update_query = text("""
                     UPDATE asset_allocation 
-                    SET geography_json = :g, sector_json = :s, last_updated = NOW()
+                    SET geography_json = :g, sector_json = :s, last_updated = CURRENT_TIMESTAMP
                     WHERE mapping_id = :m
                 """)
                 s.execute(update_query, {'m': mapping_id, 'g': geo_json, 's': sec_json})
@@ -285,12 +518,15 @@ def save_allocation_json(mapping_id: int, geo_dict: Dict[str, float], sec_dict:
                 # INSERT se non esiste
                 insert_query = text("""
                     INSERT INTO asset_allocation (mapping_id, geography_json, sector_json, last_updated)
-                    VALUES (:m, :g, :s, NOW())
+                    VALUES (:m, :g, :s, CURRENT_TIMESTAMP)
                 """)
                 s.execute(insert_query, {'m': mapping_id, 'g': geo_json, 's': sec_json})
             
             s.commit()
         
-        st.cache_data.clear()
+        # Sia l'UPDATE sia l'INSERT portano last_updated al momento attuale: basta l'incrementale
+        invalidate_tables('asset_allocation', incremental=True)
+        return True
     except Exception as e:
-        st.error(f"Errore salvataggio JSON per mapping_id={mapping_id}: {e}")
\ No newline at end of file
+        st.error(f"Errore salvataggio JSON per mapping_id={mapping_id}: {e}")
+        return False
\ No newline at end of file
@@ -0,0 +1,139 @@
+import streamlit as st
+import pandas as pd
+from typing import Callable, Dict, Optional
+
+from database.connection import get_data
+
+# --- SCHEMA DEI TIPI ---
+# Per ogni tabella: stringhe a bassa cardinalità come 'category', chiavi verso la mappatura
+# come int32 e float32 solo dove la precisione basta (prezzi di chiusura, non importi sommati).
+# Le date restano datetime64[ns] a mezzanotte: pandas non ha un'unità giornaliera e le unità
+# più grossolane occupano comunque 8 byte per valore.
+TABLE_SCHEMAS = {
+    'transactions': {'category': ('isin', 'product', 'currency')},
+    'mapping': {'category': ('ticker', 'category'), 'int32': ('id',)},
+    'prices': {'float32': ('close_price',), 'int32': ('mapping_id',)},
+    'budget': {'category': ('type', 'category')},
+    'asset_allocation': {'int32': ('mapping_id',)},
+    'networth_history': {},
+}
+
+
+def normalize_table(table_name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Applica lo schema compatto a una tabella appena letta dal database:
+    date come datetime a mezzanotte, poi category, int32 e float32 secondo TABLE_SCHEMAS.
+    Le chiavi con valori mancanti restano nel tipo originale.
+    """
+    if df.empty:
+        return df
+    schema = TABLE_SCHEMAS.get(table_name, {})
+    df = df.copy()
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.normalize()
+    for col in schema.get('category', ()):
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col in schema.get('int32', ()):
+        if col in df.columns and df[col].notna().all():
+            df[col] = df[col].astype('int32')
+    for col in schema.get('float32', ()):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float32')
+    return df
+
+
+def memory_report(raw_tables: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Confronta l'occupazione in memoria (byte, stringhe incluse) di ogni tabella
+    così come arriva dal database e dopo normalize_table.
+    """
+    rows = []
+    for name, df in raw_tables.items():
+        before = int(df.memory_usage(deep=True).sum())
+        after = int(normalize_table(name, df).memory_usage(deep=True).sum())
+        rows.append({
+            'tabella': name,
+            'righe': len(df),
+            'byte_prima': before,
+            'byte_dopo': after,
+            'riduzione_%': round((1 - after / before) * 100, 1) if before else 0.0,
+        })
+    return pd.DataFrame(rows, columns=['tabella', 'righe', 'byte_prima', 'byte_dopo', 'riduzione_%'])
+
+
+def decode_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Restituisce una copia con le colonne category riportate a object.
+    Serve per st.data_editor e per le manipolazioni di stringhe, che su una category
+    accetterebbero solo i valori già presenti.
+    """
+    df = df.copy()
+    for col in df.select_dtypes(include='category').columns:
+        df[col] = df[col].astype(object)
+    return df
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_table(table_name: str) -> pd.DataFrame:
+    """
+    Legge e normalizza una tabella. La cache vale per versione della tabella:
+    ogni salvataggio nel database svuota st.cache_data e forza una nuova lettura.
+    La lettura salta la cache di get_data, così in memoria resta solo la versione compatta.
+    """
+    read = getattr(get_data, '__wrapped__', get_data)
+    return normalize_table(table_name, read(table_name))
+
+
+class DataContext:
+    """
+    Contesto dati condiviso da una pagina e dai suoi componenti.
+    Ogni tabella viene caricata e normalizzata al più una volta per rerun; i componenti
+    ricevono il contesto invece di interrogare il database per conto proprio.
+    I DataFrame restituiti sono condivisi: chi deve modificarli lavora su una copia.
+    """
+
+    def __init__(self, loader: Optional[Callable[[str], pd.DataFrame]] = None):
+        self._loader = loader or load_table
+        self._frames: Dict[str, pd.DataFrame] = {}
+
+    def table(self, table_name: str, refresh: bool = False) -> pd.DataFrame:
+        """Restituisce la tabella richiesta, caricandola solo al primo accesso (o se refresh=True)."""
+        if refresh or table_name not in self._frames:
+            if refresh:
+                load_table.clear(table_name)
+            self._frames[table_name] = self._loader(table_name)
+        return self._frames[table_name]
+
+    def editable(self, table_name: str) -> pd.DataFrame:
+        """Copia della tabella con le colonne category decodificate, pronta per gli editor."""
+        return decode_categories(self.table(table_name))
+
+    def invalidate(self, *table_names: str) -> None:
+        """Dimentica le tabelle indicate (tutte se non se ne indica nessuna)."""
+        for name in table_names or list(self._frames):
+            self._frames.pop(name, None)
+
+    @property
+    def transactions(self) -> pd.DataFrame:
+        return self.table("transactions")
+
+    @property
+    def mapping(self) -> pd.DataFrame:
+        return self.table("mapping")
+
+    @property
+    def prices(self) -> pd.DataFrame:
+        return self.table("prices")
+
+    @property
+    def budget(self) -> pd.DataFrame:
+        return self.table("budget")
+
+    @property
+    def asset_allocation(self) -> pd.DataFrame:
+        return self.table("asset_allocation")
+
+    @property
+    def networth_history(self) -> pd.DataFrame:
+        return self.table("networth_history")
@@ -0,0 +1,107 @@
+import json
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+# --- STATO DEI JOB PIANIFICATI ---
+# Una riga per job in scheduled_jobs: ultima esecuzione, esito e lock. Il lock si prende con un
+# UPDATE condizionato (atomico sia su Postgres sia su SQLite): se due istanze dell'app provano
+# a lanciare lo stesso job, solo una aggiorna la riga. Il lock ha una scadenza, così un processo
+# terminato a metà job non blocca le esecuzioni successive. Gli istanti sono epoch in secondi.
+# Il lock si prende per un orario previsto (slot): l'UPDATE riesce solo se l'ultima esecuzione
+# registrata è precedente, così due istanze che vedono lo stesso job dovuto lo eseguono una volta.
+# Un'esecuzione fallita non conta come eseguita: lo slot resta da fare e si riprova con attesa
+# crescente (RETRY_AFTER_S, poi il doppio a ogni fallimento), tenendo locked_until nel futuro
+# senza owner. Dopo MAX_ATTEMPTS fallimenti consecutivi lo slot si abbandona e si passa al successivo.
+RETRY_AFTER_S = 900.0
+MAX_ATTEMPTS = 4
+JOBS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS scheduled_jobs (
+        name TEXT PRIMARY KEY,
+        last_run_at DOUBLE PRECISION,
+        last_status TEXT,
+        last_result TEXT,
+        locked_by TEXT,
+        locked_until DOUBLE PRECISION,
+        failures INTEGER DEFAULT 0
+    )
+"""
+
+
+def ensure_jobs_table(engine) -> None:
+    """Crea la tabella scheduled_jobs se manca e aggiunge le colonne nuove (idempotente)."""
+    with engine.begin() as c:
+        c.execute(text(JOBS_TABLE_DDL))
+        if 'failures' not in {col['name'] for col in inspect(c).get_columns('scheduled_jobs')}:
+            c.execute(text("ALTER TABLE scheduled_jobs ADD COLUMN failures INTEGER DEFAULT 0"))
+
+
+def job_times(engine, name: Optional[str] = None) -> Dict[str, Dict[str, Optional[float]]]:
+    """last_run_at e locked_until per job (o per il solo job indicato), per lo scheduler."""
+    where = " WHERE name = :name" if name is not None else ""
+    with engine.connect() as c:
+        rows = c.execute(text(f"SELECT name, last_run_at, locked_until FROM scheduled_jobs{where}"), {'name': name})
+        return {r.name: {'last_run_at': r.last_run_at, 'locked_until': r.locked_until} for r in rows}
+
+
+def acquire_lock(engine, name: str, owner: str, ttl_s: float, slot: Optional[float] = None,
+                 now: Optional[float] = None) -> bool:
+    """
+    Prende il lock del job per ttl_s secondi. Con slot (epoch dell'orario previsto) il lock si
+    ottiene solo se quello slot non è già stato eseguito. False se un'altra istanza tiene il
+    lock, se il job è in attesa di un nuovo tentativo o se lo slot è già stato eseguito.
+    """
+    now = time.time() if now is None else now
+    slot_clause = " AND (last_run_at IS NULL OR last_run_at < :slot)" if slot is not None else ""
+    with engine.begin() as c:
+        c.execute(text("INSERT INTO scheduled_jobs (name) VALUES (:name) ON CONFLICT (name) DO NOTHING"), {'name': name})
+        result = c.execute(
+            text(
+                "UPDATE scheduled_jobs SET locked_by = :owner, locked_until = :until "
+                "WHERE name = :name AND (locked_until IS NULL OR locked_until < :now OR locked_by = :owner)"
+                + slot_clause
+            ),
+            {'name': name, 'owner': owner, 'until': now + ttl_s, 'now': now, 'slot': slot},
+        )
+        return result.rowcount == 1
+
+
+def release_lock(engine, name: str, owner: str, status: str, result: Dict[str, Any], started_at: float,
+                 now: Optional[float] = None) -> Optional[float]:
+    """
+    Registra l'esito dell'esecuzione e rilascia il lock (solo se è ancora di questo owner).
+    last_run_at si aggiorna con esito 'ok' o 'partial', oppure al MAX_ATTEMPTS-esimo fallimento
+    consecutivo (lo slot si abbandona). Negli altri casi restituisce l'istante da cui si può
+    riprovare: RETRY_AFTER_S dopo il primo fallimento, raddoppiato a ogni fallimento successivo.
+    """
+    now = time.time() if now is None else now
+    with engine.begin() as c:
+        failures = c.execute(text("SELECT failures FROM scheduled_jobs WHERE name = :name AND locked_by = :owner"),
+                             {'name': name, 'owner': owner}).scalar()
+        failures = 0 if status in ('ok', 'partial') else (failures or 0) + 1
+        retry_at = None
+        # Al MAX_ATTEMPTS-esimo fallimento lo slot conta come eseguito e il conteggio riparte
+        if 0 < failures < MAX_ATTEMPTS:
+            retry_at = now + RETRY_AFTER_S * 2 ** (failures - 1)
+        last_run = "last_run_at = :started, " if retry_at is None else ""
+        c.execute(
+            text(
+                f"UPDATE scheduled_jobs SET {last_run}last_status = :status, last_result = :result, "
+                "failures = :failures, locked_by = NULL, locked_until = :until "
+                "WHERE name = :name AND locked_by = :owner"
+            ),
+            {'name': name, 'owner': owner, 'status': status, 'started': started_at, 'until': retry_at,
+             'failures': failures if retry_at is not None else 0, 'result': json.dumps(result, ensure_ascii=False, default=str)},
+        )
+    return retry_at
+
+
+def job_states(engine) -> pd.DataFrame:
+    """Stato di tutti i job: ultima esecuzione, esito ed eventuale lock in corso."""
+    with engine.connect() as c:
+        df = pd.read_sql(text("SELECT * FROM scheduled_jobs ORDER BY name"), c)
+    for col in ('last_run_at', 'locked_until'):
+        df[col] = pd.to_datetime(df[col], unit='s', utc=True)
+    return df
@@ -0,0 +1,148 @@
+import os
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import event
+
+from database.job_store import JOBS_TABLE_DDL
+
+# --- BACKEND LOCALE (SQLITE) ---
+# Alternativa embedded a Neon per lavorare offline, per i benchmark e come replica locale:
+# stesso schema di database_schema.sql tradotto nei tipi di SQLite (SERIAL → INTEGER PRIMARY KEY
+# AUTOINCREMENT, JSONB → TEXT con il JSON serializzato, DATE → TEXT ISO 'AAAA-MM-GG').
+# Si attiva con PORTFOLIO_DB_BACKEND=sqlite oppure con [database] backend = "sqlite" nei secrets.
+BACKEND_ENV = 'PORTFOLIO_DB_BACKEND'
+PATH_ENV = 'PORTFOLIO_DB_PATH'
+BACKENDS = ('postgresql', 'sqlite')
+DEFAULT_LOCAL_PATH = Path(__file__).resolve().parent.parent / 'data' / 'portfolio.db'
+# Mirror in lettura delle tabelle di Postgres (database/mirror.py): PORTFOLIO_DB_MIRROR=1
+# oppure [database] mirror = true nei secrets
+MIRROR_ENV = 'PORTFOLIO_DB_MIRROR'
+MIRROR_PATH_ENV = 'PORTFOLIO_MIRROR_PATH'
+DEFAULT_MIRROR_PATH = DEFAULT_LOCAL_PATH.with_name('mirror.db')
+
+# Colonne JSONB su Postgres: su SQLite sono testo e vanno decodificate in lettura
+JSON_COLUMNS = ('geography_json', 'sector_json')
+
+LOCAL_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS mapping (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        isin TEXT UNIQUE NOT NULL,
+        ticker TEXT NOT NULL,
+        category TEXT NOT NULL CHECK (category IN ('Azionario', 'Obbligazionario', 'Gold', 'Liquidità')),
+        proxy_ticker TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_mapping_ticker ON mapping(ticker)",
+    """
+    CREATE TABLE IF NOT EXISTS asset_allocation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mapping_id INTEGER NOT NULL UNIQUE REFERENCES mapping(id) ON DELETE CASCADE,
+        geography_json TEXT DEFAULT '{}',
+        sector_json TEXT DEFAULT '{}',
+        last_updated TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id TEXT PRIMARY KEY,
+        date TEXT NOT NULL,
+        product TEXT NOT NULL,
+        isin TEXT NOT NULL,
+        quantity REAL NOT NULL,
+        local_value REAL NOT NULL,
+        fees REAL DEFAULT 0,
+        currency TEXT DEFAULT 'EUR'
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_isin ON transactions(isin)",
+    """
+    CREATE TABLE IF NOT EXISTS prices (
+        mapping_id INTEGER NOT NULL REFERENCES mapping(id) ON DELETE CASCADE,
+        date TEXT NOT NULL,
+        close_price REAL NOT NULL CHECK (close_price >= 0),
+        PRIMARY KEY (mapping_id, date)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_prices_date ON prices(date)",
+    """
+    CREATE TABLE IF NOT EXISTS networth_history (
+        date TEXT PRIMARY KEY,
+        net_worth REAL CHECK (net_worth >= 0),
+        assets_value REAL CHECK (assets_value >= 0),
+        liquidity REAL,
+        goal REAL CHECK (goal >= 0)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS budget (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        type TEXT NOT NULL CHECK (type IN ('Entrata', 'Uscita')),
+        category TEXT NOT NULL,
+        amount REAL NOT NULL CHECK (amount >= 0),
+        note TEXT DEFAULT ''
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_budget_date ON budget(date)",
+    "CREATE INDEX IF NOT EXISTS idx_budget_type ON budget(type)",
+    "CREATE INDEX IF NOT EXISTS idx_budget_category ON budget(category)",
+    """
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+    JOBS_TABLE_DDL,
+]
+
+
+def resolve_backend(secrets_backend: Optional[str] = None) -> str:
+    """Backend scelto: variabile d'ambiente, poi secrets, altrimenti Postgres."""
+    backend = (os.environ.get(BACKEND_ENV) or secrets_backend or 'postgresql').strip().lower()
+    if backend in ('postgres', 'neon'):
+        backend = 'postgresql'
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend database non supportato: '{backend}' (valori ammessi: {', '.join(BACKENDS)})")
+    return backend
+
+
+def local_db_path(secrets_path: Optional[str] = None) -> Path:
+    """Percorso del file SQLite: variabile d'ambiente, poi secrets, altrimenti data/portfolio.db."""
+    return Path(os.environ.get(PATH_ENV) or secrets_path or DEFAULT_LOCAL_PATH)
+
+
+def mirror_enabled(secrets_value=None) -> bool:
+    """Mirror attivo: variabile d'ambiente, poi secrets (disattivo se non configurato)."""
+    value = os.environ.get(MIRROR_ENV)
+    if value is None:
+        value = secrets_value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def mirror_db_path(secrets_path: Optional[str] = None) -> Path:
+    """Percorso del file del mirror: variabile d'ambiente, poi secrets, altrimenti data/mirror.db."""
+    return Path(os.environ.get(MIRROR_PATH_ENV) or secrets_path or DEFAULT_MIRROR_PATH)
+
+
+def install_sqlite_pragmas(engine) -> None:
+    """
+    Su ogni nuova connessione attiva le foreign key (servono per ON DELETE CASCADE),
+    il journal WAL (letture concorrenti durante le scritture) e synchronous=NORMAL.
+    """
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute("PRAGMA synchronous = NORMAL")
+        cursor.close()
+
+
+def create_local_schema(engine) -> None:
+    """Crea tabelle e indici mancanti (idempotente, come database_schema.sql)."""
+    with engine.connect().execution_options(skip_query_log=True) as c, c.begin():
+        for statement in LOCAL_SCHEMA:
+            c.exec_driver_sql(statement)
@@ -0,0 +1,247 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import create_engine, event, text
+
+from services.tracing import span
+from database.local_backend import JSON_COLUMNS
+
+# --- MIRROR LOCALE DELLE TABELLE (REPLICA IN LETTURA) ---
+# Ogni tabella di Postgres ha una copia in un file SQLite locale da cui get_data legge.
+# La sincronizzazione scarica solo le righe con la colonna di high-water mark (la data per
+# prezzi e transazioni, last_updated per l'allocazione) >= all'ultimo valore visto; se dopo
+# l'aggiornamento il numero di righe non coincide con Postgres (cancellazioni, inserimenti
+# retrodatati) la tabella viene ricaricata per intero. Le tabelle piccole senza una colonna
+# affidabile (mapping, budget, storico patrimonio) si ricaricano sempre per intero.
+# Le scritture vanno su Postgres e aggiornano il mirror: un salvataggio che sostituisce la tabella
+# intera (save_data) copia le stesse righe anche in locale, senza riscaricarle; le altre scritture
+# marcano la tabella come da riallineare prima della lettura successiva, per intero (modifiche e
+# cancellazioni) o in modo incrementale (solo inserimenti, verificati dal conteggio delle righe).
+MIRROR_TABLES: Dict[str, Dict[str, Any]] = {
+    'prices': {'high_water': 'date', 'key': ['mapping_id', 'date']},
+    'transactions': {'high_water': 'date', 'key': ['id']},
+    'asset_allocation': {'high_water': 'last_updated', 'key': ['mapping_id']},
+    'mapping': {},
+    'budget': {},
+    'networth_history': {},
+}
+# Intervallo minimo tra due sincronizzazioni della stessa tabella, in secondi
+SYNC_INTERVAL_S = {'incremental': 60.0, 'full': 600.0}
+# Valori di _mirror_state.stale: da ricaricare per intero o da allineare dal high-water mark
+STALE_FULL = 1
+STALE_INCREMENTAL = 2
+
+_STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS _mirror_state (
+        table_name TEXT PRIMARY KEY,
+        high_water TEXT,
+        row_count INTEGER,
+        synced_at REAL,
+        stale INTEGER DEFAULT 0,
+        last_error TEXT
+    )
+"""
+
+
+def _to_mirror(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Prepara le righe lette da Postgres per SQLite: date come 'AAAA-MM-GG' (anche se la colonna
+    è diventata TIMESTAMP dopo un replace di pandas), timestamp ISO, JSONB serializzato.
+    """
+    df = df.copy()
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+    if 'last_updated' in df.columns:
+        df['last_updated'] = pd.to_datetime(df['last_updated']).map(lambda v: v.isoformat() if pd.notna(v) else None)
+    for col in JSON_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(lambda v: v if isinstance(v, str) or v is None else json.dumps(v, ensure_ascii=False))
+    return df
+
+
+class LocalMirror:
+    """
+    Replica SQLite delle tabelle di un engine sorgente (Postgres), con high-water mark per tabella.
+    Le letture non aspettano la rete: se la copia locale esiste ma è scaduta, la sincronizzazione
+    parte in background e si restituiscono subito i dati locali.
+    """
+
+    def __init__(self, path: Path, source_engine, on_change: Optional[Callable[[str], None]] = None):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.source = source_engine
+        # Chiamata quando una sincronizzazione in background cambia le righe (per svuotare le cache)
+        self.on_change = on_change
+        self.engine = create_engine(f"sqlite:///{path}")
+        self._lock = threading.Lock()
+        self._running: Dict[str, threading.Thread] = {}
+
+        @event.listens_for(self.engine, 'connect')
+        def _set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+            cursor.close()
+
+        with self.engine.begin() as c:
+            c.exec_driver_sql(_STATE_DDL)
+
+    # --- STATO ---
+    def _state(self, table_name: str) -> Optional[Dict[str, Any]]:
+        with self.engine.connect() as c:
+            row = c.execute(text("SELECT * FROM _mirror_state WHERE table_name = :t"), {'t': table_name}).mappings().fetchone()
+        return dict(row) if row else None
+
+    def _save_state(self, c, table_name: str, **values) -> None:
+        values = {'table_name': table_name, **values}
+        cols = ", ".join(values)
+        updates = ", ".join(f"{k} = excluded.{k}" for k in values if k != 'table_name')
+        c.execute(text(
+            f"INSERT INTO _mirror_state ({cols}) VALUES ({', '.join(':' + k for k in values)}) "
+            f"ON CONFLICT (table_name) DO UPDATE SET {updates}"
+        ), values)
+
+    def mark_stale(self, *table_names: str, incremental: bool = False) -> None:
+        """
+        Segna le tabelle come da riallineare alla prossima lettura (dopo una scrittura).
+        Con incremental=True (la scrittura ha solo inserito righe) basta la sincronizzazione
+        dal high-water mark; altrimenti la tabella si ricarica per intero.
+        """
+        with self.engine.begin() as c:
+            for name in table_names:
+                if name in MIRROR_TABLES:
+                    self._save_state(c, name, stale=STALE_INCREMENTAL if incremental else STALE_FULL)
+
+    def apply_replace(self, table_name: str, df: pd.DataFrame) -> None:
+        """Copia nel mirror la tabella appena riscritta per intero sulla sorgente, senza riscaricarla."""
+        if table_name in MIRROR_TABLES:
+            self._replace_all(table_name, _to_mirror(df), MIRROR_TABLES[table_name].get('high_water'))
+
+    def status(self) -> pd.DataFrame:
+        """High-water mark, righe, età della copia ed eventuale ultimo errore per ogni tabella."""
+        with self.engine.connect() as c:
+            df = pd.read_sql(text("SELECT * FROM _mirror_state ORDER BY table_name"), c)
+        df['età_s'] = (time.time() - df['synced_at']).round(0)
+        return df
+
+    # --- SINCRONIZZAZIONE ---
+    def _is_due(self, table_name: str, state: Dict[str, Any]) -> bool:
+        mode = 'incremental' if MIRROR_TABLES[table_name].get('high_water') else 'full'
+        return time.time() - (state.get('synced_at') or 0) >= SYNC_INTERVAL_S[mode]
+
+    def _replace_all(self, table_name: str, df: pd.DataFrame, hw_col: Optional[str]) -> None:
+        with self.engine.begin() as c:
+            df.to_sql(table_name, c, if_exists='replace', index=False)
+            for col in MIRROR_TABLES[table_name].get('key', []):
+                c.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS "idx_{table_name}_{col}" ON "{table_name}" ("{col}")')
+            self._save_state(c, table_name, high_water=df[hw_col].max() if hw_col and not df.empty else None,
+                             row_count=len(df), synced_at=time.time(), stale=0, last_error=None)
+
+    def sync(self, table_name: str, full: bool = False) -> int:
+        """Allinea la copia locale della tabella con la sorgente. Ritorna le righe scaricate."""
+        return self._sync(table_name, full)[0]
+
+    def _sync(self, table_name: str, full: bool = False) -> Tuple[int, bool]:
+        """
+        Sincronizza e restituisce (righe scaricate, righe locali cambiate). Incrementale se c'è
+        un high-water mark e la tabella non è marcata come da ricaricare per intero.
+        """
+        config = MIRROR_TABLES[table_name]
+        hw_col = config.get('high_water')
+        state = self._state(table_name) or {}
+        incremental = bool(hw_col and state.get('high_water') and state.get('stale') != STALE_FULL and not full)
+
+        with span(f"mirror.sync.{table_name}", 'db', incremental=incremental) as record:
+            with self.source.connect() as src:
+                if not incremental:
+                    df = _to_mirror(pd.read_sql(text(f'SELECT * FROM "{table_name}"'), src))
+                    self._replace_all(table_name, df, hw_col)
+                    record['rows_out'] = len(df)
+                    return len(df), True
+
+                # Solo le righe dall'ultimo high-water mark in poi (>= per riprendere gli aggiornamenti dello stesso giorno)
+                high_water = pd.Timestamp(state['high_water'])
+                df = _to_mirror(pd.read_sql(
+                    text(f'SELECT * FROM "{table_name}" WHERE "{hw_col}" >= :hw'), src,
+                    params={'hw': high_water.date() if hw_col == 'date' else high_water.to_pydatetime()},
+                ))
+                remote_count = src.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
+
+            keys = config['key']
+            # Le righe locali dal vecchio high-water mark in poi, prima e dopo l'aggiornamento,
+            # dicono se è cambiato qualcosa (letture entrambe da SQLite, quindi confrontabili)
+            tail_sql = text(f'SELECT * FROM "{table_name}" WHERE "{hw_col}" >= :hw ORDER BY {", ".join(keys)}')
+            with self.engine.begin() as c:
+                before = pd.read_sql(tail_sql, c, params={'hw': state['high_water']})
+                if not df.empty:
+                    where = " AND ".join(f'"{k}" = :{k}' for k in keys)
+                    c.execute(text(f'DELETE FROM "{table_name}" WHERE {where}'), df[keys].to_dict('records'))
+                    df.to_sql(table_name, c, if_exists='append', index=False)
+                after = pd.read_sql(tail_sql, c, params={'hw': state['high_water']})
+                local_count = c.execute(text(f'SELECT COUNT(*) FROM "{table_name}"')).scalar()
+                new_high_water = max(state['high_water'], df[hw_col].max()) if not df.empty else state['high_water']
+                self._save_state(c, table_name, high_water=new_high_water, row_count=local_count,
+                                 synced_at=time.time(), stale=0, last_error=None)
+            record['rows_out'] = len(df)
+
+        if local_count != remote_count:
+            # Cancellazioni o inserimenti retrodatati non visibili dal high-water mark
+            return self._sync(table_name, full=True)
+        changed = local_count != state.get('row_count') or not before.equals(after)
+        return len(df), changed
+
+    def _sync_safely(self, table_name: str) -> None:
+        try:
+            _, changed = self._sync(table_name)
+            if changed and self.on_change is not None:
+                self.on_change(table_name)
+        except Exception as e:
+            with self.engine.begin() as c:
+                self._save_state(c, table_name, last_error=str(e)[:500])
+        finally:
+            with self._lock:
+                self._running.pop(table_name, None)
+
+    def _sync_in_background(self, table_name: str) -> None:
+        with self._lock:
+            if table_name in self._running:
+                return
+            thread = threading.Thread(target=self._sync_safely, args=(table_name,),
+                                      name=f"mirror-sync-{table_name}", daemon=True)
+            self._running[table_name] = thread
+        thread.start()
+
+    def wait(self, timeout: float = 30.0) -> None:
+        """Attende le sincronizzazioni in background in corso (per script e test)."""
+        with self._lock:
+            threads = list(self._running.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    # --- LETTURA ---
+    def read(self, table_name: str) -> pd.DataFrame:
+        """
+        Legge la tabella dalla copia locale. Alla prima lettura, o dopo una scrittura,
+        la sincronizza prima di leggere; se è solo scaduta la aggiorna in background.
+        Se Postgres non risponde si servono i dati locali già presenti.
+        """
+        state = self._state(table_name)
+        if state is None or state.get('synced_at') is None or state.get('stale'):
+            try:
+                self.sync(table_name)
+            except Exception:
+                if state is None or state.get('synced_at') is None:
+                    raise
+                with self.engine.begin() as c:
+                    self._save_state(c, table_name, last_error="sorgente non raggiungibile, dati locali")
+        elif self._is_due(table_name, state):
+            self._sync_in_background(table_name)
+
+        with span(f"mirror.read.{table_name}", 'db'):
+            with self.engine.connect() as c:
+                return pd.read_sql(text(f'SELECT * FROM "{table_name}"'), c)
+
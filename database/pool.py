@@ -0,0 +1,151 @@
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event
+
+# --- POOL DI CONNESSIONI PER NEON (POSTGRES SERVERLESS) ---
+# Neon sospende il compute dopo alcuni minuti di inattività e chiude le connessioni idle:
+# - pool piccolo (l'app è mono-utente) con LIFO, così si riusa sempre la connessione più "calda";
+# - pool_pre_ping scarta le connessioni chiuse dal server invece di restituire un errore alla query;
+# - pool_recycle sotto il timeout idle di Neon, per non tenere connessioni che il server ha già chiuso;
+# - keepalive TCP e connect_timeout espliciti, per fallire presto se il compute non risponde.
+# Le chiavi di create_engine_kwargs nei secrets hanno la precedenza su questi valori.
+ENGINE_OPTIONS: Dict[str, Any] = {
+    'pool_size': 3,
+    'max_overflow': 2,
+    'pool_timeout': 10,
+    'pool_pre_ping': True,
+    'pool_recycle': 240,
+    'pool_use_lifo': True,
+    'connect_args': {
+        'connect_timeout': 10,
+        'keepalives': 1,
+        'keepalives_idle': 30,
+        'keepalives_interval': 10,
+        'keepalives_count': 3,
+    },
+}
+
+_lock = threading.Lock()
+_metrics: Dict[str, Any] = {
+    'handshakes': 0, 'handshake_total_ms': 0.0, 'handshake_last_ms': None,
+    'checkouts': 0, 'warm_up_ms': None, 'warm_up_error': None, 'warm_up_at': None,
+}
+_handshake_start = threading.local()
+_installed_engines = set()
+
+# Keep-alive mentre l'app è in uso: un ping ogni KEEP_ALIVE_INTERVAL_S tiene sveglio il compute
+# e tiene nel pool una connessione più giovane di pool_recycle, così la prima query di una pagina
+# non paga l'handshake. Si ferma dopo KEEP_ALIVE_IDLE_S senza rerun, per lasciare sospendere Neon.
+KEEP_ALIVE_INTERVAL_S = 60.0
+KEEP_ALIVE_IDLE_S = 1800.0
+_keep_alive_thread = None
+_last_activity = 0.0
+
+
+def engine_options(secrets_kwargs: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Opzioni di create_engine: i valori dei secrets sovrascrivono quelli predefiniti."""
+    options = {**ENGINE_OPTIONS, 'connect_args': dict(ENGINE_OPTIONS['connect_args'])}
+    for key, value in (secrets_kwargs or {}).items():
+        if key == 'connect_args':
+            options['connect_args'].update(value)
+        else:
+            options[key] = value
+    return options
+
+
+def install_pool_metrics(engine) -> None:
+    """Misura la durata dei nuovi handshake (TCP+TLS+autenticazione) e conta i checkout dal pool."""
+    if id(engine) in _installed_engines:
+        return
+    _installed_engines.add(id(engine))
+
+    @event.listens_for(engine, 'do_connect')
+    def _before_connect(dialect, conn_rec, cargs, cparams):
+        _handshake_start.t0 = time.perf_counter()
+
+    @event.listens_for(engine, 'connect')
+    def _after_connect(dbapi_connection, connection_record):
+        connection_record.info['connected_at'] = time.time()
+        t0 = getattr(_handshake_start, 't0', None)
+        if t0 is None:
+            return
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        _handshake_start.t0 = None
+        with _lock:
+            _metrics['handshakes'] += 1
+            _metrics['handshake_total_ms'] += elapsed_ms
+            _metrics['handshake_last_ms'] = elapsed_ms
+
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _lock:
+            _metrics['checkouts'] += 1
+
+
+def _ping(engine, refresh: bool = False) -> None:
+    """
+    Apre (o riattiva) una connessione con SELECT 1 e registra la latenza di acquisizione.
+    Con refresh, una connessione che supererebbe pool_recycle prima del prossimo ping viene
+    sostituita subito: l'handshake lo paga il ping e non la pagina.
+    """
+    t0 = time.perf_counter()
+    try:
+        with engine.connect().execution_options(skip_query_log=True) as c:
+            c.exec_driver_sql("SELECT 1")
+            connected_at = c.connection.info.get('connected_at')
+            recycle = getattr(engine.pool, '_recycle', -1)
+            expiring = (refresh and connected_at is not None and recycle > 0
+                        and time.time() - connected_at > recycle - KEEP_ALIVE_INTERVAL_S)
+            if expiring:
+                c.invalidate()
+        if expiring:
+            with engine.connect().execution_options(skip_query_log=True) as c:
+                c.exec_driver_sql("SELECT 1")
+        with _lock:
+            _metrics['warm_up_ms'] = (time.perf_counter() - t0) * 1000
+            _metrics['warm_up_error'] = None
+    except Exception as e:
+        with _lock:
+            _metrics['warm_up_error'] = str(e)
+    finally:
+        with _lock:
+            _metrics['warm_up_at'] = time.time()
+
+
+def _keep_alive_loop(engine) -> None:
+    """Ping subito e poi ogni KEEP_ALIVE_INTERVAL_S, finché l'ultima attività è più recente di KEEP_ALIVE_IDLE_S."""
+    while True:
+        _ping(engine, refresh=True)
+        time.sleep(KEEP_ALIVE_INTERVAL_S)
+        with _lock:
+            idle_s = time.time() - _last_activity
+        if idle_s > KEEP_ALIVE_IDLE_S:
+            return
+
+
+def keep_warm(engine) -> threading.Thread:
+    """
+    Segna l'attività dell'app e, se non è già attivo, avvia il keep-alive in background:
+    un ping subito e poi uno ogni KEEP_ALIVE_INTERVAL_S finché l'app resta in uso.
+    """
+    global _keep_alive_thread, _last_activity
+    with _lock:
+        _last_activity = time.time()
+        if _keep_alive_thread is not None and _keep_alive_thread.is_alive():
+            return _keep_alive_thread
+        _keep_alive_thread = threading.Thread(target=_keep_alive_loop, args=(engine,), name="db-keep-alive", daemon=True)
+        _keep_alive_thread.start()
+        return _keep_alive_thread
+
+
+def pool_status(engine=None) -> Dict[str, Any]:
+    """Stato del pool (se si passa l'engine) e latenze misurate: handshake medio/ultimo e warm-up."""
+    with _lock:
+        status = dict(_metrics)
+    status['handshake_avg_ms'] = (status['handshake_total_ms'] / status['handshakes']) if status['handshakes'] else None
+    if engine is not None and hasattr(engine.pool, 'checkedout'):
+        status['pool_checked_out'] = engine.pool.checkedout()
+        status['pool_idle'] = engine.pool.checkedin()
+    return status
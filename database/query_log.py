@@ -0,0 +1,186 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import event
+
+# --- LOG DELLE QUERY SQL ---
+# Ogni statement eseguito dall'engine viene registrato (testo, forma dei parametri, durata,
+# righe) e aggregato per impronta: lo stesso statement con valori diversi conta come uno solo.
+# Le SELECT più lente della soglia vengono campionate con EXPLAIN (ANALYZE, BUFFERS) in un
+# thread separato, per vedere quali indici di database_schema.sql vengono usati e dove
+# Postgres ricorre a scansioni sequenziali.
+SLOW_QUERY_MS = 200.0
+RECENT_QUERIES = 200
+MAX_STATEMENT_CHARS = 500
+# Intervallo minimo tra due EXPLAIN della stessa impronta
+EXPLAIN_INTERVAL_S = 600.0
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+_recent: deque = deque(maxlen=RECENT_QUERIES)
+_slow: Dict[str, Dict[str, Any]] = {}
+_installed_engines = set()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\?")
+_VALUE_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Impronta di uno statement: letterali e parametri diventano '?', le liste di valori
+    si riducono a '(?, ...)' e gli spazi vengono compattati.
+    """
+    fp = _STRING_LITERAL.sub('?', statement)
+    fp = _PARAMETER.sub('?', fp)
+    fp = _NUMBER_LITERAL.sub('?', fp)
+    fp = _VALUE_LIST.sub('(?, ...)', fp)
+    return _WHITESPACE.sub(' ', fp).strip().rstrip(';').lower()
+
+
+def _parameters_shape(parameters: Any, executemany: bool) -> str:
+    """Descrive i parametri senza registrarne i valori: 'nessuno', 'dict[3]', 'executemany×120[8]'."""
+    if not parameters:
+        return 'nessuno'
+    if executemany:
+        first = parameters[0] if len(parameters) else {}
+        return f"executemany×{len(parameters)}[{len(first)}]"
+    return f"{type(parameters).__name__}[{len(parameters)}]"
+
+
+def _is_read_only(statement: str) -> bool:
+    """Solo le letture si possono ripetere con EXPLAIN ANALYZE (che esegue davvero lo statement)."""
+    head = statement.lstrip().lower()
+    return head.startswith('select') or (head.startswith('with') and not re.search(r'\b(insert|update|delete)\b', head))
+
+
+def _collect_scans(plan: Dict[str, Any], scans: Dict[str, set]) -> None:
+    """Raccoglie ricorsivamente dal piano JSON le tabelle lette in sequenza e gli indici usati."""
+    node = plan.get('Node Type', '')
+    if node == 'Seq Scan':
+        scans['seq'].add(plan.get('Relation Name', '?'))
+    elif 'Index' in node and plan.get('Index Name'):
+        scans['index'].add(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        _collect_scans(child, scans)
+
+
+def _explain(engine, statement: str, parameters: Any, fp: str) -> None:
+    """Esegue EXPLAIN (ANALYZE, BUFFERS) su una connessione separata e salva piano e scansioni."""
+    try:
+        with engine.connect().execution_options(skip_query_log=True) as c:
+            row = c.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters or ()).fetchone()
+            c.rollback()
+        plan = row[0][0] if isinstance(row[0], list) else row[0]
+        scans = {'seq': set(), 'index': set()}
+        _collect_scans(plan.get('Plan', {}), scans)
+        with _lock:
+            _slow[fp].update({
+                'plan': plan,
+                'seq_scans': sorted(scans['seq']),
+                'index_scans': sorted(scans['index']),
+                'execution_ms': plan.get('Execution Time'),
+            })
+    except Exception as e:
+        with _lock:
+            _slow[fp]['explain_error'] = str(e)
+
+
+def _record(engine, statement: str, parameters: Any, executemany: bool, duration_ms: float, rowcount: int) -> None:
+    fp = fingerprint(statement)
+    with _lock:
+        s = _stats.setdefault(fp, {'fingerprint': fp, 'chiamate': 0, 'totale_ms': 0.0, 'max_ms': 0.0, 'righe': 0,
+                                   'esempio': statement[:MAX_STATEMENT_CHARS]})
+        s['chiamate'] += 1
+        s['totale_ms'] += duration_ms
+        s['max_ms'] = max(s['max_ms'], duration_ms)
+        s['righe'] += max(rowcount, 0)
+        _recent.append({
+            'ts': time.time(), 'statement': statement[:MAX_STATEMENT_CHARS],
+            'parametri': _parameters_shape(parameters, executemany),
+            'durata_ms': round(duration_ms, 2), 'righe': rowcount, 'fingerprint': fp,
+        })
+        if duration_ms < SLOW_QUERY_MS:
+            return
+        slow = _slow.setdefault(fp, {'fingerprint': fp, 'statement': statement[:MAX_STATEMENT_CHARS], 'explained_at': 0.0})
+        slow['durata_ms'] = round(duration_ms, 2)
+        should_explain = (
+            engine.dialect.name == 'postgresql' and not executemany and _is_read_only(statement)
+            and time.time() - slow['explained_at'] > EXPLAIN_INTERVAL_S
+        )
+        if should_explain:
+            slow['explained_at'] = time.time()
+    if should_explain:
+        threading.Thread(target=_explain, args=(engine, statement, parameters, fp), daemon=True).start()
+
+
+def install_query_log(engine) -> None:
+    """Collega gli hook di SQLAlchemy all'engine (una sola volta per engine)."""
+    if id(engine) in _installed_engines:
+        return
+    _installed_engines.add(id(engine))
+
+    # L'istante di inizio sta nel contesto dello statement, che muore con lo statement: gli
+    # statement falliti (per cui after_cursor_execute non scatta) non lasciano residui.
+    # Le query interne (EXPLAIN, warm-up, schema) si escludono con
+    # execution_options(skip_query_log=True), che vale solo per quella Connection e non
+    # resta sulla connessione del pool come Connection.info.
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_log_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_log_start', None)
+        if started is None or context.execution_options.get('skip_query_log'):
+            return
+        duration_ms = (time.perf_counter() - started) * 1000
+        _record(engine, statement, parameters, executemany, duration_ms, getattr(cursor, 'rowcount', -1))
+
+
+def query_stats() -> pd.DataFrame:
+    """Statistiche aggregate per impronta, ordinate per tempo totale."""
+    with _lock:
+        rows = [dict(s) for s in _stats.values()]
+    if not rows:
+        return pd.DataFrame(columns=['fingerprint', 'chiamate', 'totale_ms', 'medio_ms', 'max_ms', 'righe', 'esempio'])
+    df = pd.DataFrame(rows)
+    df['medio_ms'] = df['totale_ms'] / df['chiamate']
+    cols = ['fingerprint', 'chiamate', 'totale_ms', 'medio_ms', 'max_ms', 'righe', 'esempio']
+    return df[cols].sort_values('totale_ms', ascending=False).reset_index(drop=True)
+
+
+def recent_queries() -> List[Dict[str, Any]]:
+    """Ultimi statement eseguiti, dal più recente."""
+    with _lock:
+        return list(reversed(_recent))
+
+
+def slow_queries() -> List[Dict[str, Any]]:
+    """Statement oltre la soglia, con il piano EXPLAIN se già campionato."""
+    with _lock:
+        return [dict(s) for s in _slow.values()]
+
+
+def index_usage() -> Dict[str, List[str]]:
+    """Indici usati e tabelle lette in sequenza nei piani campionati finora."""
+    seq, idx = set(), set()
+    for s in slow_queries():
+        seq.update(s.get('seq_scans', []))
+        idx.update(s.get('index_scans', []))
+    return {'index_scans': sorted(idx), 'seq_scans': sorted(seq)}
+
+
+def reset_query_log() -> None:
+    """Svuota statistiche, storico recente e campioni lenti."""
+    with _lock:
+        _stats.clear()
+        _recent.clear()
+        _slow.clear()
@@ -92,6 +92,17 @@ CREATE TABLE IF NOT EXISTS settings (
     value TEXT NOT NULL
 );
 
+-- 8. SCHEDULED_JOBS - Job di manutenzione pianificati
+-- Ultima esecuzione, esito e lock di ogni job (services/scheduler.py); istanti in epoch secondi
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    name TEXT PRIMARY KEY,
+    last_run_at DOUBLE PRECISION,
+    last_status TEXT,
+    last_result TEXT,
+    locked_by TEXT,
+    locked_until DOUBLE PRECISION
+);
+
 -- ========================================================
 -- NOTE IMPORTANTI:
 -- ========================================================
@@ -101,8 +112,10 @@ CREATE TABLE IF NOT EXISTS settings (
 --   • prices.mapping_id → mapping.id (FK con CASCADE)
 --   • asset_allocation.mapping_id → mapping.id (FK con CASCADE, UNIQUE)
 --
--- COLONNE CALCOLATE A RUNTIME (non salvate nel DB):
---   • budget.mese_anno → calcolato come df['date'].dt.strftime('%Y-%m')
+-- DATI CALCOLATI A RUNTIME (non salvati nel DB):
+--   • mese del budget → pd.Period mensile nella colonna 'mese' del cubo (build_budget_cube in budget_service)
+--   • indice per mese del budget → array in memoria di chiavi intere anno*12 + mese-1, una per riga
+--     del budget ordinato per data, non una colonna (index_budget_by_month in budget_service)
 --
 -- FORMATO JSON:
 --   • geography_json: {"italia": 30.5, "usa": 25.0, "altri": 44.5}
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 
-from database.connection import get_data
+from database.data_context import DataContext
 from ui.components import make_sidebar
 from services.asset_service import get_owned_assets, get_asset_kpis, get_asset_allocation_data
 from ui.asset_analysis_components import (
@@ -18,11 +18,9 @@ make_sidebar()
 st.title("🔎 Analisi per Singolo Asset")
 
 # --- 1. CARICAMENTO DATI ---
+ctx = DataContext()
 with st.spinner("Caricamento dati..."):
-    df_trans = get_data("transactions")
-    df_map = get_data("mapping")
-    df_prices = get_data("prices")
-    df_alloc = get_data("asset_allocation")
+    df_trans, df_map, df_prices, df_alloc = ctx.transactions, ctx.mapping, ctx.prices, ctx.asset_allocation
 
 if df_trans.empty or df_map.empty:
     st.warning("⚠️ Dati di transazioni o mappatura mancanti. Vai su 'Gestione Dati' per configurarli.")
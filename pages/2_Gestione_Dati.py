@@ -1,6 +1,6 @@
 import streamlit as st
-from ui.components import make_sidebar
-from database.connection import get_data
+from ui.components import make_sidebar, render_lazy_tabs
+from database.data_context import DataContext
 from ui.data_management_components import (
     render_transactions_tab,
     render_mapping_tab,
@@ -20,34 +20,21 @@ if 'scraped_data' not in st.session_state:
 if 'calculated_snapshot' not in st.session_state:
     st.session_state.calculated_snapshot = None
 
-# Caricamento preliminare per controllo saldo iniziale
-df_budget_check = get_data("budget")
-initial_balance_exists = not df_budget_check.empty and not df_budget_check[df_budget_check['category'] == 'Saldo Iniziale'].empty
-
-# Definizione dei Tab
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "� Transazioni", 
-    "🔗 Mappatura Ticker", 
-    "🔄 Aggiorna Prezzi", 
-    "💸 Movimenti Bilancio", 
-    "🔬 Allocazione Asset (X-Ray)", 
-    "🎯 Patrimonio Netto"
-])
-
-with tab1:
-    render_transactions_tab()
-
-with tab2:
-    render_mapping_tab()
-
-with tab3:
-    render_prices_tab()
-
-with tab4:
-    render_budget_tab(initial_balance_exists)
-
-with tab5:
-    render_allocation_tab()
-
-with tab6:
-    render_net_worth_tab()
\ No newline at end of file
+# Contesto dati condiviso dai tab: ogni tabella viene letta al più una volta per rerun
+ctx = DataContext()
+
+def _render_budget_tab():
+    """Tab bilancio: il controllo del saldo iniziale carica il budget solo quando il tab è aperto."""
+    df_budget_check = ctx.budget
+    initial_balance_exists = not df_budget_check.empty and not df_budget_check[df_budget_check['category'] == 'Saldo Iniziale'].empty
+    render_budget_tab(ctx, initial_balance_exists)
+
+# Definizione dei Tab: viene eseguito (e interroga il database) solo il tab selezionato
+render_lazy_tabs({
+    "� Transazioni": lambda: render_transactions_tab(ctx),
+    "🔗 Mappatura Ticker": lambda: render_mapping_tab(ctx),
+    "🔄 Aggiorna Prezzi": lambda: render_prices_tab(ctx),
+    "💸 Movimenti Bilancio": _render_budget_tab,
+    "🔬 Allocazione Asset (X-Ray)": lambda: render_allocation_tab(ctx),
+    "🎯 Patrimonio Netto": lambda: render_net_worth_tab(ctx),
+}, key="gestione_dati_tab")
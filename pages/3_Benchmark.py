@@ -1,5 +1,5 @@
 import streamlit as st
-from database.connection import get_data
+from database.data_context import DataContext
 from ui.components import make_sidebar
 from services.benchmark_service import run_benchmark_simulation
 from ui.benchmark_components import (
@@ -15,10 +15,9 @@ make_sidebar()
 st.title("⚖️ Sfida il Mercato")
 
 # --- 1. CARICAMENTO DATI ---
+ctx = DataContext()
 with st.spinner("Caricamento dati di portafoglio..."):
-    df_trans = get_data("transactions")
-    df_map = get_data("mapping")
-    df_prices = get_data("prices")
+    df_trans, df_map, df_prices = ctx.transactions, ctx.mapping, ctx.prices
 
 if df_trans.empty or df_map.empty:
     st.warning("⚠️ Dati di transazioni o mappatura mancanti. Vai su 'Gestione Dati' per configurarli.")
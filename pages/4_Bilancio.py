@@ -1,9 +1,12 @@
 import streamlit as st
 import pandas as pd
-from database.connection import get_data
+from database.data_context import DataContext
 from ui.components import make_sidebar
-from services.portfolio_service import calculate_liquidity
-from services.budget_service import get_monthly_summary, get_general_summary, get_category_averages, get_yearly_summary
+from services.portfolio_service import build_liquidity_index, calculate_liquidity
+from services.budget_service import (
+    build_budget_cube, get_cube_month, index_budget_by_month, get_budget_month,
+    get_monthly_summary, get_yearly_and_general_summary, get_category_averages
+)
 from ui.budget_components import (
     # Componenti mensili
     render_month_selector,
@@ -16,6 +19,7 @@ from ui.budget_components import (
     render_budget_rule_check,
     render_expense_breakdown,
     render_investment_trend,
+    render_liquidity_trend,
     # Componenti generali
     render_general_kpis,
     render_income_vs_expense_totals,
@@ -30,20 +34,24 @@ make_sidebar()
 st.title("💰 Bilancio & Patrimonio")
 
 # --- 1. CARICAMENTO DATI ---
+# Il contesto restituisce le tabelle con date già normalizzate a mezzanotte
+ctx = DataContext()
 with st.spinner("Caricamento dati..."):
-    df_budget = get_data("budget")
-    df_trans = get_data("transactions")
-    df_nw = get_data("networth_history")
-
-# Normalizzazione date
-if not df_budget.empty: df_budget['date'] = pd.to_datetime(df_budget['date'], errors='coerce').dt.normalize()
-if not df_trans.empty: df_trans['date'] = pd.to_datetime(df_trans['date'], errors='coerce').dt.normalize()
-if not df_nw.empty: df_nw['date'] = pd.to_datetime(df_nw['date'], errors='coerce').dt.normalize()
+    df_budget = ctx.budget
+    df_trans = ctx.transactions
+    df_nw = ctx.networth_history
 
 if df_budget.empty:
     st.info("👋 Nessun dato di bilancio. Vai su 'Gestione Dati' per inserire entrate e uscite.")
     st.stop()
 
+# Cubo mese × tipo × categoria: unica aggregazione da cui derivano tutti i riepiloghi
+budget_cube = build_budget_cube(df_budget)
+# Budget ordinato per mese: le righe di un mese si estraggono con una ricerca binaria
+budget_sorted, budget_month_keys = index_budget_by_month(df_budget)
+# Saldo di cassa cumulato per data: liquidità a qualsiasi data con una ricerca binaria
+liquidity_index = build_liquidity_index(df_budget)
+
 # --- 2. STRUTTURA A TAB ---
 tab_mensile, tab_generale = st.tabs(["📅 Analisi Mensile", "📊 Panoramica Generale"])
 
@@ -52,21 +60,21 @@ tab_mensile, tab_generale = st.tabs(["📅 Analisi Mensile", "📊 Panoramica Ge
 # =============================================
 with tab_mensile:
     st.subheader("📅 Analisi Mensile")
-    selected_month = render_month_selector(df_budget)
-    df_month = df_budget[df_budget['date'].dt.strftime('%Y-%m') == selected_month]
+    selected_month = render_month_selector(budget_cube)
+    df_month = get_budget_month(budget_sorted, budget_month_keys, selected_month)
     
     # Calcoli
-    summary = get_monthly_summary(selected_month, df_budget, df_trans)
+    summary = get_monthly_summary(selected_month, budget_cube, df_trans)
     final_liquidity, liquidity_help = calculate_liquidity(df_budget, df_trans)
     
     # Rendering
     render_monthly_kpis(summary, final_liquidity, liquidity_help)
-    render_monthly_charts(df_month, summary)
+    render_monthly_charts(get_cube_month(budget_cube, selected_month), summary)
     
     st.divider()
     
     # Verifica regola 50/30/20
-    render_budget_rule_check(df_budget, selected_month)
+    render_budget_rule_check(budget_cube, selected_month)
     
     st.divider()
     
@@ -75,13 +83,13 @@ with tab_mensile:
     col_trend1, col_trend2 = st.columns(2)
     
     with col_trend1:
-        render_expense_trend_chart(df_budget, months=6)
+        render_expense_trend_chart(budget_cube, months=6)
     
     with col_trend2:
-        render_savings_rate_trend(df_budget, months=6)
+        render_savings_rate_trend(budget_cube, months=6)
     
-    render_expense_breakdown(df_budget, months=3)
-    render_investment_trend(df_budget, months=6)
+    render_expense_breakdown(budget_cube, months=3)
+    render_investment_trend(budget_cube, months=6)
     
     st.divider()
     
@@ -92,8 +100,8 @@ with tab_mensile:
 # TAB GENERALE (nuova sezione)
 # =============================================
 with tab_generale:
-    # KPI generali
-    general_summary = get_general_summary(df_budget)
+    # KPI generali e riepilogo annuale (un'unica aggregazione)
+    yearly_summary, general_summary = get_yearly_and_general_summary(budget_cube)
     render_general_kpis(general_summary)
     
     st.divider()
@@ -102,30 +110,34 @@ with tab_generale:
     col_g1, col_g2 = st.columns(2)
     
     with col_g1:
-        render_income_vs_expense_totals(df_budget)
+        render_income_vs_expense_totals(budget_cube)
     
     with col_g2:
-        category_averages = get_category_averages(df_budget)
+        category_averages = get_category_averages(budget_cube)
         render_category_averages_chart(category_averages)
     
     st.divider()
     
     # Regola 50/30/20 generale
-    render_general_50_30_20(df_budget)
+    render_general_50_30_20(budget_cube)
     
     st.divider()
     
     # Riepilogo annuale
-    yearly_summary = get_yearly_summary(df_budget)
     render_yearly_summary_chart(yearly_summary)
     
     st.divider()
     
+    # Saldo di cassa nel tempo
+    render_liquidity_trend(liquidity_index)
+    
+    st.divider()
+    
     # Diagramma Sankey
     st.subheader("🔀 Flusso di Denaro")
     
     # Selettore anno per Sankey
-    anni_disponibili = sorted(df_budget['date'].dt.year.unique(), reverse=True)
+    anni_disponibili = sorted(budget_cube['mese'].dt.year.unique(), reverse=True)
     col_sankey_sel, col_sankey_empty = st.columns([1, 3])
     
     with col_sankey_sel:
@@ -133,9 +145,9 @@ with tab_generale:
         anno_selezionato = st.selectbox("Seleziona periodo:", opzioni_anno)
     
     if anno_selezionato == "Tutto il periodo":
-        render_sankey_flow(df_budget, year=None)
+        render_sankey_flow(budget_cube, year=None)
     else:
-        render_sankey_flow(df_budget, year=int(anno_selezionato))
+        render_sankey_flow(budget_cube, year=int(anno_selezionato))
 
 # =============================================
 # SEZIONE PATRIMONIO NETTO (fuori dai tab)
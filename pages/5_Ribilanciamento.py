@@ -1,5 +1,5 @@
 import streamlit as st
-from database.connection import get_data
+from database.data_context import DataContext
 from services.portfolio_service import calculate_portfolio_view
 from services.rebalancing_service import (
     validate_asset_class_allocation,
@@ -21,9 +21,8 @@ make_sidebar()
 st.title("🔄 Ribilanciamento Portafoglio")
 
 # --- 1. Carica dati attuali ---
-df_trans = get_data("transactions")
-df_map = get_data("mapping")
-df_prices = get_data("prices")
+ctx = DataContext()
+df_trans, df_map, df_prices = ctx.transactions, ctx.mapping, ctx.prices
 
 assets_view = calculate_portfolio_view(df_trans, df_map, df_prices)
 summary = get_portfolio_summary(assets_view)
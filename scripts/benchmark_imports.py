@@ -0,0 +1,78 @@
+"""
+Benchmark del tempo di avvio a freddo delle pagine.
+
+Per ogni pagina (app.py e pages/*.py) esegue, in un interprete Python nuovo, gli import
+di primo livello dello script e misura il tempo impiegato. Riporta anche quali dipendenze
+pesanti risultano caricate, per verificare che scraping, Yahoo Finance e simili restino
+fuori dall'avvio delle pagine che non li usano.
+
+Uso:
+    python scripts/benchmark_imports.py [--runs 5] [--json risultati.json]
+"""
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ['yfinance', 'bs4', 'httpx', 'sklearn', 'pycountry', 'plotly', 'playwright']
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - t0
+heavy = {heavy!r}
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in heavy if m in sys.modules]}}))
+"""
+
+
+def page_scripts() -> list:
+    """Restituisce gli script delle pagine Streamlit nell'ordine della sidebar."""
+    return [ROOT / 'app.py'] + sorted((ROOT / 'pages').glob('*.py'))
+
+
+def top_level_imports(script: Path) -> list:
+    """Estrae le istruzioni di import di primo livello di uno script."""
+    tree = ast.parse(script.read_text(encoding='utf-8'))
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def measure_page(script: Path, runs: int) -> dict:
+    """Misura il tempo di import a freddo di una pagina (mediana su più interpreti nuovi)."""
+    code = _PROBE.format(imports='\n'.join(top_level_imports(script)), heavy=HEAVY_MODULES)
+    samples, loaded = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(result['seconds'])
+        loaded = result['loaded']
+    return {
+        'page': script.name,
+        'median_s': statistics.median(samples),
+        'min_s': min(samples),
+        'loaded': loaded,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tempo di avvio a freddo per pagina.")
+    parser.add_argument('--runs', type=int, default=5, help="Interpreti nuovi per pagina (default: 5)")
+    parser.add_argument('--json', type=Path, help="Salva i risultati in un file JSON")
+    args = parser.parse_args()
+
+    results = [measure_page(script, args.runs) for script in page_scripts()]
+
+    print(f"{'Pagina':<28}{'Mediana (s)':>12}{'Min (s)':>10}  Dipendenze pesanti caricate")
+    for r in results:
+        print(f"{r['page']:<28}{r['median_s']:>12.3f}{r['min_s']:>10.3f}  {', '.join(r['loaded']) or '-'}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Rigenera config/country_iso3.json, l'indice nome paese -> ISO3 usato dalla mappa geografica.
+Da eseguire dopo aver modificato COUNTRY_ALIASES_IT o aggiornato pycountry.
+
+Uso:
+    python scripts/build_country_index.py
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ui.charts import COUNTRY_INDEX_PATH, build_country_iso3_index
+
+
+def main() -> None:
+    index = build_country_iso3_index()
+    COUNTRY_INDEX_PATH.write_text(json.dumps(index, ensure_ascii=False, indent=0), encoding='utf-8')
+    print(f"Salvati {len(index)} nomi in {COUNTRY_INDEX_PATH}")
+
+
+if __name__ == '__main__':
+    main()
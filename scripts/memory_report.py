@@ -0,0 +1,39 @@
+"""
+Report dell'occupazione in memoria delle tabelle del database.
+
+Legge ogni tabella con get_data e confronta i byte occupati (stringhe incluse) prima e dopo
+lo schema compatto di database/data_context.py. Richiede i secrets della connessione
+PostgreSQL, come l'app.
+
+Uso:
+    python scripts/memory_report.py [--json risultati.json]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from database.connection import get_data  # noqa: E402
+from database.data_context import TABLE_SCHEMAS, memory_report  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Byte per tabella prima e dopo lo schema compatto.")
+    parser.add_argument('--json', type=Path, help="Salva il report in un file JSON")
+    args = parser.parse_args()
+
+    report = memory_report({name: get_data(name) for name in TABLE_SCHEMAS})
+
+    print(f"{'Tabella':<20}{'Righe':>10}{'Prima (KB)':>14}{'Dopo (KB)':>12}{'Riduzione':>11}")
+    for r in report.itertuples(index=False):
+        print(f"{r.tabella:<20}{r.righe:>10}{r.byte_prima / 1024:>14.1f}{r.byte_dopo / 1024:>12.1f}{r[4]:>10.1f}%")
+    print(f"{'Totale':<20}{report['righe'].sum():>10}{report['byte_prima'].sum() / 1024:>14.1f}{report['byte_dopo'].sum() / 1024:>12.1f}")
+
+    if args.json:
+        report.to_json(args.json, orient='records', indent=2)
+
+
+if __name__ == '__main__':
+    main()
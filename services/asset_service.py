@@ -1,8 +1,9 @@
 import pandas as pd
 import json
-import yfinance as yf
 from typing import Dict, Any
+from services.tracing import traced, span
 
+@traced('service')
 def get_owned_assets(df_trans: pd.DataFrame, df_map: pd.DataFrame) -> pd.DataFrame:
     """
     Restituisce un DataFrame con gli asset attualmente posseduti (quantità > 0).
@@ -17,12 +18,13 @@ def get_owned_assets(df_trans: pd.DataFrame, df_map: pd.DataFrame) -> pd.DataFra
     if 'mapping_id' not in df_full.columns:
         df_full['mapping_id'] = pd.NA
 
-    holdings = df_full.groupby(['product', 'mapping_id', 'isin']).agg(quantity=('quantity', 'sum')).reset_index()
+    holdings = df_full.groupby(['product', 'mapping_id', 'isin'], observed=True).agg(quantity=('quantity', 'sum')).reset_index()
     owned_assets = holdings[holdings['quantity'] > 0.001].copy()
     # Aggiungi il ticker per visualizzazione
     owned_assets = owned_assets.merge(df_map[['id', 'ticker']], left_on='mapping_id', right_on='id', how='left')
     return owned_assets
 
+@traced('service')
 def get_asset_kpis(mapping_id: int, owned_assets: pd.DataFrame, df_asset_trans: pd.DataFrame, asset_prices: pd.DataFrame, df_map: pd.DataFrame) -> Dict[str, Any]:
     """
     Calcola i KPI principali per un singolo asset.
@@ -42,8 +44,10 @@ def get_asset_kpis(mapping_id: int, owned_assets: pd.DataFrame, df_asset_trans:
     last_price = asset_prices.iloc[-1]['close_price'] if not asset_prices.empty else 0
     if ticker:
         try:
-            # Prova a scaricare il prezzo attuale da Yahoo Finance
-            current_data = yf.Ticker(ticker).history(period='1d')
+            # Prova a scaricare il prezzo attuale da Yahoo Finance (yfinance caricato solo qui)
+            import yfinance as yf
+            with span('yahoo.history', 'network', ticker=ticker):
+                current_data = yf.Ticker(ticker).history(period='1d')
             if not current_data.empty:
                 last_price = current_data['Close'].iloc[-1]
         except Exception:
@@ -63,6 +67,7 @@ def get_asset_kpis(mapping_id: int, owned_assets: pd.DataFrame, df_asset_trans:
         "ticker": ticker
     }
 
+@traced('service')
 def get_asset_allocation_data(mapping_id: int, df_alloc: pd.DataFrame) -> tuple[dict, dict]:
     """
     Estrae e decodifica i dati di allocazione geografica e settoriale per un asset.
@@ -81,10 +86,12 @@ def get_asset_allocation_data(mapping_id: int, df_alloc: pd.DataFrame) -> tuple[
             pass
     return geo_data, sec_data
 
+@traced('network', name='yahoo.current_price')
 def get_current_price(ticker: str) -> float:
     """
     Scarica il prezzo attuale di un ticker da Yahoo Finance.
     """
+    import yfinance as yf
     try:
         data = yf.Ticker(ticker).history(period='1d')
         if not data.empty:
@@ -1,15 +1,18 @@
 import streamlit as st
 import pandas as pd
-import yfinance as yf
 from typing import Tuple, Dict, Optional
+from services.tracing import traced, span
+from services.http_client import map_blocking
 
 @st.cache_data(show_spinner=False)
+@traced('service')
 def run_benchmark_simulation(bench_ticker: str, df_trans: pd.DataFrame, df_map: pd.DataFrame, df_prices: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Esegue la simulazione shadow del portafoglio contro un benchmark.
     Restituisce un DataFrame per i grafici e un DataFrame per il log delle transazioni.
     Lancia un'eccezione in caso di errore nel download dei dati.
     """
+    import yfinance as yf
     df_trans['date'] = pd.to_datetime(df_trans['date'], errors='coerce').dt.normalize()
     if not df_prices.empty:
         df_prices['date'] = pd.to_datetime(df_prices['date'], errors='coerce').dt.normalize()
@@ -22,8 +25,27 @@ def run_benchmark_simulation(bench_ticker: str, df_trans: pd.DataFrame, df_map:
     if end_date <= start_date:
         end_date = start_date + pd.Timedelta(days=1)
 
+    currency_map = {'TO': 'CAD', 'MI': 'EUR', 'DE': 'EUR', 'L': 'GBP', 'AS': 'AUD'}
+    bench_currency = 'EUR'
+    for suffix, curr in currency_map.items():
+        if bench_ticker.endswith(suffix):
+            bench_currency = curr
+            break
+    pair = f"EUR{bench_currency}=X" if bench_currency != 'EUR' else None
+
+    def _download(ticker):
+        with span('yahoo.download', 'network', ticker=ticker) as yahoo_span:
+            hist = yf.download(ticker, start=start_date, end=end_date, progress=False)
+            yahoo_span['rows_out'] = len(hist)
+        return hist
+
     try:
-        bench_hist = yf.download(bench_ticker, start=start_date, end=end_date, progress=False)
+        # Benchmark e cambio si scaricano in parallelo: la valuta dipende solo dal suffisso del ticker
+        downloads = dict(map_blocking(_download, [t for t in (bench_ticker, pair) if t]))
+        for t in (bench_ticker, pair):
+            if isinstance(downloads.get(t), Exception):
+                raise downloads[t]
+        bench_hist = downloads[bench_ticker]
         if bench_hist.empty:
             raise ValueError(f"Nessun dato storico trovato per il ticker '{bench_ticker}'.")
         
@@ -32,17 +54,9 @@ def run_benchmark_simulation(bench_ticker: str, df_trans: pd.DataFrame, df_map:
         full_idx = pd.date_range(start=bench_hist.index.min(), end=bench_hist.index.max(), freq='D')
         bench_hist = bench_hist.reindex(full_idx).ffill()
         
-        currency_map = {'TO': 'CAD', 'MI': 'EUR', 'DE': 'EUR', 'L': 'GBP', 'AS': 'AUD'}
-        bench_currency = 'EUR'
-        for suffix, curr in currency_map.items():
-            if bench_ticker.endswith(suffix):
-                bench_currency = curr
-                break
-        
         fx_hist = None
-        if bench_currency != 'EUR':
-            pair = f"EUR{bench_currency}=X"
-            fx_hist_raw = yf.download(pair, start=start_date, end=end_date, progress=False)
+        if pair:
+            fx_hist_raw = downloads[pair]
             if not fx_hist_raw.empty:
                 fx_hist = fx_hist_raw[['Close']].iloc[:, 0]
                 fx_hist.index = pd.to_datetime(fx_hist.index).normalize()
@@ -56,7 +70,7 @@ def run_benchmark_simulation(bench_ticker: str, df_trans: pd.DataFrame, df_map:
     pivot_user = pd.DataFrame()
     if not df_prices.empty:
         df_prices_with_ticker = df_prices.merge(df_map[['id', 'ticker']], left_on='mapping_id', right_on='id', how='left')
-        pivot_user = df_prices_with_ticker.pivot_table(index='date', columns='ticker', values='close_price', aggfunc='last').sort_index().ffill()
+        pivot_user = df_prices_with_ticker.pivot_table(index='date', columns='ticker', values='close_price', aggfunc='last', observed=True).sort_index().ffill()
     
     trans_grouped = df_full.groupby('date')
     user_qty, bench_qty = {}, 0.0
@@ -1,23 +1,114 @@
+import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from statistics import NormalDist
 from typing import Dict, Tuple
+from services.tracing import traced
 
-def get_monthly_summary(selected_month: str, df_budget: pd.DataFrame, df_trans: pd.DataFrame = None) -> Dict[str, float]:
+BUDGET_CUBE_COLUMNS = ['mese', 'type', 'category', 'amount']
+
+
+@st.cache_data(show_spinner=False)
+@traced('service')
+def build_budget_cube(df_budget: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggrega il budget in un cubo mese × tipo × categoria con una sola groupby.
+    La cache è legata al contenuto del budget: il cubo si ricalcola solo quando i dati cambiano.
+    Tutti i riepiloghi e i grafici della pagina Bilancio sono fette di questo cubo.
+    """
+    if df_budget.empty:
+        return pd.DataFrame({
+            'mese': pd.PeriodIndex([], freq='M'),
+            'type': pd.Series(dtype=object),
+            'category': pd.Series(dtype=object),
+            'amount': pd.Series(dtype=float),
+        })
+    mese = pd.to_datetime(df_budget['date']).dt.to_period('M').rename('mese')
+    cube = df_budget.groupby([mese, 'type', 'category'], observed=True)['amount'].sum().reset_index()
+    return cube[BUDGET_CUBE_COLUMNS].sort_values(['mese', 'type', 'category']).reset_index(drop=True)
+
+
+def _month_key(year, month):
+    """Chiave intera del mese (anno*12 + mese-1): ordinabile e confrontabile senza stringhe."""
+    return year * 12 + (month - 1)
+
+
+@st.cache_data(show_spinner=False)
+@traced('service')
+def index_budget_by_month(df_budget: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Ordina il budget per data e calcola, per ogni riga, la chiave intera del mese.
+    L'array di chiavi ordinato fa da indice mese → intervallo di righe: get_budget_month
+    lo interroga con una ricerca binaria invece di formattare ogni data in stringa.
+    Gli indici originali delle righe vengono mantenuti.
+    """
+    if df_budget.empty:
+        return df_budget, np.array([], dtype=np.int64)
+    dates = pd.to_datetime(df_budget['date'])
+    df_sorted = df_budget.assign(date=dates).sort_values('date', kind='stable')
+    month_keys = _month_key(df_sorted['date'].dt.year.to_numpy(np.int64), df_sorted['date'].dt.month.to_numpy(np.int64))
+    return df_sorted, month_keys
+
+
+def get_budget_month(df_sorted: pd.DataFrame, month_keys: np.ndarray, selected_month: str) -> pd.DataFrame:
+    """
+    Restituisce le righe del budget di un mese ('YYYY-MM') in O(log n),
+    come fetta contigua del budget ordinato da index_budget_by_month.
+    """
+    period = pd.Period(selected_month, freq='M')
+    key = _month_key(period.year, period.month)
+    start = np.searchsorted(month_keys, key, side='left')
+    stop = np.searchsorted(month_keys, key, side='right')
+    return df_sorted.iloc[start:stop]
+
+
+def get_cube_month(budget_cube: pd.DataFrame, selected_month: str) -> pd.DataFrame:
+    """Restituisce la fetta del cubo relativa a un mese ('YYYY-MM')."""
+    return budget_cube[budget_cube['mese'] == pd.Period(selected_month, freq='M')]
+
+
+def get_cube_last_months(budget_cube: pd.DataFrame, months: int) -> pd.DataFrame:
+    """Restituisce la fetta del cubo relativa agli ultimi N mesi con movimenti."""
+    last_months = sorted(budget_cube['mese'].unique(), reverse=True)[:months]
+    return budget_cube[budget_cube['mese'].isin(last_months)]
+
+
+def get_cube_year(budget_cube: pd.DataFrame, year: int = None) -> pd.DataFrame:
+    """Restituisce la fetta del cubo relativa a un anno (tutto il cubo se year è None)."""
+    if not year:
+        return budget_cube
+    return budget_cube[budget_cube['mese'].dt.year == year]
+
+
+def summarize_flows(budget_cube: pd.DataFrame) -> Dict[str, float]:
+    """
+    Totali di entrate, uscite (escluso Investimento) e investimenti di una fetta del cubo.
+    """
+    is_uscita = budget_cube['type'] == 'Uscita'
+    is_investimento = budget_cube['category'] == 'Investimento'
+    return {
+        "entrate": budget_cube.loc[budget_cube['type'] == 'Entrata', 'amount'].sum(),
+        "uscite": budget_cube.loc[is_uscita & ~is_investimento, 'amount'].sum(),
+        "investito": budget_cube.loc[is_uscita & is_investimento, 'amount'].sum(),
+    }
+
+
+@traced('service')
+def get_monthly_summary(selected_month: str, budget_cube: pd.DataFrame, df_trans: pd.DataFrame = None) -> Dict[str, float]:
     """
     Calcola un riepilogo finanziario per il mese selezionato.
     Gli investimenti sono calcolati dalla categoria 'Investimento' nel budget.
     """
-    df_month = df_budget[df_budget['date'].dt.strftime('%Y-%m') == selected_month]
+    flows = summarize_flows(get_cube_month(budget_cube, selected_month))
 
-    entrate = df_month[df_month['type'] == 'Entrata']['amount'].sum()
+    entrate = flows['entrate']
     # Uscite normali (escluso Investimento)
-    uscite = df_month[(df_month['type'] == 'Uscita') & (df_month['category'] != 'Investimento')]['amount'].sum()
+    uscite = flows['uscite']
     risparmio = entrate - uscite
     savings_rate = (risparmio / entrate * 100) if entrate > 0 else 0
 
     # Investimenti dal budget
-    investito_mese = df_month[(df_month['type'] == 'Uscita') & (df_month['category'] == 'Investimento')]['amount'].sum()
+    investito_mese = flows['investito']
 
     return {
         "entrate": entrate,
@@ -28,119 +119,155 @@ def get_monthly_summary(selected_month: str, df_budget: pd.DataFrame, df_trans:
     }
 
 
-def get_general_summary(df_budget: pd.DataFrame) -> Dict[str, float]:
-    """
-    Calcola un riepilogo finanziario generale su tutto il periodo.
-    Restituisce totali e medie mensili.
-    """
-    if df_budget.empty:
-        return {k: 0.0 for k in ["totale_entrate", "totale_uscite", "totale_investito", 
-                                  "totale_risparmio", "media_entrate", "media_uscite",
-                                  "media_investito", "media_risparmio", "num_mesi"]}
-    
-    # Conta mesi unici
-    df_budget['mese'] = df_budget['date'].dt.to_period('M')
-    num_mesi = df_budget['mese'].nunique()
-    
-    # Totali
-    totale_entrate = df_budget[df_budget['type'] == 'Entrata']['amount'].sum()
-    totale_uscite = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] != 'Investimento')]['amount'].sum()
-    totale_investito = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] == 'Investimento')]['amount'].sum()
-    totale_risparmio = totale_entrate - totale_uscite - totale_investito
-    
-    # Medie (se ci sono mesi)
-    if num_mesi > 0:
-        media_entrate = totale_entrate / num_mesi
-        media_uscite = totale_uscite / num_mesi
-        media_investito = totale_investito / num_mesi
-        media_risparmio = totale_risparmio / num_mesi
-    else:
-        media_entrate = media_uscite = media_investito = media_risparmio = 0
-    
-    return {
-        "totale_entrate": totale_entrate,
-        "totale_uscite": totale_uscite,
-        "totale_investito": totale_investito,
-        "totale_risparmio": totale_risparmio,
-        "media_entrate": media_entrate,
-        "media_uscite": media_uscite,
-        "media_investito": media_investito,
-        "media_risparmio": media_risparmio,
-        "num_mesi": num_mesi
-    }
-
-
-def get_category_averages(df_budget: pd.DataFrame) -> pd.DataFrame:
+@traced('service')
+def get_category_averages(budget_cube: pd.DataFrame) -> pd.DataFrame:
     """
     Calcola la media mensile per ogni categoria di spesa.
     Restituisce un DataFrame ordinato per importo decrescente.
     """
-    if df_budget.empty:
+    if budget_cube.empty:
         return pd.DataFrame()
     
-    df = df_budget.copy()
-    df['mese'] = df['date'].dt.to_period('M')
-    num_mesi = df['mese'].nunique()
+    num_mesi = budget_cube['mese'].nunique()
     
     # Solo uscite (incluso investimento)
-    df_spese = df[df['type'] == 'Uscita']
+    df_spese = budget_cube[budget_cube['type'] == 'Uscita']
     
     if df_spese.empty or num_mesi == 0:
         return pd.DataFrame()
     
     # Totale per categoria
-    totali = df_spese.groupby('category')['amount'].sum().reset_index()
+    totali = df_spese.groupby('category', observed=True)['amount'].sum().reset_index()
     totali['media_mensile'] = totali['amount'] / num_mesi
     totali = totali.sort_values('media_mensile', ascending=False)
     
     return totali
 
 
-def get_yearly_summary(df_budget: pd.DataFrame) -> pd.DataFrame:
+GENERAL_SUMMARY_KEYS = ["totale_entrate", "totale_uscite", "totale_investito",
+                        "totale_risparmio", "media_entrate", "media_uscite",
+                        "media_investito", "media_risparmio", "num_mesi"]
+
+
+@traced('service')
+def get_yearly_and_general_summary(budget_cube: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """
+    Calcola in un solo passaggio il riepilogo annuale e quello generale (totali e medie mensili).
+    Un'unica groupby per anno × tipo × investimento alimenta entrambi; l'input non viene modificato.
+    """
+    if budget_cube.empty:
+        return pd.DataFrame(), {k: 0.0 for k in GENERAL_SUMMARY_KEYS}
+
+    keys = [
+        budget_cube['mese'].dt.year.rename('anno'),
+        budget_cube['type'],
+        (budget_cube['category'] == 'Investimento').rename('is_investment'),
+    ]
+    agg = budget_cube.groupby(keys, observed=True)['amount'].sum().reset_index()
+    agg = agg[agg['type'].isin(['Entrata', 'Uscita'])]
+    # Entrate: tutte le righe 'Entrata'; Uscite: 'Uscita' escluso Investimento; Investito: il resto
+    agg['voce'] = np.where(agg['type'] == 'Entrata', 'entrate', np.where(agg['is_investment'], 'investito', 'uscite'))
+
+    yearly = (
+        agg.pivot_table(index='anno', columns='voce', values='amount', aggfunc='sum')
+        .reindex(columns=['entrate', 'uscite', 'investito'])
+        .fillna(0.0)
+    )
+    yearly['risparmio'] = yearly['entrate'] - yearly['uscite'] - yearly['investito']
+    yearly = yearly.reset_index().rename_axis(columns=None)
+
+    num_mesi = budget_cube['mese'].nunique()
+    totals = yearly[['entrate', 'uscite', 'investito', 'risparmio']].sum()
+    general = {
+        "totale_entrate": totals['entrate'],
+        "totale_uscite": totals['uscite'],
+        "totale_investito": totals['investito'],
+        "totale_risparmio": totals['risparmio'],
+        "num_mesi": num_mesi
+    }
+    for voce in ['entrate', 'uscite', 'investito', 'risparmio']:
+        general[f"media_{voce}"] = general[f"totale_{voce}"] / num_mesi if num_mesi > 0 else 0
+
+    return yearly, general
+
+
+def get_general_summary(budget_cube: pd.DataFrame) -> Dict[str, float]:
+    """
+    Calcola un riepilogo finanziario generale su tutto il periodo.
+    Restituisce totali e medie mensili.
+    """
+    return get_yearly_and_general_summary(budget_cube)[1]
+
+
+def get_yearly_summary(budget_cube: pd.DataFrame) -> pd.DataFrame:
     """
     Calcola il riepilogo per ogni anno disponibile.
     """
-    if df_budget.empty:
-        return pd.DataFrame()
-    
-    df = df_budget.copy()
-    df['anno'] = df['date'].dt.year
-    
-    result = []
-    for anno in sorted(df['anno'].unique()):
-        df_anno = df[df['anno'] == anno]
-        entrate = df_anno[df_anno['type'] == 'Entrata']['amount'].sum()
-        uscite = df_anno[(df_anno['type'] == 'Uscita') & (df_anno['category'] != 'Investimento')]['amount'].sum()
-        investito = df_anno[(df_anno['type'] == 'Uscita') & (df_anno['category'] == 'Investimento')]['amount'].sum()
-        risparmio = entrate - uscite - investito
-        
-        result.append({
-            'anno': anno,
-            'entrate': entrate,
-            'uscite': uscite,
-            'investito': investito,
-            'risparmio': risparmio
-        })
-    
-    return pd.DataFrame(result)
+    return get_yearly_and_general_summary(budget_cube)[0]
 
-def calculate_net_worth_trend(df_chart: pd.DataFrame) -> Tuple[pd.DataFrame, LinearRegression]:
+TREND_METHODS = {
+    'linear': "Lineare",
+    'exponential': "Esponenziale",
+    'cagr': "CAGR",
+}
+
+
+@traced('service')
+def calculate_net_worth_trend(df_chart: pd.DataFrame, method: str = 'linear', months_ahead: int = 6,
+                              confidence: float = 0.95) -> Tuple[pd.DataFrame, Dict[str, float]]:
     """
-    Calcola la linea di trend per il grafico del patrimonio netto.
+    Calcola la linea di trend (e la previsione) per il grafico del patrimonio netto.
+    Metodi: 'linear' (minimi quadrati), 'exponential' (minimi quadrati sul logaritmo),
+    'cagr' (crescita composta tra il primo e l'ultimo valore).
+    Per i fit ai minimi quadrati restituisce anche la banda di previsione al livello `confidence`
+    (colonne 'lower' e 'upper', NaN per il CAGR).
     """
-    if len(df_chart) < 2:
-        return pd.DataFrame(), None
+    if len(df_chart) < 2 or method not in TREND_METHODS:
+        return pd.DataFrame(), {}
 
-    X = np.array([(d - df_chart['date'].min()).days for d in df_chart['date']]).reshape(-1, 1)
-    y = df_chart['net_worth'].values
-    model = LinearRegression().fit(X, y)
-    
-    trend_dates = pd.date_range(start=df_chart['date'].min(), end=df_chart['date'].max() + pd.DateOffset(months=6))
-    trend_X = np.array([(d - df_chart['date'].min()).days for d in trend_dates]).reshape(-1, 1)
-    trend_y = model.predict(trend_X)
-    
-    df_trend = pd.DataFrame({'date': trend_dates, 'trend': trend_y})
-    return df_trend, model
+    dates = pd.to_datetime(df_chart['date']).to_numpy(dtype='datetime64[D]')
+    start = dates.min()
+    x = (dates - start).astype(np.int64).astype(float)
+    y = df_chart['net_worth'].to_numpy(dtype=float)
+
+    trend_dates = pd.date_range(start=pd.Timestamp(start), end=pd.Timestamp(dates.max()) + pd.DateOffset(months=months_ahead))
+    trend_x = (trend_dates.to_numpy(dtype='datetime64[D]') - start).astype(np.int64).astype(float)
+    lower = upper = np.full(len(trend_x), np.nan)
+
+    if method == 'cagr':
+        order = np.argsort(x)
+        x0, x1, y0, y1 = x[order[0]], x[order[-1]], y[order[0]], y[order[-1]]
+        if x1 <= x0 or y0 <= 0 or y1 <= 0:
+            return pd.DataFrame(), {}
+        daily_rate = (y1 / y0) ** (1 / (x1 - x0)) - 1
+        trend_y = y0 * (1 + daily_rate) ** (trend_x - x0)
+        params = {'growth_rate': (1 + daily_rate) ** 365.25 - 1}
+    else:
+        log_scale = method == 'exponential'
+        if log_scale:
+            if (y <= 0).any():
+                return pd.DataFrame(), {}
+            y = np.log(y)
+        slope, intercept = np.polyfit(x, y, 1)
+        fitted = trend_x * slope + intercept
+
+        # Banda di previsione: s * sqrt(1 + 1/n + (x - x̄)² / Sxx)
+        n = len(x)
+        residual_std = np.sqrt(np.sum((y - (x * slope + intercept)) ** 2) / (n - 2)) if n > 2 else 0.0
+        sxx = np.sum((x - x.mean()) ** 2)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        half_width = z * residual_std * np.sqrt(1 + 1 / n + (trend_x - x.mean()) ** 2 / sxx)
+        lower, upper = fitted - half_width, fitted + half_width
+
+        if log_scale:
+            trend_y, lower, upper = np.exp(fitted), np.exp(lower), np.exp(upper)
+            params = {'growth_rate': np.exp(slope * 365.25) - 1, 'residual_std': residual_std}
+        else:
+            trend_y = fitted
+            params = {'slope_per_day': slope, 'residual_std': residual_std}
+
+    df_trend = pd.DataFrame({'date': trend_dates, 'trend': trend_y, 'lower': lower, 'upper': upper})
+    return df_trend, params
 
 def parse_degiro_csv(file):
     df = pd.read_csv(file)
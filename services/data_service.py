@@ -1,13 +1,16 @@
+import asyncio
 import pandas as pd
 import hashlib
-import requests
-import yfinance as yf
-import streamlit as st
-from bs4 import BeautifulSoup
+import io
+import os
 from datetime import datetime, timedelta
 from database.connection import get_data, save_data
-from services.portfolio_service import calculate_liquidity
-from typing import Any
+from services.portfolio_service import build_liquidity_index, liquidity_at
+from services.tracing import traced, span
+from services.http_client import fetch, run_sync, run_blocking, map_blocking
+from services.reporting import Reporter, get_reporter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List
 import json
 
 def parse_degiro_csv(file):
@@ -27,37 +30,98 @@ def generate_id(row, index):
     raw = f"{index}{d_str}{row.get('Ora','')}{row.get('ISIN','')}{row.get('Quantità','')}{row.get('Valore','')}"
     return hashlib.md5(raw.encode()).hexdigest()
 
-def process_new_transactions(file: Any, existing_transactions: pd.DataFrame) -> pd.DataFrame:
+def parse_degiro_transactions(file: Any, with_content_key: bool = False) -> pd.DataFrame:
     """
-    Elabora un file CSV di transazioni, lo confronta con quelle esistenti e restituisce solo le nuove.
+    Converte un file CSV DEGIRO nel formato della tabella transactions.
+    Non legge il DB: i duplicati interni al file vengono scartati qui,
+    quelli già presenti nel DB li scarta Postgres in fase di import.
+    Con with_content_key=True aggiunge la colonna '_content_key' (ID senza indice di riga),
+    usata per riconoscere la stessa operazione in export diversi.
     """
     ndf = parse_degiro_csv(file)
     rows_to_add = []
-    existing_ids = set(existing_transactions['id']) if not existing_transactions.empty else set()
-    
+    seen_ids = set()
+
     for idx, r in ndf.iterrows():
         if pd.isna(r.get('ISIN')): continue
         tid = generate_id(r, idx)
-        if tid not in existing_ids:
-            val = r.get('Totale', 0) if r.get('Totale', 0) != 0 else r.get('Valore', 0)
-            rows_to_add.append({
-                'id': tid, 
-                'date': r['Data'], 
-                'product': r.get('Prodotto',''), 
-                'isin': r.get('ISIN',''), 
-                'quantity': r.get('Quantità',0), 
-                'local_value': val, 
-                'fees': r.get('Costi di transazione',0), 
-                'currency': 'EUR'
-            })
-            existing_ids.add(tid)
-            
+        if tid in seen_ids:
+            continue
+        val = r.get('Totale', 0) if r.get('Totale', 0) != 0 else r.get('Valore', 0)
+        row = {
+            'id': tid,
+            'date': r['Data'],
+            'product': r.get('Prodotto',''),
+            'isin': r.get('ISIN',''),
+            'quantity': r.get('Quantità',0),
+            'local_value': val,
+            'fees': r.get('Costi di transazione',0),
+            'currency': 'EUR'
+        }
+        if with_content_key:
+            row['_content_key'] = generate_id(r, '')
+        rows_to_add.append(row)
+        seen_ids.add(tid)
+
     return pd.DataFrame(rows_to_add)
 
-def calculate_net_worth_snapshot(snapshot_date: pd.Timestamp, df_trans: pd.DataFrame, df_map: pd.DataFrame, df_prices: pd.DataFrame, df_budget: pd.DataFrame) -> tuple[float, float, float]:
+def _parse_degiro_bytes(data: bytes) -> pd.DataFrame:
+    """Worker per il process pool: riceve il contenuto grezzo di un CSV (picklable)."""
+    return parse_degiro_transactions(io.BytesIO(data), with_content_key=True)
+
+@traced('service')
+def process_transaction_files(files_data: List[bytes]) -> pd.DataFrame:
+    """
+    Elabora in parallelo più CSV DEGIRO (conti diversi o export annuali sovrapposti)
+    e restituisce un unico DataFrame deduplicato, pronto per un import in blocco.
+
+    Una stessa operazione presente in più export ha ID diversi (l'ID include l'indice di riga),
+    quindi tra file diversi si deduplica sul contenuto: per ogni operazione si tengono
+    tante occorrenze quante ne ha il file che ne contiene di più, con gli ID del primo file.
+    """
+    if not files_data:
+        return pd.DataFrame()
+
+    if len(files_data) == 1:
+        parsed = [_parse_degiro_bytes(files_data[0])]
+    else:
+        workers = min(len(files_data), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_parse_degiro_bytes, files_data))
+
+    frames = []
+    for df in parsed:
+        if df.empty:
+            continue
+        df = df.copy()
+        # Numero progressivo dell'operazione identica all'interno dello stesso file
+        df['_occurrence'] = df.groupby('_content_key').cumcount()
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(subset=['_content_key', '_occurrence'], keep='first')
+    merged = merged.drop_duplicates(subset=['id'], keep='first')
+    return merged.drop(columns=['_content_key', '_occurrence']).sort_values('date').reset_index(drop=True)
+
+@traced('service')
+def process_new_transactions(file: Any, existing_transactions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Elabora un file CSV di transazioni, lo confronta con quelle esistenti e restituisce solo le nuove.
+    """
+    ndf = parse_degiro_transactions(file)
+    if ndf.empty or existing_transactions.empty:
+        return ndf
+    return ndf[~ndf['id'].isin(existing_transactions['id'])].reset_index(drop=True)
+
+@traced('service')
+def calculate_net_worth_snapshot(snapshot_date: pd.Timestamp, df_trans: pd.DataFrame, df_map: pd.DataFrame, df_prices: pd.DataFrame, df_budget: pd.DataFrame, liquidity_index: pd.Series = None) -> tuple[float, float, float]:
     """
     Calcola il valore degli asset, la liquidità e il patrimonio netto totale a una data specifica.
     Replica la logica complessa della pagina Gestione Dati.
+    La liquidità si legge dall'indice del saldo di cassa (build_liquidity_index), che può essere
+    passato già calcolato quando si elaborano più date.
     """
     # Normalizza le date per confronti sicuri
     if not df_trans.empty: df_trans['date'] = pd.to_datetime(df_trans['date']).dt.normalize()
@@ -69,20 +133,22 @@ def calculate_net_worth_snapshot(snapshot_date: pd.Timestamp, df_trans: pd.DataF
     # Filtra tutti i dati fino alla data dello snapshot
     trans_at_date = df_trans[df_trans['date'] <= snapshot_date] if not df_trans.empty else pd.DataFrame()
     prices_at_date = df_prices[df_prices['date'] <= snapshot_date] if not df_prices.empty else pd.DataFrame()
-    budget_at_date = df_budget[df_budget['date'] <= snapshot_date] if not df_budget.empty else pd.DataFrame()
 
     # 1. Calcolo Valore Asset alla data
     if not trans_at_date.empty and not df_map.empty and not prices_at_date.empty:
-        df_full_nw = trans_at_date.merge(df_map, on='isin', how='left')
-        if 'mapping_id' not in df_full_nw.columns and 'id' in df_full_nw.columns:
-            df_full_nw = df_full_nw.rename(columns={'id': 'mapping_id'})
+        df_full_nw = trans_at_date.merge(df_map, on='isin', how='left', suffixes=('_trans', '_map'))
+        # L'id della mappatura è 'id' o 'id_map' a seconda che le transazioni abbiano una colonna id
+        if 'mapping_id' not in df_full_nw.columns:
+            df_full_nw = df_full_nw.rename(columns={'id_map' if 'id_map' in df_full_nw.columns else 'id': 'mapping_id'})
         last_prices_at_date = prices_at_date.sort_values('date').groupby('mapping_id').tail(1).set_index('mapping_id')['close_price']
         view_nw = df_full_nw.groupby('mapping_id')['quantity'].sum().reset_index()
         view_nw['mkt_val'] = view_nw['quantity'] * view_nw['mapping_id'].map(last_prices_at_date).fillna(0)
         total_assets_value = view_nw['mkt_val'].sum()
 
-    # 2. Calcolo Liquidità alla data (usando la funzione di servizio già esistente)
-    final_liquidity, _ = calculate_liquidity(budget_at_date, trans_at_date)
+    # 2. Calcolo Liquidità alla data (ricerca nel saldo di cassa cumulato)
+    if liquidity_index is None:
+        liquidity_index = build_liquidity_index(df_budget)
+    final_liquidity = liquidity_at(liquidity_index, snapshot_date)
 
     # 3. Calcolo Patrimonio Netto
     net_worth_at_date = total_assets_value + final_liquidity
@@ -90,39 +156,66 @@ def calculate_net_worth_snapshot(snapshot_date: pd.Timestamp, df_trans: pd.DataF
     return net_worth_at_date, total_assets_value, final_liquidity
 
 
+@traced('service')
+def backfill_net_worth(dates, df_trans: pd.DataFrame, df_map: pd.DataFrame, df_prices: pd.DataFrame, df_budget: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calcola lo snapshot del patrimonio per ogni data indicata.
+    L'indice della liquidità si costruisce una sola volta e si riusa per tutte le date.
+    Ritorna un DataFrame con date, net_worth, assets_value e liquidity.
+    """
+    df_trans, df_prices, df_budget = df_trans.copy(), df_prices.copy(), df_budget.copy()
+    liquidity_index = build_liquidity_index(df_budget)
+    rows = []
+    for d in pd.to_datetime(pd.Index(dates)).normalize():
+        net_worth, assets_value, liquidity = calculate_net_worth_snapshot(
+            d, df_trans, df_map, df_prices, df_budget, liquidity_index=liquidity_index
+        )
+        rows.append({'date': d, 'net_worth': float(net_worth), 'assets_value': float(assets_value), 'liquidity': float(liquidity)})
+    return pd.DataFrame(rows, columns=['date', 'net_worth', 'assets_value', 'liquidity'])
+
+
+def merge_networth_snapshots(df_history: pd.DataFrame, df_snapshots: pd.DataFrame) -> pd.DataFrame:
+    """
+    Inserisce o aggiorna gli snapshot nello storico del patrimonio, per data.
+    I valori dello snapshot prevalgono; le colonne che non ha (es. goal) restano quelle dello storico.
+    """
+    snapshots = df_snapshots.copy()
+    snapshots['date'] = pd.to_datetime(snapshots['date']).dt.normalize()
+    if df_history.empty:
+        return snapshots.sort_values('date').reset_index(drop=True)
+    history = df_history.copy()
+    history['date'] = pd.to_datetime(history['date']).dt.normalize()
+    merged = snapshots.set_index('date').combine_first(history.drop_duplicates('date', keep='last').set_index('date'))
+    return merged.reset_index().sort_values('date').reset_index(drop=True)
+
+
+JUSTETF_PROFILE_URL = "https://www.justetf.com/it/etf-profile.html?isin={isin}"
+JUSTETF_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "application/json, text/html, */*",
+    "Accept-Language": "it-IT,it;q=0.9,en;q=0.8",
+    "X-Requested-With": "XMLHttpRequest"
+}
+# Sezioni con il link "Mostra di più": titolo h3, classe del link, componente Wicket, chiave JSON
+JUSTETF_SECTIONS = {
+    'geo': ('Paesi', 'etf-holdings_countries_load-more_link', 'holdingsSection-countries-loadMoreCountries', 'countries'),
+    'sec': ('Settori', 'etf-holdings_sectors_load-more_link', 'holdingsSection-sectors-loadMoreSectors', 'sectors'),
+}
+# Con 5 voci o meno per paesi o settori il risultato è considerato incompleto
+JUSTETF_MIN_ROWS = 5
+
+
+@traced('service')
 def fetch_justetf_allocation_robust(isin):
     """
     Scarica da JustETF con fallback intelligente:
     1. Prova API JSON (se esiste)
     2. Scraping BeautifulSoup avanzato con AJAX Wicket
     3. Fallback Playwright (browser automation) se gli altri metodi falliscono
+    La pagina del profilo si scarica una volta sola per i metodi 1 e 2, le richieste AJAX di
+    paesi e settori partono insieme e Playwright parte appena si sa che servirà.
     """
-    
-    # METODO 1: Prova a trovare endpoint API o dati JSON nell'HTML
-    geo_api, sec_api = _try_fetch_justetf_api(isin)
-
-    # METODO 2: Fallback a BeautifulSoup / AJAX per ottenere dati completi
-    geo_bs, sec_bs = _fetch_justetf_beautifulsoup(isin)
-
-    # Unisci risultati: preferisci dettagli da BeautifulSoup/AJAX quando presenti
-    geo_dict = {}
-    sec_dict = {}
-    if geo_api:
-        geo_dict.update(geo_api)
-    if geo_bs:
-        geo_dict.update(geo_bs)
-    if sec_api:
-        sec_dict.update(sec_api)
-    if sec_bs:
-        sec_dict.update(sec_bs)
-
-    # METODO 3: Se i risultati sono incompleti (<=5 paesi/settori), prova Playwright
-    if (len(geo_dict) <= 5 or len(sec_dict) <= 5):
-        geo_pw, sec_pw = _fetch_justetf_playwright(isin)
-        if geo_pw:
-            geo_dict.update(geo_pw)
-        if sec_pw:
-            sec_dict.update(sec_pw)
+    geo_dict, sec_dict = run_sync(_fetch_justetf_allocation(isin))
 
     # --- Calcolo automatico "Altri" come resto a 100% ---
     def _add_altri(d: dict) -> dict:
@@ -142,249 +235,198 @@ def fetch_justetf_allocation_robust(isin):
     return geo_dict, sec_dict
 
 
-def _try_fetch_justetf_api(isin):
+async def _fetch_justetf_allocation(isin):
     """
-    Prova a estrarre dati da JSON embedded o API nascosta
+    Combina i tre metodi sul loop di services/http_client.py. I risultati si uniscono in ordine
+    API, BeautifulSoup/AJAX, Playwright: a parità di voce vale il metodo più dettagliato.
+    """
+    from bs4 import BeautifulSoup
+    page_html = await _fetch_justetf_profile(isin)
+    soup = BeautifulSoup(page_html, 'lxml') if page_html else None
+    ajax_urls = _find_justetf_ajax_urls(soup) if soup is not None else {}
+
+    # METODO 1: dati JSON nell'HTML, senza altre richieste
+    geo_dict, sec_dict = _try_fetch_justetf_api(soup) if soup is not None else ({}, {})
+
+    def _short(d):
+        return len(d) <= JUSTETF_MIN_ROWS
+
+    # METODO 3 anticipato: se per una sezione incompleta non c'è un link AJAX, i metodi veloci
+    # non possono completarla e Playwright parte subito, in parallelo alle richieste AJAX
+    playwright = None
+    if (_short(geo_dict) and 'geo' not in ajax_urls) or (_short(sec_dict) and 'sec' not in ajax_urls):
+        playwright = asyncio.ensure_future(run_blocking(_fetch_justetf_playwright, isin))
+
+    # METODO 2: righe complete via AJAX Wicket
+    if ajax_urls:
+        geo_bs, sec_bs = await _fetch_justetf_beautifulsoup(isin, page_html, ajax_urls)
+        geo_dict.update(geo_bs)
+        sec_dict.update(sec_bs)
+
+    # METODO 3: Se i risultati sono incompleti (<=5 paesi/settori), prova Playwright
+    if playwright is None and (_short(geo_dict) or _short(sec_dict)):
+        playwright = run_blocking(_fetch_justetf_playwright, isin)
+    if playwright is not None:
+        geo_pw, sec_pw = await playwright
+        if geo_pw:
+            geo_dict.update(geo_pw)
+        if sec_pw:
+            sec_dict.update(sec_pw)
+
+    return geo_dict, sec_dict
+
+
+@traced('network')
+async def _fetch_justetf_profile(isin):
+    """
+    Scarica la pagina del profilo ETF, condivisa dai parser. None se non è raggiungibile.
     """
-    url = f"https://www.justetf.com/it/etf-profile.html?isin={isin}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Accept": "application/json, text/html, */*",
-        "Accept-Language": "it-IT,it;q=0.9,en;q=0.8"
-    }
-    
-    geo_dict, sec_dict = {}, {}
-    
     try:
-        response = requests.get(url, headers=headers, timeout=15)
+        response = await fetch(JUSTETF_PROFILE_URL.format(isin=isin), headers=JUSTETF_HEADERS)
         response.raise_for_status()
-        
-        # Cerca script JSON nell'HTML
-        soup = BeautifulSoup(response.text, 'lxml')
-        
-        # Cerca dati JSON embedded (tipo application/json o window.dataLayer)
-        scripts = soup.find_all('script', type='application/json')
-        for script in scripts:
-            try:
-                import json
-                data = json.loads(script.string)
-                # Cerca chiavi tipo "countries", "sectors", "allocation"
-                if isinstance(data, dict):
-                    # Adatta in base alla struttura reale
-                    if 'countries' in data:
-                        geo_dict = data['countries']
-                    if 'sectors' in data:
-                        sec_dict = data['sectors']
-            except:
-                pass
-        
-        # Cerca anche in window.__ variables
-        for script in soup.find_all('script'):
-            if script.string and 'countries' in str(script.string):
-                # Qui potresti parsare JavaScript inline se necessario
-                pass
-                
+        return response.text
     except Exception:
-        pass
-    
-    return geo_dict, sec_dict
+        return None
 
 
-def _fetch_justetf_beautifulsoup(isin):
+def _try_fetch_justetf_api(soup):
     """
-    Metodo BeautifulSoup migliorato che cerca anche nelle righe nascoste
-    e tenta di caricare dati extra via link "load more".
+    Prova a estrarre dati da JSON embedded nella pagina del profilo
     """
-    url = f"https://www.justetf.com/it/etf-profile.html?isin={isin}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Accept-Language": "it-IT,it;q=0.9,en;q=0.8",
-        "X-Requested-With": "XMLHttpRequest"
-    }
-
     geo_dict, sec_dict = {}, {}
-    try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, 'lxml')
+    # Cerca dati JSON embedded (tipo application/json o window.dataLayer)
+    scripts = soup.find_all('script', type='application/json')
+    for script in scripts:
+        try:
+            data = json.loads(script.string)
+            # Cerca chiavi tipo "countries", "sectors", "allocation"
+            if isinstance(data, dict):
+                # Adatta in base alla struttura reale
+                if 'countries' in data:
+                    geo_dict = dict(data['countries'])
+                if 'sectors' in data:
+                    sec_dict = dict(data['sectors'])
+        except Exception:
+            pass
 
-        # helper: perform wicket ajax request (uses session, sets Wicket-Ajax-BaseURL)
-        def _request_wicket_ajax(isin_local, ajax_url, headers_local):
-            import re
-            session = requests.Session()
-            base_page = f"https://www.justetf.com/it/etf-profile.html?isin={isin_local}"
-            try:
-                r0 = session.get(base_page, headers={'User-Agent': headers_local.get('User-Agent','Mozilla/5.0')}, timeout=10)
-                # try to extract wicket.ajax.baseurl
-                m = re.search(r'wicket\.ajax\.baseurl\s*=\s*"([^"]+)"', r0.text)
-                baseval = m.group(1) if m else f"it/etf-profile.html?isin={isin_local}"
-            except Exception:
-                baseval = f"it/etf-profile.html?isin={isin_local}"
-
-            headers_ajax = headers_local.copy()
-            headers_ajax.update({
-                'X-Requested-With': 'XMLHttpRequest',
-                'Wicket-Ajax': 'true',
-                'Wicket-Ajax-BaseURL': baseval,
-                'Accept': '*/*'
-            })
-            try:
-                # use POST as Wicket often expects POST
-                r = session.post(ajax_url, headers=headers_ajax, timeout=15)
-                return r
-            except Exception:
-                try:
-                    return session.get(ajax_url, headers=headers_ajax, timeout=15)
-                except Exception:
-                    return None
-
-
-        # --- GEOGRAFIA ---
-        h3_geo = soup.find('h3', string=lambda text: text and 'Paesi' in text)
-        if h3_geo:
-            load_more_link = soup.find('a', class_='etf-holdings_countries_load-more_link')
-
-            if load_more_link:
-                extra_href = load_more_link.get('href')
-                extra_url = None
-                if extra_href and extra_href not in ['#', 'javascript:void(0)', '']:
-                    extra_url = extra_href
-                # if href is '#' or empty, try extract AJAX URL from scripts
-                if not extra_url or extra_url in ['#', 'javascript:void(0)', '']:
-                    import re
-                    scripts_text = ' '.join([s.string or '' for s in soup.find_all('script')])
-                    m = re.search(r'Wicket\.Ajax\.ajax\(\{[^}]*u\"?:\s*\"([^\"]*holdingsSection-countries-loadMoreCountries[^\"]*)\"', scripts_text)
-                    if not m:
-                        m = re.search(r'Wicket\.Ajax\.ajax\(\{[^}]*u\'?:\s*\'([^\']*holdingsSection-countries-loadMoreCountries[^\']*)\'', scripts_text)
-                    if m:
-                        extra_url = m.group(1)
-                if extra_url:
-                    if not extra_url.startswith('http'):
-                        extra_url = f"https://www.justetf.com{extra_url}"
+    return geo_dict, sec_dict
 
-                try:
-                    # se è un endpoint Wicket AJAX usiamo la chiamata emulata
-                    extra_response = None
-                    if '_wicket=1' in extra_url or 'loadMore' in extra_url or 'holdingsSection' in extra_url:
-                        extra_response = _request_wicket_ajax(isin, extra_url, headers)
-                    if extra_response is None:
-                        extra_response = requests.get(extra_url, headers=headers, timeout=10)
-                    extra_response.raise_for_status()
 
-                    try:
-                        extra_data = extra_response.json()
-                        if isinstance(extra_data, dict) and 'countries' in extra_data:
-                            geo_dict.update(extra_data['countries'])
-                    except Exception:
-                        txt = extra_response.text
-                        # Gestisci risposta AJAX XML (Wicket) contenente CDATA con HTML
-                        if txt.strip().startswith('<?xml') or '<ajax-response' in txt:
-                            import re
-                            cdata_blocks = re.findall(r'<!\[CDATA\[(.*?)\]\]>', txt, flags=re.S)
-                            for block in cdata_blocks:
-                                inner = BeautifulSoup(block, 'lxml')
-                                for row in inner.find_all('tr'):
-                                    cols = row.find_all('td')
-                                    if len(cols) >= 2:
-                                        key = cols[0].get_text(strip=True)
-                                        val_str = cols[1].get_text(strip=True).replace('%', '').replace(',', '.')
-                                        try:
-                                            val = float(val_str)
-                                            if val < 101:
-                                                geo_dict[key] = val
-                                        except Exception:
-                                            pass
-                        else:
-                            extra_soup = BeautifulSoup(txt, 'lxml')
-                            for row in extra_soup.find_all('tr'):
-                                cols = row.find_all('td')
-                                if len(cols) >= 2:
-                                    key = cols[0].text.strip()
-                                    val_str = cols[1].text.strip().replace('%', '').replace(',', '.')
-                                    try:
-                                        val = float(val_str)
-                                        if val < 101:
-                                            geo_dict[key] = val
-                                    except Exception:
-                                        pass
+def _find_justetf_ajax_urls(soup):
+    """
+    URL delle richieste "Mostra di più" per paesi e settori: href del link oppure, se il link
+    è un segnaposto ('#'), l'URL della chiamata Wicket.Ajax negli script della pagina.
+    """
+    import re
+    urls = {}
+    scripts_text = None
+    for key, (title, link_class, component, _) in JUSTETF_SECTIONS.items():
+        if not soup.find('h3', string=lambda text: text and title in text):
+            continue
+        load_more_link = soup.find('a', class_=link_class)
+        if not load_more_link:
+            continue
+        extra_url = load_more_link.get('href')
+        if not extra_url or extra_url in ['#', 'javascript:void(0)', '']:
+            extra_url = None
+            if scripts_text is None:
+                scripts_text = ' '.join([s.string or '' for s in soup.find_all('script')])
+            m = re.search(r'Wicket\.Ajax\.ajax\(\{[^}]*u\"?:\s*\"([^\"]*' + component + r'[^\"]*)\"', scripts_text)
+            if not m:
+                m = re.search(r'Wicket\.Ajax\.ajax\(\{[^}]*u\'?:\s*\'([^\']*' + component + r'[^\']*)\'', scripts_text)
+            if m:
+                extra_url = m.group(1)
+        if extra_url:
+            if not extra_url.startswith('http'):
+                extra_url = f"https://www.justetf.com{extra_url}"
+            urls[key] = extra_url
+    return urls
+
+
+def _parse_justetf_rows(response, json_key):
+    """
+    Righe nome/percentuale dalla risposta "Mostra di più": JSON, XML Wicket con l'HTML nei
+    blocchi CDATA oppure HTML semplice. Le percentuali oltre 100 vengono scartate.
+    """
+    from bs4 import BeautifulSoup
+    try:
+        extra_data = response.json()
+        if isinstance(extra_data, dict) and json_key in extra_data:
+            return dict(extra_data[json_key])
+        return {}
+    except Exception:
+        pass
+
+    import re
+    txt = response.text
+    # Gestisci risposta AJAX XML (Wicket) contenente CDATA con HTML
+    if txt.strip().startswith('<?xml') or '<ajax-response' in txt:
+        blocks = re.findall(r'<!\[CDATA\[(.*?)\]\]>', txt, flags=re.S)
+    else:
+        blocks = [txt]
+    rows = {}
+    for block in blocks:
+        inner = BeautifulSoup(block, 'lxml')
+        for row in inner.find_all('tr'):
+            cols = row.find_all('td')
+            if len(cols) >= 2:
+                key = cols[0].get_text(strip=True)
+                val_str = cols[1].get_text(strip=True).replace('%', '').replace(',', '.')
+                try:
+                    val = float(val_str)
+                    if val < 101:
+                        rows[key] = val
                 except Exception:
                     pass
+    return rows
 
-        # --- SETTORI ---
-        h3_sec = soup.find('h3', string=lambda text: text and 'Settori' in text)
-        if h3_sec:
-            load_more_link = soup.find('a', class_='etf-holdings_sectors_load-more_link')
-
-            if load_more_link:
-                extra_href = load_more_link.get('href')
-                extra_url = None
-                if extra_href and extra_href not in ['#', 'javascript:void(0)', '']:
-                    extra_url = extra_href
-                if not extra_url or extra_url in ['#', 'javascript:void(0)', '']:
-                    import re
-                    scripts_text = ' '.join([s.string or '' for s in soup.find_all('script')])
-                    m = re.search(r'Wicket\.Ajax\.ajax\(\{[^}]*u\"?:\s*\"([^\"]*holdingsSection-sectors-loadMoreSectors[^\"]*)\"', scripts_text)
-                    if not m:
-                        m = re.search(r'Wicket\.Ajax\.ajax\(\{[^}]*u\'?:\s*\'([^\']*holdingsSection-sectors-loadMoreSectors[^\']*)\'', scripts_text)
-                    if m:
-                        extra_url = m.group(1)
-                if extra_url:
-                    if not extra_url.startswith('http'):
-                        extra_url = f"https://www.justetf.com{extra_url}"
 
+@traced('network')
+async def _fetch_justetf_beautifulsoup(isin, page_html, ajax_urls):
+    """
+    Carica le righe nascoste di paesi e settori con le richieste "load more" (AJAX Wicket),
+    in parallelo. page_html è la pagina del profilo già scaricata: da lì si legge la base URL
+    Wicket e i cookie di sessione sono già nel client condiviso.
+    """
+    import re
+    m = re.search(r'wicket\.ajax\.baseurl\s*=\s*"([^"]+)"', page_html)
+    baseval = m.group(1) if m else f"it/etf-profile.html?isin={isin}"
+    headers_ajax = JUSTETF_HEADERS.copy()
+    headers_ajax.update({
+        'X-Requested-With': 'XMLHttpRequest',
+        'Wicket-Ajax': 'true',
+        'Wicket-Ajax-BaseURL': baseval,
+        'Accept': '*/*'
+    })
+
+    async def _load_more(key, extra_url):
+        json_key = JUSTETF_SECTIONS[key][3]
+        try:
+            extra_response = None
+            # se è un endpoint Wicket AJAX usiamo la chiamata emulata (POST, come il browser)
+            if '_wicket=1' in extra_url or 'loadMore' in extra_url or 'holdingsSection' in extra_url:
                 try:
-                    extra_response = None
-                    if '_wicket=1' in extra_url or 'loadMore' in extra_url or 'holdingsSection' in extra_url:
-                        extra_response = _request_wicket_ajax(isin, extra_url, headers)
-                    if extra_response is None:
-                        extra_response = requests.get(extra_url, headers=headers, timeout=10)
-                    extra_response.raise_for_status()
-
+                    extra_response = await fetch(extra_url, 'POST', headers=headers_ajax, timeout=15)
+                except Exception:
                     try:
-                        extra_data = extra_response.json()
-                        if isinstance(extra_data, dict) and 'sectors' in extra_data:
-                            sec_dict.update(extra_data['sectors'])
+                        extra_response = await fetch(extra_url, headers=headers_ajax, timeout=15)
                     except Exception:
-                        txt = extra_response.text
-                        if txt.strip().startswith('<?xml') or '<ajax-response' in txt:
-                            import re
-                            cdata_blocks = re.findall(r'<!\[CDATA\[(.*?)\]\]>', txt, flags=re.S)
-                            for block in cdata_blocks:
-                                inner = BeautifulSoup(block, 'lxml')
-                                for row in inner.find_all('tr'):
-                                    cols = row.find_all('td')
-                                    if len(cols) >= 2:
-                                        key = cols[0].get_text(strip=True)
-                                        val_str = cols[1].get_text(strip=True).replace('%', '').replace(',', '.')
-                                        try:
-                                            val = float(val_str)
-                                            if val < 101:
-                                                sec_dict[key] = val
-                                        except Exception:
-                                            pass
-                        else:
-                            extra_soup = BeautifulSoup(txt, 'lxml')
-                            for row in extra_soup.find_all('tr'):
-                                cols = row.find_all('td')
-                                if len(cols) >= 2:
-                                    key = cols[0].text.strip()
-                                    val_str = cols[1].text.strip().replace('%', '').replace(',', '.')
-                                    try:
-                                        val = float(val_str)
-                                        if val < 101:
-                                            sec_dict[key] = val
-                                    except Exception:
-                                        pass
-                except Exception:
-                    pass
-        
-        return geo_dict, sec_dict
+                        extra_response = None
+            if extra_response is None:
+                extra_response = await fetch(extra_url, headers=JUSTETF_HEADERS, timeout=10)
+            extra_response.raise_for_status()
+            return _parse_justetf_rows(extra_response, json_key)
+        except Exception:
+            return {}
+
+    keys = list(ajax_urls)
+    results = await asyncio.gather(*(_load_more(key, ajax_urls[key]) for key in keys))
+    by_key = dict(zip(keys, results))
+    return by_key.get('geo', {}), by_key.get('sec', {})
 
-    except Exception:
-        return {}, {}
-    
 
+@traced('network')
 def _fetch_justetf_playwright(isin):
     """
     Usa Playwright per scraping completo: gestisce cookie banner (Usercentrics shadow DOM)
@@ -486,12 +528,16 @@ def _fetch_justetf_playwright(isin):
     except Exception:
         return {}, {}
 
-def sync_prices(df_trans, df_map):
+@traced('service')
+def sync_prices(df_trans, df_map, reporter: Reporter = None):
     """
     Scarica i prezzi da Yahoo Finance per TUTTI gli asset mappati (posseduti e venduti).
     Esegue un download INCREMENTALE (scarica solo i giorni mancanti).
     Per gli asset venduti scarica solo fino alla data dell'ultima transazione.
+    Messaggi e avanzamento passano dal reporter (default: quello di Streamlit).
     """
+    import yfinance as yf
+    reporter = get_reporter(reporter)
     if df_trans.empty or df_map.empty:
         return 0
 
@@ -503,7 +549,7 @@ def sync_prices(df_trans, df_map):
     # 2. Filtra solo gli ISIN mappati
     df_map_to_sync = df_map[df_map['isin'].isin(all_isins)]
     if df_map_to_sync.empty:
-        st.info("Nessun asset mappato trovato tra quelli nelle transazioni.")
+        reporter.info("Nessun asset mappato trovato tra quelli nelle transazioni.")
         return 0
 
     mapping_ids = df_map_to_sync['id'].tolist()
@@ -515,11 +561,13 @@ def sync_prices(df_trans, df_map):
 
     new_data = []
     errors = []
-    bar = st.progress(0, text="Analisi asset...")
+    reporter.progress(0, text="Analisi asset...")
     
     today = datetime.now().date()
 
-    for i, m_id in enumerate(mapping_ids):
+    # 1. Piano dei download: per ogni asset l'intervallo mancante (nessuna chiamata di rete qui)
+    downloads = []
+    for m_id in mapping_ids:
         ticker_row = df_map_to_sync[df_map_to_sync['id'] == m_id]
         if ticker_row.empty:
             continue
@@ -546,23 +594,35 @@ def sync_prices(df_trans, df_map):
                 # Se abbiamo dati fino alla data target, saltiamo
                 target_check = today - timedelta(days=1) if is_owned else end_date - timedelta(days=2)
                 if last_date_in_db >= target_check:
-                    bar.progress((i + 1) / len(mapping_ids))
                     continue
                 else:
                     start_date = last_date_in_db + timedelta(days=1)
         
         # Se start_date è oltre end_date, non scaricare nulla
         if start_date >= end_date:
-             bar.progress((i + 1) / len(mapping_ids))
              continue
 
+        downloads.append((m_id, t, start_date, end_date))
+
+    def _download(item):
+        m_id, t, start_date, end_date = item
+        # Scarica solo il delta mancante (auto_adjust=False per prezzi Close reali).
+        # threads=False: il parallelismo tra ticker lo gestisce map_blocking. Le chiamate
+        # concorrenti richiedono yfinance >= 1.7 (requirements.txt): prima yf.download teneva
+        # risultati ed errori in variabili globali condivise tra i thread.
+        with span('yahoo.download', 'network', ticker=t) as yahoo_span:
+            hist = yf.download(t, start=start_date, end=end_date, progress=False, auto_adjust=False, threads=False)
+            yahoo_span['rows_out'] = len(hist)
+        return hist
+
+    # 2. Download in parallelo; i risultati si elaborano man mano che arrivano
+    for done, (item, hist) in enumerate(map_blocking(_download, downloads), start=1):
+        m_id, t = item[0], item[1]
+        reporter.progress(done / len(downloads), text=f"Scaricato {t} ({done}/{len(downloads)})")
         try:
-            label = f"{t} {'(venduto)' if not is_owned else ''}"
-            bar.progress((i + 1) / len(mapping_ids), text=f"Scaricamento {label} dal {start_date}...")
-            
-            # Scarica solo il delta mancante (auto_adjust=False per prezzi Close reali)
-            hist = yf.download(t, start=start_date, end=end_date, progress=False, auto_adjust=False)
-            
+            if isinstance(hist, Exception):
+                raise hist
+
             if not hist.empty:
                 # Gestione colonne MultiIndex (fix per versioni recenti di yfinance)
                 if isinstance(hist.columns, pd.MultiIndex):
@@ -580,10 +640,10 @@ def sync_prices(df_trans, df_map):
         except Exception as e:
             errors.append(f"{t}: {str(e)}")
             
-    bar.empty()
+    reporter.done()
 
     if errors:
-        st.warning(f"Errori nel download: {'; '.join(errors)}")
+        reporter.warning(f"Errori nel download: {'; '.join(errors)}", tickers_in_errore=len(errors))
 
     if new_data:
         df_new = pd.concat(new_data, ignore_index=True)
@@ -597,9 +657,11 @@ def sync_prices(df_trans, df_map):
         added_count = len(df_combined) - len(df_prices_all)
         
         if added_count > 0:
-            save_data(df_combined.sort_values(['mapping_id', 'date']), "prices", method='replace')
-            st.success(f"✅ Aggiornati {added_count} prezzi.")
+            if not save_data(df_combined.sort_values(['mapping_id', 'date']), "prices", method='replace'):
+                reporter.error("Salvataggio dei prezzi non riuscito.")
+                return 0
+            reporter.success(f"✅ Aggiornati {added_count} prezzi.", prezzi_aggiunti=added_count)
             return added_count
     
-    st.info("✅ Prezzi già allineati.")
+    reporter.info("✅ Prezzi già allineati.")
     return 0
\ No newline at end of file
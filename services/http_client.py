@@ -0,0 +1,118 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+from services.tracing import add_bytes, bind_trace, capture_trace
+
+# --- I/O DI RETE ASINCRONO CON FACCIATA SINCRONA ---
+# Le chiamate di rete (JustETF via HTTP, Yahoo via yfinance) girano su un unico event loop in un
+# thread daemon del processo, così si sovrappongono invece di sommarsi. Il client httpx è
+# condiviso: connessioni keep-alive riusate tra le chiamate e tra i rerun di Streamlit.
+# Le pagine e i servizi restano sincroni e usano la facciata: run_sync per una coroutine,
+# map_blocking per eseguire in parallelo una funzione bloccante (yfinance) su più elementi.
+# httpx si importa al primo uso, come le altre dipendenze di rete, per non rallentare l'avvio delle pagine.
+TIMEOUT_S = 15.0
+CONNECT_TIMEOUT_S = 5.0
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+# Richieste contemporanee verso lo stesso host: oltre, i siti iniziano a rispondere 429
+HOST_CONCURRENCY = 4
+# Chiamate bloccanti contemporanee (thread di asyncio.to_thread)
+BLOCKING_CONCURRENCY = 4
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept-Language": "it-IT,it;q=0.9,en;q=0.8",
+}
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+# Oggetti legati al loop: creati al primo uso dentro il loop stesso
+_client = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+_blocking_limit: Optional[asyncio.Semaphore] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop condiviso, avviato una sola volta per processo in un thread daemon."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="portfolio-io", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def get_client():
+    """Client httpx.AsyncClient condiviso (va usato dentro il loop di questo modulo)."""
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def fetch(url: str, method: str = 'GET', *, headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None, **kwargs: Any):
+    """
+    Richiesta HTTP col client condiviso, al massimo HOST_CONCURRENCY per host alla volta.
+    timeout in secondi sovrascrive quello totale del client. Restituisce la httpx.Response;
+    i byte della risposta vanno allo span corrente. Gli errori di rete si propagano.
+    """
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+    async with _host_limits[host]:
+        client = get_client()
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        response = await client.request(method, url, headers=headers, **kwargs)
+    add_bytes(len(response.content))
+    return response
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Esegue una funzione bloccante in un thread, al massimo BLOCKING_CONCURRENCY alla volta."""
+    global _blocking_limit
+    if _blocking_limit is None:
+        _blocking_limit = asyncio.Semaphore(BLOCKING_CONCURRENCY)
+    async with _blocking_limit:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+async def _traced(coro: Awaitable[Any], captured: tuple) -> Any:
+    with bind_trace(captured):
+        return await coro
+
+
+def submit(coro: Awaitable[Any]) -> concurrent.futures.Future:
+    """Avvia la coroutine sul loop condiviso; gli span finiscono nella traccia di chi la avvia."""
+    return asyncio.run_coroutine_threadsafe(_traced(coro, capture_trace()), _get_loop())
+
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Facciata sincrona: esegue la coroutine sul loop condiviso e ne attende il risultato."""
+    return submit(coro).result(timeout)
+
+
+def map_blocking(func: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Tuple[Any, Any]]:
+    """
+    Applica func a ogni elemento in parallelo (con il limite di BLOCKING_CONCURRENCY) e restituisce
+    le coppie (elemento, risultato) man mano che terminano. Se func solleva un'eccezione, il
+    risultato è l'eccezione stessa: chi chiama decide come riportarla. L'iterazione avviene nel
+    thread di chi chiama, che può quindi aggiornare l'interfaccia a ogni risultato.
+    """
+    futures = {submit(run_blocking(func, item)): item for item in items}
+    for future in concurrent.futures.as_completed(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = e
+        yield futures[future], result
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+import pandas as pd
+
+from database.connection import upsert_networth_snapshots, save_allocation_json
+from database.data_context import DataContext, decode_categories
+from services.data_service import (
+    sync_prices,
+    calculate_net_worth_snapshot,
+    backfill_net_worth,
+    fetch_justetf_allocation_robust,
+)
+from services.reporting import Reporter, get_reporter
+
+# --- JOB DI MANUTENZIONE DEI DATI ---
+# Le operazioni lunghe della pagina Gestione Dati, eseguibili senza interfaccia (cli.py, scheduler).
+# Ogni job legge le tabelle da un DataContext, riporta messaggi e avanzamento al reporter e
+# restituisce un dizionario con l'esito: 'ok', 'partial' (alcuni elementi non riusciti) o 'failed'.
+
+
+def _result(job: str, status: str, **counts: Any) -> Dict[str, Any]:
+    return {'job': job, 'status': status, **counts}
+
+
+def _tables(ctx: DataContext, *names: str) -> Dict[str, pd.DataFrame]:
+    """Copie modificabili delle tabelle: i servizi normalizzano le date sul posto."""
+    return {name: decode_categories(ctx.table(name)) for name in names}
+
+
+def run_sync_prices(ctx: Optional[DataContext] = None, reporter: Optional[Reporter] = None) -> Dict[str, Any]:
+    """Sincronizzazione incrementale dei prezzi di tutti gli asset mappati."""
+    ctx, reporter = ctx or DataContext(), get_reporter(reporter)
+    t = _tables(ctx, 'transactions', 'mapping')
+    if t['transactions'].empty or t['mapping'].empty:
+        reporter.error("Database transazioni o mappatura vuoto. Impossibile aggiornare i prezzi.")
+        return _result('sync-prices', 'failed', prezzi_aggiunti=0)
+    n_errors, n_warnings = len(reporter.errors), len(reporter.warnings)
+    added = sync_prices(t['transactions'], t['mapping'], reporter=reporter)
+    failed = len(reporter.errors) > n_errors
+    # Avvisi = download falliti per alcuni ticker
+    partial = len(reporter.warnings) > n_warnings
+    return _result('sync-prices', 'failed' if failed else 'partial' if partial else 'ok', prezzi_aggiunti=added)
+
+
+def run_snapshot(snapshot_date=None, ctx: Optional[DataContext] = None, reporter: Optional[Reporter] = None) -> Dict[str, Any]:
+    """Calcola e salva nello storico il patrimonio netto alla data indicata (default: oggi)."""
+    ctx, reporter = ctx or DataContext(), get_reporter(reporter)
+    snapshot_date = pd.Timestamp(snapshot_date or datetime.now().date()).normalize()
+    if snapshot_date > pd.Timestamp.now().normalize():
+        reporter.error(f"Data dello snapshot nel futuro: {snapshot_date.date()}")
+        return _result('snapshot', 'failed')
+    t = _tables(ctx, 'transactions', 'mapping', 'prices', 'budget')
+    if t['transactions'].empty and t['budget'].empty:
+        # Anche una lettura fallita arriva qui vuota: uno snapshot a zero non va salvato
+        reporter.error("Nessuna transazione né movimento di budget: niente da calcolare.")
+        return _result('snapshot', 'failed')
+    net_worth, assets_value, liquidity = calculate_net_worth_snapshot(
+        snapshot_date, t['transactions'], t['mapping'], t['prices'], t['budget']
+    )
+    snapshot = pd.DataFrame([{'date': snapshot_date, 'net_worth': float(net_worth),
+                              'assets_value': float(assets_value), 'liquidity': float(liquidity)}])
+    if not upsert_networth_snapshots(snapshot):
+        reporter.error("Salvataggio dello snapshot non riuscito.")
+        return _result('snapshot', 'failed')
+    reporter.success(f"Snapshot salvato al {snapshot_date.date()}: € {net_worth:,.2f}",
+                     data=str(snapshot_date.date()), net_worth=round(float(net_worth), 2),
+                     assets_value=round(float(assets_value), 2), liquidity=round(float(liquidity), 2))
+    return _result('snapshot', 'ok', data=str(snapshot_date.date()), net_worth=round(float(net_worth), 2))
+
+
+def run_backfill_networth(start=None, end=None, freq: str = 'ME', overwrite: bool = False,
+                          ctx: Optional[DataContext] = None, reporter: Optional[Reporter] = None) -> Dict[str, Any]:
+    """
+    Riempie i buchi dello storico del patrimonio con uno snapshot per ogni data della frequenza
+    indicata (default: fine mese), dalla prima transazione a oggi. Le date già presenti si
+    ricalcolano solo con overwrite=True.
+    """
+    ctx, reporter = ctx or DataContext(), get_reporter(reporter)
+    t = _tables(ctx, 'transactions', 'mapping', 'prices', 'budget')
+    if t['transactions'].empty and t['budget'].empty:
+        reporter.error("Nessuna transazione né movimento di budget: niente da ricostruire.")
+        return _result('backfill-networth', 'failed', snapshot=0)
+
+    first = min(pd.to_datetime(df['date']).min() for df in (t['transactions'], t['budget']) if not df.empty)
+    start = pd.Timestamp(start).normalize() if start else first.normalize()
+    end = pd.Timestamp(end).normalize() if end else pd.Timestamp.now().normalize()
+    dates = pd.date_range(start, end, freq=freq).normalize()
+
+    history = ctx.networth_history
+    if not overwrite and not history.empty and 'net_worth' in history.columns:
+        existing = set(pd.to_datetime(history.dropna(subset=['net_worth'])['date']).dt.normalize())
+        dates = dates[~dates.isin(existing)]
+    if dates.empty:
+        reporter.info("Storico del patrimonio già completo per il periodo richiesto.")
+        return _result('backfill-networth', 'ok', snapshot=0)
+
+    reporter.info(f"Calcolo di {len(dates)} snapshot dal {dates[0].date()} al {dates[-1].date()}...",
+                  snapshot=len(dates), freq=freq)
+    snapshots = backfill_net_worth(dates, t['transactions'], t['mapping'], t['prices'], t['budget'])
+    snapshots = snapshots[snapshots['net_worth'] >= 0]
+    if snapshots.empty:
+        reporter.warning("Nessuno snapshot con patrimonio valido da salvare.")
+        return _result('backfill-networth', 'partial', snapshot=0)
+    # Solo le date calcolate: lo storico letto serve a scegliere le date, non si riscrive
+    if not upsert_networth_snapshots(snapshots):
+        reporter.error("Salvataggio dello storico non riuscito.")
+        return _result('backfill-networth', 'failed', snapshot=0)
+    reporter.success(f"Salvati {len(snapshots)} snapshot del patrimonio.", snapshot=len(snapshots))
+    return _result('backfill-networth', 'ok', snapshot=len(snapshots))
+
+
+def run_refresh_allocations(isins: Optional[Iterable[str]] = None, older_than_days: Optional[int] = None,
+                            ctx: Optional[DataContext] = None, reporter: Optional[Reporter] = None) -> Dict[str, Any]:
+    """
+    Riscarica da JustETF l'allocazione geografica e settoriale degli asset posseduti
+    (o degli ISIN indicati), saltando quelli aggiornati da meno di older_than_days giorni.
+    """
+    ctx, reporter = ctx or DataContext(), get_reporter(reporter)
+    t = _tables(ctx, 'transactions', 'mapping', 'asset_allocation')
+    df_trans, df_map, df_alloc = t['transactions'], t['mapping'], t['asset_allocation']
+    if df_map.empty:
+        reporter.error("Mappatura vuota: nessun asset da aggiornare.")
+        return _result('refresh-allocations', 'failed', aggiornati=0, falliti=0)
+
+    if isins:
+        isins = list(isins)
+        targets = df_map[df_map['isin'].isin(isins)]
+        unknown = sorted(set(isins) - set(targets['isin']))
+        if unknown:
+            reporter.warning(f"ISIN non presenti nella mappatura: {', '.join(unknown)}", isin_sconosciuti=len(unknown))
+        if targets.empty:
+            return _result('refresh-allocations', 'failed', aggiornati=0, falliti=len(unknown))
+    else:
+        holdings = df_trans.groupby('isin')['quantity'].sum() if not df_trans.empty else pd.Series(dtype=float)
+        owned = holdings[holdings > 0.001].index
+        targets = df_map[df_map['isin'].isin(owned) & (df_map['category'] != 'Liquidità')]
+
+    if older_than_days is not None and not df_alloc.empty and 'last_updated' in df_alloc.columns:
+        cutoff = pd.Timestamp.now() - timedelta(days=older_than_days)
+        updated = pd.to_datetime(df_alloc['last_updated'], errors='coerce')
+        fresh_ids = set(df_alloc.loc[updated >= cutoff, 'mapping_id'])
+        targets = targets[~targets['id'].isin(fresh_ids)]
+
+    updated_count, failed = 0, []
+    for i, row in enumerate(targets.itertuples(index=False)):
+        reporter.progress(i / max(len(targets), 1), text=f"Allocazione {row.ticker} ({row.isin})...")
+        try:
+            geo_dict, sec_dict = fetch_justetf_allocation_robust(row.isin)
+        except Exception as e:
+            geo_dict, sec_dict = {}, {}
+            reporter.warning(f"Errore durante lo scraping di {row.isin}: {e}", isin=row.isin)
+        if not (geo_dict or sec_dict):
+            failed.append(row.isin)
+            continue
+        if save_allocation_json(int(row.id), geo_dict, sec_dict):
+            updated_count += 1
+        else:
+            failed.append(row.isin)
+    reporter.done()
+
+    if failed:
+        reporter.warning(f"Allocazione non aggiornata per: {', '.join(failed)}", falliti=len(failed))
+    reporter.success(f"Allocazioni aggiornate: {updated_count} su {len(targets)}.", aggiornati=updated_count)
+    status = 'ok' if not failed else ('partial' if updated_count else 'failed')
+    return _result('refresh-allocations', status, aggiornati=updated_count, falliti=len(failed))
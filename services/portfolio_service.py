@@ -1,7 +1,10 @@
+import streamlit as st
+from services.tracing import traced
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
+@traced('service')
 def calculate_portfolio_view(df_trans, df_map, df_prices):
     if df_trans.empty or df_map.empty:
         return pd.DataFrame()
@@ -17,7 +20,7 @@ def calculate_portfolio_view(df_trans, df_map, df_prices):
         last_p = df_prices.sort_values('date').groupby('mapping_id').tail(1).set_index('mapping_id')['close_price']
     else:
         last_p = pd.Series(dtype='float64')
-    view = df_full.groupby(['product', 'mapping_id', 'category']).agg(
+    view = df_full.groupby(['product', 'mapping_id', 'category'], observed=True).agg(
         quantity=('quantity', 'sum'),
         local_value=('local_value', 'sum'),
         total_fees=('fees', 'sum')
@@ -33,33 +36,52 @@ def calculate_portfolio_view(df_trans, df_map, df_prices):
     view = view.merge(df_map[['id', 'ticker']], left_on='mapping_id', right_on='id', how='left')
     return view.fillna({'curr_price': 0, 'mkt_val': 0, 'pnl': 0, 'pnl%': 0})
 
+@st.cache_data(show_spinner=False)
+@traced('service')
+def build_liquidity_index(df_budget: pd.DataFrame) -> pd.Series:
+    """Costruisce la serie del saldo di cassa a fine giornata, indicizzata per data e ordinata.
+    Prima del 'Saldo Iniziale' il saldo è la somma cumulata dei movimenti; dal giorno del saldo
+    si riparte dal suo importo, ignorando gli altri movimenti di quel giorno e quelli precedenti.
+    Gli investimenti sono le uscite con categoria 'Investimento' nel budget.
+    La cache è legata al contenuto del budget: la serie si ricalcola solo quando i dati cambiano.
+    """
+    if df_budget.empty:
+        return pd.Series(dtype='float64', index=pd.DatetimeIndex([], name='date'), name='liquidity')
+    dates = pd.to_datetime(df_budget['date']).dt.normalize()
+    amount = df_budget['amount'].astype(float)
+    is_saldo = df_budget['category'] == 'Saldo Iniziale'
+    # Flusso di cassa per riga: + entrate (escluso il saldo), - uscite (investimenti inclusi)
+    flow = np.where((df_budget['type'] == 'Entrata') & ~is_saldo, amount,
+                    np.where(df_budget['type'] == 'Uscita', -amount, 0.0))
+    daily = pd.Series(flow, index=dates.to_numpy()).groupby(level=0).sum().sort_index()
+    if is_saldo.any():
+        start_date = dates[is_saldo].min()
+        base_liquidity = amount[is_saldo & (dates == start_date)].iloc[0]
+        balance = pd.concat([
+            daily[daily.index < start_date].cumsum(),
+            pd.Series([base_liquidity], index=[start_date]),
+            base_liquidity + daily[daily.index > start_date].cumsum(),
+        ])
+    else:
+        balance = daily.cumsum()
+    balance.index = pd.DatetimeIndex(balance.index, name='date')
+    return balance.rename('liquidity')
+
+def liquidity_at(liquidity_index: pd.Series, date) -> float:
+    """Restituisce il saldo di cassa a fine giornata alla data indicata con una ricerca binaria."""
+    pos = liquidity_index.index.searchsorted(pd.Timestamp(date), side='right') - 1
+    return float(liquidity_index.iloc[pos]) if pos >= 0 else 0.0
+
+@traced('service')
 def calculate_liquidity(df_budget: pd.DataFrame, df_trans: pd.DataFrame = None) -> tuple[float, str]:
     """Calcola la liquidità finale partendo dal saldo iniziale o, in sua assenza, dai totali.
     Gli investimenti sono calcolati dalla categoria 'Investimento' nel budget, non dalle transazioni DEGIRO.
     """
     if df_budget.empty:
         return 0.0, "Liquidità"
-    df_budget_sorted = df_budget.sort_values('date')
-    initial_balance_entry = df_budget_sorted[df_budget_sorted['category'] == 'Saldo Iniziale'].head(1)
-    if not initial_balance_entry.empty:
-        start_date = initial_balance_entry['date'].iloc[0]
-        base_liquidity = initial_balance_entry['amount'].iloc[0]
-        budget_to_sum = df_budget_sorted[df_budget_sorted['date'] > start_date]
-        other_entrate = budget_to_sum[(budget_to_sum['type'] == 'Entrata') & (budget_to_sum['category'] != 'Saldo Iniziale')]['amount'].sum()
-        # Uscite normali (escluso Investimento)
-        all_uscite = budget_to_sum[(budget_to_sum['type'] == 'Uscita') & (budget_to_sum['category'] != 'Investimento')]['amount'].sum()
-        # Investimenti dal budget
-        investments = budget_to_sum[(budget_to_sum['type'] == 'Uscita') & (budget_to_sum['category'] == 'Investimento')]['amount'].sum()
-        final_liquidity = base_liquidity + other_entrate - all_uscite - investments
-    else:
-        total_entrate = df_budget['amount'][df_budget['type'] == 'Entrata'].sum()
-        # Uscite normali (escluso Investimento)
-        total_uscite = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] != 'Investimento')]['amount'].sum()
-        # Investimenti dal budget
-        total_investito = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] == 'Investimento')]['amount'].sum()
-        final_liquidity = total_entrate - total_uscite - total_investito
-    return final_liquidity, "Liquidità Calcolata"
+    return float(build_liquidity_index(df_budget).iloc[-1]), "Liquidità Calcolata"
 
+@traced('service')
 def get_historical_portfolio(df_trans, df_map, df_prices):
     if df_prices.empty or df_trans.empty or df_map.empty:
         return pd.DataFrame()
@@ -1,6 +1,6 @@
 import pandas as pd
-import yfinance as yf
 from typing import Dict, List, Tuple, Optional
+from services.tracing import traced
 
 def validate_asset_class_allocation(asset_classes: Dict[str, float]) -> Tuple[bool, Optional[str]]:
     """
@@ -39,6 +39,7 @@ def validate_ticker_distribution(pct_inputs: Dict[str, float], category: str) ->
         under = 100 - total_pct
         return False, f"La somma delle percentuali per {category} è sotto 100% di {under:.1f}%."
 
+@traced('network', name='yahoo.ticker_price')
 def get_ticker_price(ticker: str) -> Optional[float]:
     """
     Scarica il prezzo corrente di un ticker da Yahoo Finance.
@@ -49,6 +50,7 @@ def get_ticker_price(ticker: str) -> Optional[float]:
     Returns:
         Prezzo corrente o None se non trovato
     """
+    import yfinance as yf
     try:
         price_data = yf.Ticker(ticker).history(period='1d')
         if not price_data.empty:
@@ -83,6 +85,7 @@ def build_ticker_targets(
         ticker_targets[ticker] = target_pct_total * new_total
     return ticker_targets
 
+@traced('service')
 def calculate_rebalancing_operations(
     ticker_targets: Dict[str, float],
     assets_view: pd.DataFrame,
@@ -175,6 +178,7 @@ def check_budget_alignment(
     
     return True, None
 
+@traced('service')
 def get_portfolio_summary(assets_view: pd.DataFrame) -> Dict[str, float]:
     """
     Calcola le metriche di riepilogo del portafoglio.
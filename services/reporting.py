@@ -0,0 +1,96 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+# --- MESSAGGI E AVANZAMENTO DEI SERVIZI ---
+# I servizi lunghi (sincronizzazione prezzi, snapshot, allocazioni) non chiamano st.* direttamente
+# ma un Reporter: nell'app è StreamlitReporter (messaggi e barra di avanzamento come prima),
+# dalla riga di comando o dallo scheduler è LogReporter, che scrive log strutturati.
+
+
+class Reporter:
+    """
+    Interfaccia comune: messaggi per livello e avanzamento (frazione 0-1).
+    Tiene il conto di avvisi ed errori, da cui chi lancia un job ricava l'esito.
+    """
+
+    def __init__(self):
+        self.warnings: List[str] = []
+        self.errors: List[str] = []
+
+    def _emit(self, level: str, message: str, fields: Dict[str, Any]) -> None:
+        pass
+
+    def info(self, message: str, **fields: Any) -> None:
+        self._emit('info', message, fields)
+
+    def success(self, message: str, **fields: Any) -> None:
+        self._emit('success', message, fields)
+
+    def warning(self, message: str, **fields: Any) -> None:
+        self.warnings.append(message)
+        self._emit('warning', message, fields)
+
+    def error(self, message: str, **fields: Any) -> None:
+        self.errors.append(message)
+        self._emit('error', message, fields)
+
+    def progress(self, fraction: float, text: Optional[str] = None) -> None:
+        pass
+
+    def done(self) -> None:
+        """Chiude l'avanzamento (nell'app rimuove la barra)."""
+        pass
+
+
+class StreamlitReporter(Reporter):
+    """Messaggi come st.info/st.success/st.warning/st.error e avanzamento con st.progress."""
+
+    def __init__(self):
+        super().__init__()
+        self._bar = None
+
+    def _emit(self, level: str, message: str, fields: Dict[str, Any]) -> None:
+        getattr(st, level)(message)
+
+    def progress(self, fraction: float, text: Optional[str] = None) -> None:
+        if self._bar is None:
+            self._bar = st.progress(0, text=text)
+        if text is None:
+            self._bar.progress(fraction)
+        else:
+            self._bar.progress(fraction, text=text)
+
+    def done(self) -> None:
+        if self._bar is not None:
+            self._bar.empty()
+            self._bar = None
+
+
+class LogReporter(Reporter):
+    """Scrive ogni messaggio sul logger con il nome del job e i campi strutturati in `extra`."""
+
+    LEVELS = {'info': logging.INFO, 'success': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+    def __init__(self, job: str, logger: Optional[logging.Logger] = None):
+        super().__init__()
+        self.job = job
+        self.logger = logger or logging.getLogger('portfolio.jobs')
+        self._last_decile = -1
+
+    def _emit(self, level: str, message: str, fields: Dict[str, Any]) -> None:
+        self.logger.log(self.LEVELS[level], message, extra={'job': self.job, 'event': level, 'fields': fields})
+
+    def progress(self, fraction: float, text: Optional[str] = None) -> None:
+        # Un messaggio ogni 10% (o quando cambia il testo), per non riempire il log
+        decile = int(fraction * 10)
+        if text or decile != self._last_decile:
+            self._last_decile = decile
+            self.logger.debug(text or "avanzamento", extra={'job': self.job, 'event': 'progress',
+                                                           'fields': {'fraction': round(fraction, 3)}})
+
+
+def get_reporter(reporter: Optional[Reporter] = None) -> Reporter:
+    """Il reporter passato o, se assente, quello dell'app Streamlit."""
+    return reporter if reporter is not None else StreamlitReporter()
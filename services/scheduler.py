@@ -0,0 +1,238 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+import streamlit as st
+
+from database.connection import get_db_connection
+from database.job_store import ensure_jobs_table, acquire_lock, release_lock, job_times
+from database.data_context import DataContext, load_table
+from services import jobs
+from services.reporting import LogReporter
+
+# --- SCHEDULER DEI JOB DI MANUTENZIONE ---
+# Esegue i job di services/jobs.py a orari fissi (ora di Milano), dentro l'app (thread in
+# background, se abilitato) oppure come processo a parte (python cli.py scheduler).
+# Un job è "dovuto" se l'ultimo orario previsto è passato e l'ultima esecuzione registrata in
+# scheduled_jobs è precedente: dopo un periodo di inattività si recupera al primo controllo.
+# Ogni job riceve l'orario previsto per cui gira (slot) e l'ultimo già eseguito, così un
+# recupero lavora sulla data giusta e non su quella del momento in cui parte.
+# L'ultima esecuzione di ogni job si legge all'avvio e si tiene in memoria: tra un orario e
+# l'altro lo scheduler dorme senza interrogare il database (il compute Neon può sospendersi) e
+# torna sul DB solo quando uno slot o un nuovo tentativo è dovuto.
+TIMEZONE = ZoneInfo('Europe/Rome')
+# Attesa minima e massima tra due controlli (locali, senza query)
+CHECK_INTERVAL_S = 60.0
+MAX_WAIT_S = 3600.0
+SCHEDULER_ENV = 'PORTFOLIO_SCHEDULER'
+
+
+@dataclass(frozen=True)
+class JobSchedule:
+    """Job da eseguire all'ora indicata nei giorni della settimana indicati (0 = lunedì)."""
+    name: str
+    # run(ctx, reporter, slot, slot precedente già eseguito o None)
+    run: Callable[[DataContext, LogReporter, datetime, Optional[datetime]], Dict[str, Any]]
+    hour: int
+    minute: int = 0
+    weekdays: tuple = (0, 1, 2, 3, 4, 5, 6)
+    # Durata massima prevista: oltre, il lock scade e un'altra istanza può riprendere il job
+    lock_ttl_s: float = 900.0
+
+    def last_slot(self, now: datetime) -> Optional[datetime]:
+        """Ultimo orario previsto non successivo a now (nell'ultima settimana)."""
+        for days_back in range(8):
+            day = (now - timedelta(days=days_back)).date()
+            slot = datetime(day.year, day.month, day.day, self.hour, self.minute, tzinfo=now.tzinfo)
+            if slot.weekday() in self.weekdays and slot <= now:
+                return slot
+        return None
+
+    def next_slot(self, now: datetime) -> Optional[datetime]:
+        """Primo orario previsto successivo a now (nella prossima settimana)."""
+        for days_ahead in range(8):
+            day = (now + timedelta(days=days_ahead)).date()
+            slot = datetime(day.year, day.month, day.day, self.hour, self.minute, tzinfo=now.tzinfo)
+            if slot.weekday() in self.weekdays and slot > now:
+                return slot
+        return None
+
+
+def run_snapshot_for_slot(ctx: DataContext, reporter: LogReporter, slot: datetime,
+                          previous: Optional[datetime]) -> Dict[str, Any]:
+    """
+    Snapshot del giorno dello slot (non di oggi: un recupero la mattina dopo salva la sera prima).
+    Se sono saltati più slot, ricostruisce con il backfill giornaliero tutti i giorni mancanti.
+    """
+    if previous is not None and previous.date() < slot.date() - timedelta(days=1):
+        return jobs.run_backfill_networth(start=previous.date() + timedelta(days=1), end=slot.date(), freq='D',
+                                          ctx=ctx, reporter=reporter)
+    return jobs.run_snapshot(slot.date(), ctx=ctx, reporter=reporter)
+
+
+SCHEDULE: List[JobSchedule] = [
+    # Dopo la chiusura di Borsa Italiana (17:30), nei giorni feriali
+    JobSchedule('sync-prices', lambda ctx, r, slot, previous: jobs.run_sync_prices(ctx=ctx, reporter=r),
+                hour=18, minute=30, weekdays=(0, 1, 2, 3, 4)),
+    # Dopo la sincronizzazione dei prezzi, così lo snapshot usa le chiusure del giorno
+    JobSchedule('snapshot', run_snapshot_for_slot, hour=23, minute=0),
+    JobSchedule('refresh-allocations',
+                lambda ctx, r, slot, previous: jobs.run_refresh_allocations(older_than_days=7, ctx=ctx, reporter=r),
+                hour=3, minute=0, weekdays=(6,), lock_ttl_s=3600.0),
+]
+
+
+@dataclass
+class Scheduler:
+    """Controlla periodicamente i job dovuti e li esegue uno alla volta, con lock sul database."""
+    engine: Any
+    schedule: List[JobSchedule] = field(default_factory=lambda: list(SCHEDULE))
+    owner: str = field(default_factory=lambda: f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}")
+    logger: logging.Logger = field(default_factory=lambda: logging.getLogger('portfolio.jobs'))
+
+    def __post_init__(self):
+        ensure_jobs_table(self.engine)
+        self._stop = threading.Event()
+        # Copia locale di scheduled_jobs: ultima esecuzione e istante prima del quale non riprovare
+        self._last_runs: Dict[str, Optional[float]] = {}
+        self._not_before: Dict[str, float] = {}
+        self._refresh()
+
+    def _refresh(self, name: Optional[str] = None) -> None:
+        """Rilegge dal database lo stato di un job (o di tutti)."""
+        for job_name, times in job_times(self.engine, name).items():
+            self._last_runs[job_name] = times['last_run_at']
+            self._not_before[job_name] = times['locked_until'] or 0.0
+
+    def _last_run(self, name: str) -> Optional[float]:
+        return self._last_runs.get(name)
+
+    def due_jobs(self, now: Optional[datetime] = None) -> List[JobSchedule]:
+        """Job il cui ultimo orario previsto è successivo all'ultima esecuzione registrata."""
+        now = now or datetime.now(TIMEZONE)
+        due = []
+        for job in self.schedule:
+            slot = job.last_slot(now)
+            last_run = self._last_run(job.name)
+            if slot is not None and (last_run is None or last_run < slot.timestamp()):
+                due.append(job)
+        return due
+
+    def run_job(self, job: JobSchedule, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Esegue il job per il suo ultimo orario previsto se si ottiene il lock; None se un'altra
+        istanza lo sta eseguendo, lo ha già eseguito per quell'orario o è in attesa di riprovare.
+        """
+        slot = job.last_slot(now or datetime.now(TIMEZONE))
+        if slot is None or not acquire_lock(self.engine, job.name, self.owner, job.lock_ttl_s, slot=slot.timestamp()):
+            self.logger.debug("Job già eseguito, in esecuzione altrove o in attesa di riprovare",
+                             extra={'job': job.name, 'event': 'skipped', 'fields': {}})
+            # Un'altra istanza lo ha eseguito o lo tiene bloccato: si riallinea la copia locale
+            self._refresh(job.name)
+            return None
+        started = time.time()
+        reporter = LogReporter(job.name, self.logger)
+        self._refresh(job.name)
+        # Slot coperto dall'ultima esecuzione registrata (un recupero alle 8 copre lo slot delle 23)
+        last_run = self._last_run(job.name)
+        previous = job.last_slot(datetime.fromtimestamp(last_run, slot.tzinfo)) if last_run is not None else None
+        try:
+            # Dati letti senza cache: il job deve vedere lo stato attuale del database
+            result = job.run(DataContext(loader=load_table.__wrapped__), reporter, slot, previous)
+        except Exception as e:
+            self.logger.exception(f"Job interrotto: {e}", extra={'job': job.name, 'event': 'result', 'fields': {'status': 'failed'}})
+            result = {'job': job.name, 'status': 'failed', 'errore': str(e)}
+        retry_at = release_lock(self.engine, job.name, self.owner, result['status'], result, started)
+        if retry_at is None:
+            self._last_runs[job.name], self._not_before[job.name] = started, 0.0
+        else:
+            self._not_before[job.name] = retry_at
+        self.logger.info("Job terminato", extra={'job': job.name, 'event': 'result',
+                                                 'fields': {**result, 'durata_ms': round((time.time() - started) * 1000, 1)}})
+        return result
+
+    def run_pending(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Esegue in sequenza i job dovuti e restituisce gli esiti di quelli eseguiti."""
+        now = now or datetime.now(TIMEZONE)
+        results = []
+        for job in self.due_jobs(now):
+            if now.timestamp() < self._not_before.get(job.name, 0.0):
+                continue
+            result = self.run_job(job, now)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def seconds_until_next(self, now: Optional[datetime] = None) -> float:
+        """
+        Secondi fino al prossimo slot o nuovo tentativo, calcolati dalla copia locale senza
+        interrogare il database (tra CHECK_INTERVAL_S e MAX_WAIT_S).
+        """
+        now = now or datetime.now(TIMEZONE)
+        due = {job.name for job in self.due_jobs(now)}
+        wake = []
+        for job in self.schedule:
+            if job.name in due:
+                wake.append(self._not_before.get(job.name, 0.0))
+            else:
+                slot = job.next_slot(now)
+                if slot is not None:
+                    wake.append(slot.timestamp())
+        wait = min(wake, default=now.timestamp() + MAX_WAIT_S) - now.timestamp()
+        return min(max(wait, CHECK_INTERVAL_S), MAX_WAIT_S)
+
+    def run_forever(self) -> None:
+        """Ciclo di controllo fino a stop(); gli errori di un giro non fermano lo scheduler."""
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                self.logger.exception(f"Controllo dei job non riuscito: {e}", extra={'job': 'scheduler', 'event': 'error', 'fields': {}})
+            self._stop.wait(self.seconds_until_next())
+
+    def start(self) -> threading.Thread:
+        """Avvia il ciclo in un thread daemon."""
+        thread = threading.Thread(target=self.run_forever, name="portfolio-scheduler", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def scheduler_enabled(secrets_value=None) -> bool:
+    """Scheduler nell'app: variabile d'ambiente, poi secrets (disattivo se non configurato)."""
+    value = os.environ.get(SCHEDULER_ENV)
+    if value is None:
+        value = secrets_value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+@st.cache_resource
+def start_app_scheduler() -> Optional[Scheduler]:
+    """
+    Avvia una sola volta per processo lo scheduler in un thread dell'app, se attivato con
+    PORTFOLIO_SCHEDULER=1 o [scheduler] enabled = true nei secrets. Più istanze dell'app
+    possono averlo attivo insieme: il lock su scheduled_jobs evita esecuzioni doppie.
+    """
+    try:
+        secrets_value = dict(st.secrets.get("scheduler", {})).get("enabled")
+    except Exception:
+        secrets_value = None
+    if not scheduler_enabled(secrets_value):
+        return None
+    try:
+        scheduler = Scheduler(get_db_connection().engine)
+    except Exception as e:
+        logging.getLogger('portfolio.jobs').warning(f"Scheduler non avviato: {e}",
+                                                    extra={'job': 'scheduler', 'event': 'error', 'fields': {}})
+        return None
+    scheduler.start()
+    return scheduler
@@ -0,0 +1,195 @@
+import streamlit as st
+import pandas as pd
+import contextvars
+import inspect
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# --- TRACCIAMENTO DEI TEMPI PER RERUN ---
+# Ogni span registra durata, righe in ingresso/uscita e byte trasferiti. Gli span si annidano
+# (un servizio che legge dal DB contiene lo span del DB), quindi il riepilogo per tipo usa il
+# tempo "proprio" di ogni span, al netto dei figli: DB, rete e calcolo non vengono contati due volte.
+TRACE_KINDS = {
+    'db': "Database",
+    'network': "Rete (Yahoo/JustETF)",
+    'service': "Calcolo (pandas)",
+}
+MAX_SPANS_PER_TRACE = 2000
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+# Traccia a cui legare gli span eseguiti fuori dal thread della sessione (loop di services/http_client.py)
+_bound_trace: contextvars.ContextVar = contextvars.ContextVar('bound_trace', default=None)
+# Fuori da una sessione Streamlit (thread di lavoro, script, test) gli span finiscono qui
+_FALLBACK_TRACE: Dict[str, Any] = {'started': time.time(), 'spans': []}
+
+
+def _active_trace() -> Dict[str, Any]:
+    """Traccia del rerun corrente: in session_state se c'è una sessione, altrimenti quella di processo."""
+    bound = _bound_trace.get()
+    if bound is not None:
+        return bound
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return _FALLBACK_TRACE
+    if '_trace' not in st.session_state:
+        st.session_state['_trace'] = {'started': time.time(), 'spans': []}
+    return st.session_state['_trace']
+
+
+def start_trace() -> None:
+    """
+    Chiude la traccia del rerun precedente (consultabile con get_last_trace) e ne apre una nuova.
+    Va chiamata all'inizio di ogni pagina: lo fa make_sidebar.
+    """
+    new_trace = {'started': time.time(), 'spans': []}
+    if get_script_run_ctx(suppress_warning=True) is None:
+        _FALLBACK_TRACE.update(new_trace)
+        return
+    if '_trace' in st.session_state:
+        st.session_state['_trace_last'] = st.session_state['_trace']
+    st.session_state['_trace'] = new_trace
+
+
+def get_last_trace() -> Optional[Dict[str, Any]]:
+    """Ultima traccia completa (rerun precedente), o None se non ce n'è ancora una."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return _FALLBACK_TRACE
+    return st.session_state.get('_trace_last')
+
+
+def _count_rows(value: Any) -> int:
+    """Righe contenute in un DataFrame/Series o in una tupla/lista che ne contiene."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(len(v) for v in value if isinstance(v, (pd.DataFrame, pd.Series)))
+    return 0
+
+
+def _count_bytes(value: Any) -> int:
+    """Stima economica (senza deep) dei byte di un DataFrame/Series restituito."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=False))
+    return 0
+
+
+@contextmanager
+def span(name: str, kind: str = 'service', **attrs):
+    """
+    Misura il blocco di codice come uno span della traccia corrente.
+    Restituisce il dizionario dello span: chi lo usa può aggiornare 'rows_out' o 'bytes'.
+    """
+    trace = _active_trace()
+    parent = _current_span.get()
+    record = {
+        'name': name, 'kind': kind, 'parent': parent['id'] if parent else None,
+        'id': len(trace['spans']), 'offset_ms': (time.time() - trace['started']) * 1000,
+        'duration_ms': 0.0, 'child_ms': 0.0, 'rows_in': 0, 'rows_out': 0, 'bytes': 0, 'error': None,
+    }
+    record.update(attrs)
+    token = _current_span.set(record)
+    t0 = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        record['duration_ms'] = (time.perf_counter() - t0) * 1000
+        _current_span.reset(token)
+        if parent is not None:
+            parent['child_ms'] += record['duration_ms']
+        if len(trace['spans']) < MAX_SPANS_PER_TRACE:
+            trace['spans'].append(record)
+
+
+def capture_trace() -> tuple:
+    """Traccia e span correnti, da riattivare con bind_trace in un altro thread o task."""
+    return _active_trace(), _current_span.get()
+
+
+@contextmanager
+def bind_trace(captured: tuple):
+    """
+    Gli span aperti nel blocco finiscono nella traccia catturata, come figli dello span catturato.
+    Gli span figli eseguiti in parallelo si sovrappongono: il loro tempo sommato può superare
+    quello del padre, il cui tempo proprio resta a zero (vedi summarize_trace).
+    """
+    trace, parent = captured
+    trace_token, span_token = _bound_trace.set(trace), _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(span_token)
+        _bound_trace.reset(trace_token)
+
+
+def add_bytes(n: int) -> None:
+    """Aggiunge n byte trasferiti allo span corrente (es. il corpo di una risposta HTTP)."""
+    record = _current_span.get()
+    if record is not None:
+        record['bytes'] += int(n)
+
+
+def traced(kind: str = 'service', name: Optional[str] = None):
+    """
+    Decoratore: registra ogni chiamata come span, con le righe dei DataFrame in ingresso
+    e in uscita e, per le letture dal DB, la dimensione del risultato.
+    Va applicato sotto @st.cache_data, così gli span misurano i calcoli effettivi e non i cache hit.
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.split('.')[-1]}.{func.__name__}"
+
+        def _close(record, result):
+            record['rows_out'] = _count_rows(result)
+            if kind == 'db':
+                record['bytes'] = _count_bytes(result)
+
+        def _rows_in(args, kwargs):
+            return sum(_count_rows(a) for a in (*args, *kwargs.values()) if isinstance(a, (pd.DataFrame, pd.Series)))
+
+        # Le coroutine si misurano dall'await alla fine, non alla creazione
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind, rows_in=_rows_in(args, kwargs)) as record:
+                    result = await func(*args, **kwargs)
+                    _close(record, result)
+                    return result
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind, rows_in=_rows_in(args, kwargs)) as record:
+                result = func(*args, **kwargs)
+                _close(record, result)
+                return result
+        return wrapper
+    return decorator
+
+
+def summarize_trace(spans: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Tempo proprio (al netto degli span figli), numero di chiamate e byte per tipo di span."""
+    if not spans:
+        return pd.DataFrame(columns=['tipo', 'chiamate', 'tempo_ms', 'byte'])
+    df = pd.DataFrame(spans)
+    df['self_ms'] = (df['duration_ms'] - df['child_ms']).clip(lower=0)
+    summary = df.groupby('kind').agg(chiamate=('name', 'size'), tempo_ms=('self_ms', 'sum'), byte=('bytes', 'sum')).reset_index()
+    summary['tipo'] = summary['kind'].map(TRACE_KINDS).fillna(summary['kind'])
+    return summary[['tipo', 'chiamate', 'tempo_ms', 'byte']].sort_values('tempo_ms', ascending=False).reset_index(drop=True)
+
+
+def trace_to_json(trace: Dict[str, Any]) -> str:
+    """Esporta una traccia (inizio, riepilogo per tipo e span) in JSON."""
+    spans = trace.get('spans', [])
+    return json.dumps({
+        'started': trace.get('started'),
+        'summary': summarize_trace(spans).to_dict(orient='records'),
+        'spans': spans,
+    }, indent=2, default=str)
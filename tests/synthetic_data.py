@@ -0,0 +1,155 @@
+"""
+Generatore deterministico di dati di portafoglio sintetici per i test di prestazione.
+
+Produce le stesse tabelle del database (transactions, mapping, prices, budget,
+asset_allocation, networth_history) con volumi configurabili: N asset, M anni di
+prezzi giornalieri, K transazioni e un budget mensile realistico. A parità di
+parametri e seed il risultato è sempre identico.
+"""
+import json
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+END_DATE = pd.Timestamp('2024-12-31')
+
+# Scale di riferimento usate dalla suite di benchmark
+SCALES = {
+    'small': {'n_assets': 5, 'years': 2, 'n_transactions': 100},
+    'medium': {'n_assets': 15, 'years': 5, 'n_transactions': 500},
+    'large': {'n_assets': 30, 'years': 10, 'n_transactions': 2000},
+}
+
+_CATEGORIES = ['Azionario'] * 6 + ['Obbligazionario'] * 3 + ['Gold']
+_COUNTRIES = ['stati uniti', 'giappone', 'regno unito', 'francia', 'germania', 'cina', 'india', 'canada']
+_SECTORS = ['tecnologia', 'finanza', 'sanità', 'industria', 'beni di consumo', 'energia']
+_EXPENSES = ['Affitto/Casa', 'Spesa Alimentare', 'Ristoranti/Svago', 'Trasporti', 'Viaggi', 'Salute', 'Shopping', 'Bollette']
+
+
+def _random_weights(rng: np.random.Generator, labels: list) -> Dict[str, float]:
+    """Pesi percentuali casuali che sommano a 100."""
+    w = rng.dirichlet(np.ones(len(labels))) * 100
+    return {label: round(float(v), 2) for label, v in zip(labels, w)}
+
+
+def generate_portfolio_data(n_assets: int = 10, years: int = 5, n_transactions: int = 200,
+                            expenses_per_month: int = 15, seed: int = 42) -> Dict[str, pd.DataFrame]:
+    """
+    Genera un dizionario nome tabella → DataFrame con il formato restituito da get_data.
+    I prezzi seguono un moto browniano geometrico sui giorni lavorativi; le vendite non
+    superano mai la quantità posseduta.
+    """
+    rng = np.random.default_rng(seed)
+    start = END_DATE - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+    days = pd.bdate_range(start, END_DATE)
+
+    # --- MAPPATURA ---
+    ids = np.arange(1, n_assets + 1)
+    mapping = pd.DataFrame({
+        'id': ids,
+        'isin': [f"IE00SYN{i:05d}" for i in ids],
+        'ticker': [f"SYN{i}.MI" for i in ids],
+        'category': [_CATEGORIES[i % len(_CATEGORIES)] for i in ids],
+        'proxy_ticker': None,
+    })
+
+    # --- PREZZI (moto browniano geometrico) ---
+    drift = rng.normal(0.0003, 0.0002, n_assets)
+    vol = rng.uniform(0.005, 0.02, n_assets)
+    shocks = rng.normal(drift, vol, size=(len(days), n_assets))
+    paths = rng.uniform(20, 200, n_assets) * np.exp(np.cumsum(shocks, axis=0))
+    prices = pd.DataFrame({
+        'mapping_id': np.repeat(ids, len(days)),
+        'date': np.tile(days.values, n_assets),
+        'close_price': paths.T.ravel().round(4),
+    })
+
+    # --- TRANSAZIONI (acquisti e qualche vendita parziale) ---
+    day_idx = np.sort(rng.integers(0, len(days), n_transactions))
+    asset_idx = rng.integers(0, n_assets, n_transactions)
+    is_sell = rng.random(n_transactions) < 0.1
+    held = np.zeros(n_assets)
+    rows = []
+    for k, (d, a, sell) in enumerate(zip(day_idx, asset_idx, is_sell)):
+        price = paths[d, a]
+        if sell and held[a] > 1:
+            qty = -float(np.floor(held[a] * rng.uniform(0.1, 0.5)))
+        else:
+            qty = float(rng.integers(1, 50))
+        held[a] += qty
+        fees = 2.0
+        rows.append({
+            'id': f"syn{seed:04d}{k:08d}",
+            'date': days[d],
+            'product': f"Synthetic ETF {ids[a]}",
+            'isin': mapping['isin'].iat[a],
+            'quantity': qty,
+            'local_value': round(-qty * price - fees, 2),
+            'fees': fees,
+            'currency': 'EUR',
+        })
+    transactions = pd.DataFrame(rows)
+
+    # --- BUDGET MENSILE ---
+    months = pd.date_range(start, END_DATE, freq='MS')
+    budget_rows = [{'date': months[0], 'type': 'Entrata', 'category': 'Saldo Iniziale', 'amount': 10000.0, 'note': ''}]
+    for m in months:
+        budget_rows.append({'date': m, 'type': 'Entrata', 'category': 'Stipendio', 'amount': round(float(rng.normal(2500, 100)), 2), 'note': ''})
+        budget_rows.append({'date': m + pd.Timedelta(days=14), 'type': 'Uscita', 'category': 'Investimento', 'amount': 500.0, 'note': ''})
+        offsets = rng.integers(0, 28, expenses_per_month)
+        cats = rng.choice(_EXPENSES, expenses_per_month)
+        amounts = rng.gamma(2.0, 40.0, expenses_per_month).round(2)
+        budget_rows.extend(
+            {'date': m + pd.Timedelta(days=int(o)), 'type': 'Uscita', 'category': c, 'amount': float(v), 'note': ''}
+            for o, c, v in zip(offsets, cats, amounts)
+        )
+    budget = pd.DataFrame(budget_rows)
+    budget.insert(0, 'id', np.arange(1, len(budget) + 1))
+
+    # --- ALLOCAZIONE (X-Ray) ---
+    asset_allocation = pd.DataFrame({
+        'id': ids,
+        'mapping_id': ids,
+        'geography_json': [json.dumps(_random_weights(rng, _COUNTRIES)) for _ in ids],
+        'sector_json': [json.dumps(_random_weights(rng, _SECTORS)) for _ in ids],
+    })
+
+    # --- STORICO PATRIMONIO ---
+    networth_history = pd.DataFrame({
+        'date': months,
+        'net_worth': (10000 + np.cumsum(rng.normal(1500, 400, len(months)))).round(2),
+        'goal': np.nan,
+    })
+
+    return {
+        'transactions': transactions,
+        'mapping': mapping,
+        'prices': prices,
+        'budget': budget,
+        'asset_allocation': asset_allocation,
+        'networth_history': networth_history,
+    }
+
+
+def to_degiro_csv(df_trans: pd.DataFrame) -> bytes:
+    """Esporta le transazioni nel formato CSV di DEGIRO (date gg-mm-aaaa, decimali con la virgola)."""
+    def fmt(v: float) -> str:
+        return f"\"{v:.2f}\"".replace('.', ',')
+
+    lines = ["Data,Ora,Prodotto,ISIN,Quantità,Valore,Costi di transazione,Totale"]
+    for r in df_trans.itertuples(index=False):
+        value = r.local_value + r.fees
+        lines.append(
+            f"{r.date.strftime('%d-%m-%Y')},09:00,{r.product},{r.isin},{r.quantity:g},"
+            f"{fmt(value)},{fmt(-r.fees)},{fmt(r.local_value)}"
+        )
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def benchmark_history(start, end, seed: int = 7) -> pd.DataFrame:
+    """Serie giornaliera 'Close' di un benchmark, nel formato restituito da yf.download."""
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, end)
+    close = 80 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, len(days))))
+    return pd.DataFrame({'Close': close}, index=days)
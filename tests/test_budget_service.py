@@ -0,0 +1,124 @@
+import pandas as pd
+from datetime import datetime
+from services.budget_service import (
+    build_budget_cube,
+    get_monthly_summary,
+    get_general_summary,
+    get_category_averages,
+    get_yearly_summary,
+    get_yearly_and_general_summary,
+    calculate_net_worth_trend,
+)
+
+
+def _sample_budget() -> pd.DataFrame:
+    return pd.DataFrame([
+        {'date': datetime(2023, 12, 1), 'type': 'Entrata', 'category': 'Stipendio', 'amount': 2000.0},
+        {'date': datetime(2023, 12, 5), 'type': 'Uscita', 'category': 'Affitto/Casa', 'amount': 800.0},
+        {'date': datetime(2024, 1, 1), 'type': 'Entrata', 'category': 'Stipendio', 'amount': 2000.0},
+        {'date': datetime(2024, 1, 3), 'type': 'Uscita', 'category': 'Spesa Alimentare', 'amount': 300.0},
+        {'date': datetime(2024, 1, 20), 'type': 'Uscita', 'category': 'Spesa Alimentare', 'amount': 100.0},
+        {'date': datetime(2024, 1, 25), 'type': 'Uscita', 'category': 'Investimento', 'amount': 500.0},
+    ])
+
+
+def test_build_budget_cube_aggregates_month_type_category():
+    """Il cubo contiene una riga per mese × tipo × categoria con la somma degli importi."""
+    cube = build_budget_cube(_sample_budget())
+
+    assert list(cube.columns) == ['mese', 'type', 'category', 'amount']
+    assert len(cube) == 5  # Le due spese alimentari di gennaio vengono sommate
+    spesa = cube[(cube['mese'] == pd.Period('2024-01', freq='M')) & (cube['category'] == 'Spesa Alimentare')]
+    assert spesa['amount'].iloc[0] == 400.0
+
+
+def test_monthly_summary_from_cube():
+    """Il riepilogo mensile esclude gli investimenti dalle uscite e li riporta a parte."""
+    summary = get_monthly_summary('2024-01', build_budget_cube(_sample_budget()))
+
+    assert summary['entrate'] == 2000.0
+    assert summary['uscite'] == 400.0
+    assert summary['investito_mese'] == 500.0
+    assert summary['risparmio'] == 1600.0
+    assert summary['savings_rate'] == 80.0
+
+
+def test_general_and_yearly_summary_from_cube():
+    """Totali, medie mensili e riepilogo annuale derivano dallo stesso cubo."""
+    df_budget = _sample_budget()
+    cube = build_budget_cube(df_budget)
+
+    general = get_general_summary(cube)
+    assert general['num_mesi'] == 2
+    assert general['totale_entrate'] == 4000.0
+    assert general['totale_uscite'] == 1200.0
+    assert general['totale_investito'] == 500.0
+    assert general['totale_risparmio'] == 2300.0
+    assert general['media_uscite'] == 600.0
+
+    yearly = get_yearly_summary(cube)
+    assert yearly['anno'].tolist() == [2023, 2024]
+    assert yearly['risparmio'].tolist() == [1200.0, 1100.0]
+
+    averages = get_category_averages(cube)
+    assert averages.iloc[0]['category'] == 'Affitto/Casa'
+    assert averages.iloc[0]['media_mensile'] == 400.0
+
+    # Il budget originale non viene modificato
+    assert list(df_budget.columns) == ['date', 'type', 'category', 'amount']
+
+
+def test_yearly_and_general_summary_single_pass():
+    """Un'unica chiamata restituisce riepilogo annuale e generale coerenti, senza toccare il cubo."""
+    cube = build_budget_cube(_sample_budget())
+    cube_before = cube.copy()
+
+    yearly, general = get_yearly_and_general_summary(cube)
+
+    assert list(yearly.columns) == ['anno', 'entrate', 'uscite', 'investito', 'risparmio']
+    assert yearly.loc[yearly['anno'] == 2024, 'investito'].iloc[0] == 500.0
+    assert general['totale_risparmio'] == yearly['risparmio'].sum()
+    pd.testing.assert_frame_equal(cube, cube_before)
+
+
+def test_empty_budget_cube():
+    cube = build_budget_cube(pd.DataFrame())
+
+    assert cube.empty
+    assert get_general_summary(cube)['num_mesi'] == 0
+    assert get_yearly_summary(cube).empty
+
+
+def test_get_budget_month_returns_contiguous_slice():
+    """Le righe di un mese si ottengono dal budget ordinato, mantenendo gli indici originali."""
+    from services.budget_service import index_budget_by_month, get_budget_month
+
+    df_budget = _sample_budget().iloc[::-1]  # Ordine non cronologico in ingresso
+    df_sorted, month_keys = index_budget_by_month(df_budget)
+
+    df_month = get_budget_month(df_sorted, month_keys, '2024-01')
+    assert len(df_month) == 4
+    assert sorted(df_month.index.tolist()) == [2, 3, 4, 5]
+    assert get_budget_month(df_sorted, month_keys, '2022-06').empty
+
+
+def test_net_worth_trend_fits():
+    """Il trend lineare ritrova la retta dei dati; CAGR ed esponenziale stimano la crescita annua."""
+    dates = pd.date_range('2023-01-01', periods=4, freq='100D')
+    df_linear = pd.DataFrame({'date': dates, 'net_worth': [1000.0, 2000.0, 3000.0, 4000.0]})
+
+    df_trend, params = calculate_net_worth_trend(df_linear, months_ahead=1)
+    assert list(df_trend.columns) == ['date', 'trend', 'lower', 'upper']
+    assert abs(params['slope_per_day'] - 10.0) < 1e-9
+    assert abs(df_trend['trend'].iloc[0] - 1000.0) < 1e-6
+    assert (df_trend['lower'] <= df_trend['trend']).all() and (df_trend['trend'] <= df_trend['upper']).all()
+
+    one_year = pd.DataFrame({'date': pd.to_datetime(['2023-01-01', '2024-01-01']), 'net_worth': [1000.0, 1100.0]})
+    _, cagr = calculate_net_worth_trend(one_year, method='cagr')
+    assert abs(cagr['growth_rate'] - 0.1) < 1e-3
+
+    _, params_exp = calculate_net_worth_trend(one_year, method='exponential')
+    assert abs(params_exp['growth_rate'] - 0.1) < 1e-3
+
+    # Con meno di due punti non c'è trend
+    assert calculate_net_worth_trend(one_year.head(1))[0].empty
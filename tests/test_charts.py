@@ -0,0 +1,77 @@
+from ui.charts import _name_to_iso3, _country_iso3_index
+
+
+def test_name_to_iso3_usa_indice_precalcolato(mocker):
+    """
+    Verifica che alias italiani, nomi normalizzati (senza accenti) e nomi inglesi
+    siano risolti dall'indice senza ricorrere alla ricerca fuzzy di pycountry.
+    """
+    # 1. Arrange
+    mock_fuzzy = mocker.patch('pycountry.countries.search_fuzzy')
+
+    # 2. Act & 3. Assert
+    assert _name_to_iso3("Stati Uniti") == "USA"
+    assert _name_to_iso3("perù") == "PER"
+    assert _name_to_iso3("peru") == "PER"
+    assert _name_to_iso3("Germany") == "DEU"
+    assert _name_to_iso3("altri") is None
+    assert "stati uniti" in _country_iso3_index()
+    mock_fuzzy.assert_not_called()
+
+
+def test_cache_figure_riusa_la_figura_se_i_dati_non_cambiano():
+    """
+    Verifica che una figura venga costruita una sola volta per gli stessi dati
+    e ricostruita quando i dati o la configurazione cambiano.
+    """
+    # 1. Arrange
+    import pandas as pd
+    import plotly.graph_objects as go
+    from ui.charts import cache_figure
+
+    calls = []
+
+    @cache_figure
+    def build(df, title):
+        calls.append(title)
+        return go.Figure(go.Bar(x=df['x'], y=df['y'])).update_layout(title=title)
+
+    df = pd.DataFrame({'x': ['a', 'b'], 'y': [1.0, 2.0]})
+
+    # 2. Act
+    first = build(df, "Titolo")
+    second = build(df.copy(), "Titolo")
+    build(df.assign(y=[1.0, 3.0]), "Titolo")
+    build(df, "Altro titolo")
+
+    # 3. Assert
+    assert len(calls) == 3
+    assert second.layout.title.text == "Titolo"
+    assert first is not second  # Ogni chiamata restituisce una figura nuova
+
+
+def test_downsample_timeseries_preserva_estremi():
+    """
+    Verifica che il downsampling LTTB riduca la serie al budget di punti,
+    mantenendo primo, ultimo punto e picchi, e lasci intatte le serie corte.
+    """
+    # 1. Arrange
+    import numpy as np
+    import pandas as pd
+    from ui.charts import downsample_timeseries
+
+    dates = pd.date_range('2015-01-01', periods=5000, freq='D')
+    values = np.sin(np.linspace(0, 20, 5000))
+    values[1234] = 10.0  # Picco isolato
+    df = pd.DataFrame({'Data': dates, 'Valore': values})
+
+    # 2. Act
+    reduced = downsample_timeseries(df, 'Data', ['Valore'], max_points=500)
+    short = downsample_timeseries(df.head(300), 'Data', ['Valore'], max_points=500)
+
+    # 3. Assert
+    assert len(reduced) == 500
+    assert reduced['Data'].is_monotonic_increasing
+    assert reduced.index[0] == 0 and reduced.index[-1] == 4999
+    assert 1234 in reduced.index
+    assert len(short) == 300
@@ -0,0 +1,76 @@
+import pandas as pd
+from database.data_context import DataContext, normalize_table, memory_report
+from services.budget_service import build_budget_cube, get_monthly_summary
+
+
+def _raw_tables():
+    return {
+        'mapping': pd.DataFrame({'id': [1, 2], 'isin': ['IE1', 'IE2'], 'ticker': ['SWDA.MI', 'EIMI.MI'], 'category': ['Azionario', 'Azionario']}),
+        'budget': pd.DataFrame({
+            'date': ['2024-01-03 10:30:00', '2024-01-20 00:00:00'],
+            'type': ['Uscita', 'Entrata'],
+            'category': ['Spesa Alimentare', 'Stipendio'],
+            'amount': [100.0, 2000.0],
+        }),
+    }
+
+
+def test_normalize_table_dtypes():
+    """Date a mezzanotte, colonne a bassa cardinalità come category e chiavi di mappatura int32."""
+    tables = _raw_tables()
+
+    df_map = normalize_table('mapping', tables['mapping'])
+    df_budget = normalize_table('budget', tables['budget'])
+
+    assert df_map['id'].dtype == 'int32'
+    assert isinstance(df_map['ticker'].dtype, pd.CategoricalDtype)
+    assert isinstance(df_budget['type'].dtype, pd.CategoricalDtype)
+    assert df_budget['date'].iloc[0] == pd.Timestamp('2024-01-03')
+    # L'input originale non viene modificato
+    assert not isinstance(tables['budget']['type'].dtype, pd.CategoricalDtype)
+
+
+def test_data_context_loads_each_table_once(mocker):
+    """Ogni tabella viene caricata una sola volta per contesto; refresh forza una nuova lettura."""
+    tables = _raw_tables()
+    loader = mocker.Mock(side_effect=lambda name: normalize_table(name, tables[name]))
+    ctx = DataContext(loader=loader)
+
+    assert ctx.mapping is ctx.table('mapping')
+    ctx.budget
+    assert loader.call_count == 2
+
+    ctx.table('budget', refresh=True)
+    assert loader.call_count == 3
+
+    editable = ctx.editable('budget')
+    assert editable['category'].dtype == object
+
+
+def test_budget_cube_with_categorical_budget():
+    """Con tipo e categoria come category il cubo contiene solo le combinazioni osservate."""
+    df_budget = normalize_table('budget', _raw_tables()['budget'])
+
+    cube = build_budget_cube(df_budget)
+
+    assert len(cube) == 2
+    summary = get_monthly_summary('2024-01', cube)
+    assert summary['entrate'] == 2000.0
+    assert summary['uscite'] == 100.0
+
+
+def test_memory_report_prices_shrink():
+    """Prezzi con chiavi int32 e chiusure float32 occupano meno memoria; i valori restano confrontabili."""
+    df_prices = pd.DataFrame({
+        'mapping_id': [1, 2] * 500,
+        'date': pd.date_range('2020-01-01', periods=1000, freq='D'),
+        'close_price': [101.37, 55.02] * 500,
+    })
+
+    report = memory_report({'prices': df_prices})
+    normalized = normalize_table('prices', df_prices)
+
+    row = report.iloc[0]
+    assert row['byte_dopo'] < row['byte_prima']
+    assert normalized['close_price'].dtype == 'float32'
+    assert abs(float(normalized['close_price'].iloc[0]) - 101.37) < 1e-4
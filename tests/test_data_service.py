@@ -100,4 +100,141 @@ def test_sync_prices_no_new_data(mocker):
         call_args, call_kwargs = mock_save_data.call_args
         saved_df = call_args[0]
         df_filtered = saved_df[saved_df['mapping_id'] == 1]
-        assert len(df_filtered) == 1, f"Expected 1 row for mapping_id=1, got {len(df_filtered)}"
\ No newline at end of file
+        assert len(df_filtered) == 1, f"Expected 1 row for mapping_id=1, got {len(df_filtered)}"
+
+def test_parse_degiro_transactions_without_db_access(mocker):
+    """
+    Verifica che parse_degiro_transactions converta il CSV nel formato della tabella
+    transactions senza leggere il DB (la deduplica verso il DB avviene in Postgres).
+    """
+    import io
+    from services.data_service import parse_degiro_transactions
+
+    mock_get_data = mocker.patch('services.data_service.get_data')
+    csv = io.StringIO(
+        "Data,Ora,Prodotto,ISIN,Quantità,Valore,Costi di transazione,Totale\n"
+        "10-01-2023,09:00,ETF A,ISIN1,10,\"-1000,00\",\"-2,00\",\"-1002,00\"\n"
+        "11-01-2023,09:00,ETF B,ISIN2,5,\"-500,00\",0,0\n"
+        "12-01-2023,09:00,Deposito,,0,100,0,0\n"
+    )
+
+    df = parse_degiro_transactions(csv)
+
+    mock_get_data.assert_not_called()
+    assert len(df) == 2  # La riga senza ISIN viene scartata
+    assert df['id'].is_unique
+    assert list(df.columns) == ['id', 'date', 'product', 'isin', 'quantity', 'local_value', 'fees', 'currency']
+    # 'Totale' ha priorità su 'Valore' quando diverso da zero; le commissioni sono positive
+    row_a = df[df['isin'] == 'ISIN1'].iloc[0]
+    assert row_a['local_value'] == -1002.0
+    assert row_a['fees'] == 2.0
+    assert df[df['isin'] == 'ISIN2'].iloc[0]['local_value'] == -500.0
+
+
+def test_process_transaction_files_merges_overlapping_exports():
+    """
+    Verifica che due export sovrapposti vengano uniti senza duplicare le operazioni comuni,
+    mantenendo però le operazioni identiche ripetute all'interno dello stesso file.
+    """
+    from services.data_service import process_transaction_files
+
+    header = "Data,Ora,Prodotto,ISIN,Quantità,Valore,Costi di transazione,Totale\n"
+    common = "10-01-2023,09:00,ETF A,ISIN1,10,-1000,0,0\n"
+    export_2023 = (header + common + common).encode()  # Due acquisti identici nello stesso minuto
+    export_2023_2024 = (header + "05-02-2024,10:00,ETF B,ISIN2,3,-300,0,0\n" + common).encode()
+
+    df = process_transaction_files([export_2023, export_2023_2024])
+
+    assert df['id'].is_unique
+    assert len(df[df['isin'] == 'ISIN1']) == 2
+    assert len(df[df['isin'] == 'ISIN2']) == 1
+    assert '_content_key' not in df.columns
+
+
+def test_net_worth_snapshot_with_transaction_ids():
+    """Lo snapshot funziona anche quando le transazioni hanno una propria colonna 'id', come nel DB."""
+    from services.data_service import calculate_net_worth_snapshot
+
+    df_trans = pd.DataFrame([{'id': 'tx1', 'date': pd.Timestamp('2024-01-10'), 'isin': 'ISIN1', 'quantity': 10.0, 'local_value': -1000.0}])
+    df_map = pd.DataFrame([{'id': 1, 'isin': 'ISIN1', 'ticker': 'T1', 'category': 'Azionario'}])
+    df_prices = pd.DataFrame([{'mapping_id': 1, 'date': pd.Timestamp('2024-01-31'), 'close_price': 120.0}])
+    df_budget = pd.DataFrame([{'date': pd.Timestamp('2024-01-01'), 'type': 'Entrata', 'category': 'Saldo Iniziale', 'amount': 500.0}])
+
+    net_worth, assets, liquidity = calculate_net_worth_snapshot(pd.Timestamp('2024-02-01'), df_trans, df_map, df_prices, df_budget)
+
+    assert assets == 1200.0
+    assert liquidity == 500.0
+    assert net_worth == 1700.0
+
+
+JUSTETF_PAGE = """<html><body>
+<h3>Paesi</h3><a class="etf-holdings_countries_load-more_link" href="#">Mostra di più</a>
+<h3>Settori</h3><a class="etf-holdings_sectors_load-more_link" href="/it/etf?holdingsSection-sectors-loadMoreSectors&_wicket=1">Mostra di più</a>
+<script>wicket.ajax.baseurl = "it/etf-profile.html?isin=IE00TEST";
+Wicket.Ajax.ajax({"u":"/it/etf?holdingsSection-countries-loadMoreCountries&_wicket=1"});</script>
+</body></html>"""
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def json(self):
+        raise ValueError("non è JSON")
+
+    def raise_for_status(self):
+        pass
+
+
+def _ajax_rows(prefix, n):
+    rows = ''.join(f"<tr><td>{prefix} {i}</td><td>{10 if i else 100 - 10 * (n - 1)},0%</td></tr>" for i in range(n))
+    return f"<?xml version='1.0'?><ajax-response><component><![CDATA[<table>{rows}</table>]]></component></ajax-response>"
+
+
+def test_justetf_allocation_fetches_page_once_and_ajax_in_parallel(mocker):
+    """Una sola richiesta della pagina per i due parser, AJAX di paesi e settori insieme, niente Playwright."""
+    import asyncio
+    import time
+    from services.data_service import fetch_justetf_allocation_robust
+
+    calls, intervals = [], []
+
+    async def fake_fetch(url, method='GET', **kwargs):
+        calls.append((method, url))
+        if 'loadMore' not in url:
+            return _FakeResponse(JUSTETF_PAGE)
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        intervals.append((started, time.perf_counter()))
+        return _FakeResponse(_ajax_rows('Paese' if 'Countries' in url else 'Settore', 7))
+
+    mocker.patch('services.data_service.fetch', side_effect=fake_fetch)
+    playwright = mocker.patch('services.data_service._fetch_justetf_playwright', return_value=({}, {}))
+
+    geo, sec = fetch_justetf_allocation_robust('IE00TEST')
+
+    # Le due richieste AJAX si sovrappongono: la seconda parte prima che la prima finisca
+    assert len(intervals) == 2
+    assert max(start for start, _ in intervals) < min(end for _, end in intervals)
+    assert [m for m, u in calls if 'loadMore' not in u] == ['GET']
+    assert sorted(m for m, u in calls if 'loadMore' in u) == ['POST', 'POST']
+    assert len(geo) == 7 and len(sec) == 7
+    playwright.assert_not_called()
+
+
+def test_justetf_allocation_starts_playwright_when_page_has_no_ajax(mocker):
+    """Senza link "Mostra di più" i metodi veloci non bastano: Playwright parte e completa i dati."""
+    from services.data_service import fetch_justetf_allocation_robust
+
+    async def fake_fetch(url, method='GET', **kwargs):
+        return _FakeResponse("<html><h3>Paesi</h3></html>")
+
+    mocker.patch('services.data_service.fetch', side_effect=fake_fetch)
+    playwright = mocker.patch('services.data_service._fetch_justetf_playwright',
+                              return_value=({'Stati Uniti': 60.0}, {'Tecnologia': 25.0}))
+
+    geo, sec = fetch_justetf_allocation_robust('IE00TEST')
+
+    playwright.assert_called_once_with('IE00TEST')
+    assert geo == {'Stati Uniti': 60.0, 'Altri': 40.0}
+    assert sec == {'Tecnologia': 25.0, 'Altri': 75.0}
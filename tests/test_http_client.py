@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+
+from services import http_client
+from services.http_client import map_blocking, run_sync
+from services.tracing import span, start_trace, get_last_trace, traced
+
+
+def _overlap(intervals):
+    """True se tutti gli intervalli (inizio, fine) hanno un istante in comune."""
+    return max(start for start, _ in intervals) < min(end for _, end in intervals)
+
+
+def test_map_blocking_overlaps_calls_and_returns_errors():
+    """Le chiamate bloccanti si sovrappongono e un errore non ferma le altre."""
+    intervals, lock = [], threading.Lock()
+
+    def slow(x):
+        started = time.perf_counter()
+        time.sleep(0.05)
+        with lock:
+            intervals.append((started, time.perf_counter()))
+        if x == 2:
+            raise ValueError("ticker non trovato")
+        return x * 10
+
+    results = dict(map_blocking(slow, [1, 2, 3]))
+
+    assert len(intervals) == 3 and _overlap(intervals)
+    assert results[1] == 10 and results[3] == 30
+    assert isinstance(results[2], ValueError)
+
+
+def test_map_blocking_respects_concurrency_limit():
+    """Non più di BLOCKING_CONCURRENCY chiamate alla volta."""
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def tracked(_):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    list(map_blocking(tracked, range(http_client.BLOCKING_CONCURRENCY * 3)))
+
+    assert peak[0] == http_client.BLOCKING_CONCURRENCY
+
+
+def test_run_sync_keeps_spans_in_caller_trace():
+    """Gli span aperti sul loop condiviso finiscono nella traccia di chi chiama, sotto il suo span."""
+    start_trace()
+    intervals = []
+
+    @traced('network', name='fake.fetch')
+    async def fake_fetch(n):
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        intervals.append((started, time.perf_counter()))
+        return n
+
+    async def both():
+        return await asyncio.gather(fake_fetch(1), fake_fetch(2))
+
+    with span('allocation', 'service') as parent:
+        assert run_sync(both()) == [1, 2]
+    assert _overlap(intervals)
+
+    fetches = [s for s in get_last_trace()['spans'] if s['name'] == 'fake.fetch']
+    assert len(fetches) == 2
+    assert all(s['parent'] == parent['id'] and s['duration_ms'] >= 50 for s in fetches)
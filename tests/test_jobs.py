@@ -0,0 +1,89 @@
+import json
+import logging
+
+import pandas as pd
+
+import cli
+from database.data_context import DataContext
+from services.data_service import merge_networth_snapshots, backfill_net_worth, calculate_net_worth_snapshot
+from services.jobs import run_backfill_networth, run_snapshot
+from services.reporting import LogReporter
+from synthetic_data import generate_portfolio_data
+
+
+def _ctx(data):
+    return DataContext(loader=lambda name: data[name].copy())
+
+
+def test_merge_networth_snapshots_keeps_goals():
+    """Lo snapshot aggiorna il patrimonio della sua data senza perdere l'obiettivo già salvato."""
+    history = pd.DataFrame({'date': pd.to_datetime(['2024-01-31', '2024-02-29']),
+                            'net_worth': [100.0, 110.0], 'goal': [500.0, None]})
+    snapshots = pd.DataFrame({'date': pd.to_datetime(['2024-01-31', '2024-03-31']), 'net_worth': [105.0, 120.0]})
+
+    merged = merge_networth_snapshots(history, snapshots).set_index('date')
+
+    assert merged['net_worth'].tolist() == [105.0, 110.0, 120.0]
+    assert merged.loc['2024-01-31', 'goal'] == 500.0
+
+
+def test_backfill_net_worth_matches_single_snapshots():
+    """Il calcolo su più date dà gli stessi valori degli snapshot calcolati uno per uno."""
+    data = generate_portfolio_data(n_assets=3, years=1, n_transactions=40, seed=3)
+    dates = pd.to_datetime(['2024-03-29', '2024-09-30'])
+
+    result = backfill_net_worth(dates, data['transactions'], data['mapping'], data['prices'], data['budget'])
+
+    for row in result.itertuples(index=False):
+        expected = calculate_net_worth_snapshot(row.date, data['transactions'].copy(), data['mapping'],
+                                                data['prices'].copy(), data['budget'].copy())
+        assert (row.net_worth, row.assets_value, row.liquidity) == tuple(float(v) for v in expected)
+
+
+def test_run_backfill_networth_fills_only_missing_dates(mocker):
+    """Senza overwrite si calcolano solo le date di fine mese che mancano nello storico."""
+    data = generate_portfolio_data(n_assets=3, years=1, n_transactions=40, seed=3)
+    data['networth_history'] = pd.DataFrame({'date': pd.to_datetime(['2024-02-29']), 'net_worth': [1.0], 'goal': [9.0]})
+    save = mocker.patch('services.jobs.upsert_networth_snapshots', return_value=True)
+
+    result = run_backfill_networth('2024-01-01', '2024-04-30', ctx=_ctx(data), reporter=LogReporter('test'))
+
+    assert result == {'job': 'backfill-networth', 'status': 'ok', 'snapshot': 3}
+    saved = save.call_args[0][0]
+    assert len(saved) == 3
+    assert pd.Timestamp('2024-02-29') not in set(saved['date'])
+
+
+def test_run_snapshot_reports_save_failure(mocker):
+    """Se il salvataggio non riesce il job fallisce e l'errore resta nel reporter."""
+    data = generate_portfolio_data(n_assets=2, years=1, n_transactions=20, seed=5)
+    mocker.patch('services.jobs.upsert_networth_snapshots', return_value=False)
+    reporter = LogReporter('snapshot')
+
+    result = run_snapshot('2024-06-28', ctx=_ctx(data), reporter=reporter)
+
+    assert result['status'] == 'failed'
+    assert reporter.errors == ["Salvataggio dello snapshot non riuscito."]
+
+
+def test_run_snapshot_refuses_empty_database(mocker):
+    """Senza transazioni né budget (anche per una lettura fallita) lo snapshot non si salva."""
+    data = {name: pd.DataFrame() for name in ['transactions', 'mapping', 'prices', 'budget', 'networth_history']}
+    save = mocker.patch('services.jobs.upsert_networth_snapshots', return_value=True)
+
+    result = run_snapshot('2024-06-28', ctx=_ctx(data), reporter=LogReporter('snapshot'))
+
+    assert result['status'] == 'failed'
+    save.assert_not_called()
+
+
+def test_cli_exit_codes_and_json_log(mocker, capsys):
+    """Il codice di uscita segue l'esito del job e l'ultima riga di log è il risultato in JSON."""
+    mocker.patch('services.jobs.run_snapshot', return_value={'job': 'snapshot', 'status': 'partial', 'data': '2024-06-28'})
+    assert cli.main(['snapshot', '--date', '2024-06-28']) == cli.EXIT_PARTIAL
+    result = json.loads(capsys.readouterr().err.strip().splitlines()[-1])
+    assert result['event'] == 'result' and result['status'] == 'partial' and result['job'] == 'snapshot'
+
+    mocker.patch('services.jobs.run_sync_prices', side_effect=RuntimeError("db non raggiungibile"))
+    assert cli.main(['sync-prices']) == cli.EXIT_FAILED
+    logging.getLogger('portfolio.jobs').handlers.clear()
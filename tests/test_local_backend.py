@@ -0,0 +1,98 @@
+import pandas as pd
+import pytest
+import streamlit as st
+
+from database import connection
+from database.local_backend import resolve_backend
+
+
+@pytest.fixture
+def local_db(tmp_path, monkeypatch):
+    """Backend SQLite su un file temporaneo, con cache di connessione e dati azzerate."""
+    monkeypatch.setenv('PORTFOLIO_DB_BACKEND', 'sqlite')
+    monkeypatch.setenv('PORTFOLIO_DB_PATH', str(tmp_path / 'portfolio.db'))
+    connection.get_db_connection.clear()
+    st.cache_data.clear()
+    yield connection.get_db_connection()
+    connection.get_db_connection.clear()
+    st.cache_data.clear()
+
+
+def _tx(tx_id, date='2024-01-10', qty=1.0):
+    return {'id': tx_id, 'date': pd.Timestamp(date), 'product': 'ETF', 'isin': 'IE00TEST0001',
+            'quantity': qty, 'local_value': -100.0 * qty, 'fees': 1.0, 'currency': 'EUR'}
+
+
+def test_resolve_backend_defaults_and_validation(monkeypatch):
+    """Senza configurazione si usa Postgres; la variabile d'ambiente prevale sui secrets."""
+    monkeypatch.delenv('PORTFOLIO_DB_BACKEND', raising=False)
+    assert resolve_backend() == 'postgresql'
+    assert resolve_backend('neon') == 'postgresql'
+    monkeypatch.setenv('PORTFOLIO_DB_BACKEND', 'sqlite')
+    assert resolve_backend('postgresql') == 'sqlite'
+    monkeypatch.setenv('PORTFOLIO_DB_BACKEND', 'oracle')
+    with pytest.raises(ValueError):
+        resolve_backend()
+
+
+def test_mapping_upsert_preserves_ids_and_cascades(local_db):
+    """L'upsert mantiene l'id esistente e la cancellazione di un ISIN elimina i prezzi collegati."""
+    first = connection.insert_single_mapping('IE00TEST0001', 'AAA.MI', 'Azionario')
+    again = connection.insert_single_mapping('IE00TEST0001', 'AAB.MI', 'Azionario')
+    other = connection.insert_single_mapping('IE00TEST0002', 'BBB.MI', 'Gold')
+    assert first == again and other != first
+
+    connection.save_data(pd.DataFrame({'mapping_id': [first, other], 'date': ['2024-01-10'] * 2,
+                                       'close_price': [10.0, 20.0]}), 'prices', method='append')
+    assert connection.replace_all_mappings(pd.DataFrame({'isin': ['IE00TEST0001'], 'ticker': ['AAA.MI'],
+                                                         'category': ['Azionario'], 'proxy_ticker': [None]}))
+
+    df_map = connection.get_data('mapping')
+    assert df_map['isin'].tolist() == ['IE00TEST0001']
+    assert df_map['id'].tolist() == [first]
+    assert connection.get_data('prices')['mapping_id'].tolist() == [first]
+
+
+def test_transactions_staged_import_update_and_delete(local_db):
+    """Import con staging (duplicati scartati), aggiornamento e cancellazione funzionano su SQLite."""
+    assert connection.insert_single_transaction(_tx('T1'))
+    inserted = connection.import_transactions_staged(pd.DataFrame([_tx('T1'), _tx('T2'), _tx('T2'), _tx('T3')]))
+    assert sorted(inserted) == ['T2', 'T3']
+
+    assert connection.update_transaction('T2', {'quantity': 5.0, 'date': pd.Timestamp('2024-02-01')})
+    df = connection.get_data('transactions').set_index('id')
+    assert df.loc['T2', 'quantity'] == 5.0
+    assert df.loc['T2', 'date'] == pd.Timestamp('2024-02-01')
+    assert pd.api.types.is_datetime64_any_dtype(df['date'])
+
+    assert connection.delete_transactions(['T1', 'T3']) == 2
+    assert connection.get_data('transactions')['id'].tolist() == ['T2']
+
+
+def test_allocation_json_is_decoded_like_jsonb(local_db):
+    """Le colonne JSON salvate come testo tornano come dizionari, come con JSONB su Postgres."""
+    mapping_id = connection.insert_single_mapping('IE00TEST0001', 'AAA.MI', 'Azionario')
+    connection.save_allocation_json(mapping_id, {'USA': 60, 'Giappone': 40}, {'Tecnologia': 100})
+    connection.save_allocation_json(mapping_id, {'USA': 100}, {'Tecnologia': 100})
+
+    df_alloc = connection.get_data('asset_allocation')
+    assert len(df_alloc) == 1
+    assert df_alloc.iloc[0]['geography_json'] == {'usa': 100}
+    assert df_alloc.iloc[0]['sector_json'] == {'tecnologia': 100}
+
+
+def test_networth_upsert_keeps_goals_and_other_dates(local_db):
+    """Lo snapshot aggiorna solo le colonne calcolate della sua data: obiettivi e altre date restano."""
+    connection.save_data(pd.DataFrame({'date': pd.to_datetime(['2024-01-31', '2024-02-29']),
+                                       'net_worth': [100.0, 110.0], 'assets_value': [80.0, 90.0],
+                                       'liquidity': [20.0, 20.0], 'goal': [500.0, 600.0]}),
+                         'networth_history', method='replace')
+
+    assert connection.upsert_networth_snapshots(pd.DataFrame({
+        'date': pd.to_datetime(['2024-02-29', '2024-03-31']), 'net_worth': [120.0, 130.0],
+        'assets_value': [95.0, 100.0], 'liquidity': [25.0, 30.0]}))
+
+    df = connection.get_data('networth_history').set_index('date')
+    assert df['net_worth'].tolist() == [100.0, 120.0, 130.0]
+    assert df.loc['2024-02-29', 'goal'] == 600.0
+    assert df.loc['2024-01-31', 'goal'] == 500.0
@@ -0,0 +1,155 @@
+import json
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+from database import connection
+from database.mirror import LocalMirror
+
+
+@pytest.fixture
+def source(tmp_path):
+    """Sorgente SQLite al posto di Postgres, con prezzi e allocazioni iniziali."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+    pd.DataFrame({'mapping_id': [1, 1, 2], 'date': ['2024-01-01', '2024-01-02', '2024-01-02'],
+                  'close_price': [10.0, 11.0, 20.0]}).to_sql('prices', engine, index=False)
+    pd.DataFrame({'mapping_id': [1], 'geography_json': [json.dumps({'usa': 100})], 'sector_json': ['{}'],
+                  'last_updated': ['2024-01-01T10:00:00']}).to_sql('asset_allocation', engine, index=False)
+    return engine
+
+
+def _execute(engine, sql):
+    with engine.begin() as c:
+        c.execute(text(sql))
+
+
+def test_first_read_copies_the_table(source, tmp_path):
+    """La prima lettura sincronizza per intero e registra il high-water mark."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+
+    df = mirror.read('prices')
+
+    assert len(df) == 3
+    state = mirror.status().set_index('table_name')
+    assert state.loc['prices', 'high_water'] == '2024-01-02'
+    assert state.loc['prices', 'row_count'] == 3
+
+
+def test_incremental_sync_pulls_only_rows_since_high_water(source, tmp_path):
+    """Dopo la prima copia si scaricano solo le righe dal high-water mark in poi, aggiornando quelle già presenti."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    mirror.read('prices')
+    _execute(source, "UPDATE prices SET close_price = 12.0 WHERE mapping_id = 1 AND date = '2024-01-02'")
+    _execute(source, "INSERT INTO prices VALUES (1, '2024-01-03', 13.0)")
+
+    pulled = mirror.sync('prices')
+
+    assert pulled == 3  # Le due righe del 2024-01-02 e la nuova del 2024-01-03
+    df = mirror.read('prices').set_index(['mapping_id', 'date'])
+    assert len(df) == 4
+    assert df.loc[(1, '2024-01-02'), 'close_price'] == 12.0
+    assert mirror.status().set_index('table_name').loc['prices', 'high_water'] == '2024-01-03'
+
+
+def test_deleted_rows_trigger_full_reload(source, tmp_path):
+    """Se il conteggio non coincide con la sorgente (cancellazioni) la tabella si ricarica per intero."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    mirror.read('prices')
+    _execute(source, "DELETE FROM prices WHERE date = '2024-01-01'")
+
+    mirror.sync('prices')
+
+    assert len(mirror.read('prices')) == 2
+
+
+def test_stale_table_is_reloaded_before_reading(source, tmp_path):
+    """Dopo una scrittura la tabella marcata come da riallineare si ricarica prima di leggerla."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    assert len(mirror.read('asset_allocation')) == 1
+    _execute(source, "INSERT INTO asset_allocation VALUES (2, '{}', '{}', '2023-12-31T09:00:00')")
+
+    mirror.mark_stale('asset_allocation')
+
+    assert sorted(mirror.read('asset_allocation')['mapping_id']) == [1, 2]
+
+
+def test_unreachable_source_serves_local_copy(source, tmp_path):
+    """Se la sorgente non risponde si leggono i dati locali e l'errore resta nello stato."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    mirror.read('prices')
+    mirror.mark_stale('prices')
+    mirror.source = create_engine(f"sqlite:///{tmp_path / 'missing' / 'source.db'}")
+
+    df = mirror.read('prices')
+
+    assert len(df) == 3
+    assert mirror.status().set_index('table_name').loc['prices', 'last_error']
+
+
+def test_get_data_reads_from_mirror_and_writes_mark_it_stale(source, tmp_path, mocker):
+    """Con il mirror attivo get_data legge dalla copia locale; una scrittura la marca come da ricaricare."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    mocker.patch('database.connection.get_mirror', return_value=mirror)
+
+    df = connection.get_data.__wrapped__('asset_allocation')
+    connection.invalidate_tables('asset_allocation')
+
+    assert df.iloc[0]['geography_json'] == {'usa': 100}
+    assert bool(mirror.status().set_index('table_name').loc['asset_allocation', 'stale'])
+
+
+def test_insert_only_write_syncs_incrementally(source, tmp_path):
+    """Dopo una scrittura di soli inserimenti si scaricano solo le righe dal high-water mark, non l'intera tabella."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    mirror.read('prices')
+    _execute(source, "INSERT INTO prices VALUES (2, '2024-01-03', 21.0)")
+
+    mirror.mark_stale('prices', incremental=True)
+    pulled = mirror.sync('prices')
+
+    assert pulled == 3  # Le due righe del 2024-01-02 e la nuova, non tutte e quattro
+    assert len(mirror.read('prices')) == 4
+    assert not mirror.status().set_index('table_name').loc['prices', 'stale']
+
+
+def test_replaced_table_is_copied_without_downloading(source, tmp_path):
+    """Un salvataggio che sostituisce la tabella la copia nel mirror senza passare dalla sorgente."""
+    mirror = LocalMirror(tmp_path / 'mirror.db', source)
+    mirror.read('prices')
+    mirror.mark_stale('prices')
+    mirror.source = create_engine(f"sqlite:///{tmp_path / 'missing' / 'source.db'}")
+
+    mirror.apply_replace('prices', pd.DataFrame({'mapping_id': [3], 'date': [pd.Timestamp('2024-02-01')],
+                                                 'close_price': [30.0]}))
+
+    df = mirror.read('prices')
+    assert df.to_dict('records') == [{'mapping_id': 3, 'date': '2024-02-01', 'close_price': 30.0}]
+    state = mirror.status().set_index('table_name').loc['prices']
+    assert state['high_water'] == '2024-02-01' and not state['stale'] and not state['last_error']
+
+
+def test_background_sync_reports_only_changed_tables(source, tmp_path):
+    """La sincronizzazione in background avvisa (per svuotare la cache) solo se le righe sono cambiate."""
+    changed = []
+    mirror = LocalMirror(tmp_path / 'mirror.db', source, on_change=changed.append)
+    mirror.read('prices')
+
+    mirror._sync_safely('prices')
+    assert changed == []
+
+    _execute(source, "UPDATE prices SET close_price = 12.0 WHERE mapping_id = 1 AND date = '2024-01-02'")
+    mirror._sync_safely('prices')
+    assert changed == ['prices']
+
+
+def test_background_sync_clears_the_cached_table(mocker):
+    """Il callback del mirror svuota la cache di get_data e load_table solo per la tabella aggiornata."""
+    from database import data_context
+    get_data_clear = mocker.patch.object(connection.get_data, 'clear')
+    load_table_clear = mocker.patch.object(data_context.load_table, 'clear')
+
+    connection._clear_table_cache('prices')
+
+    get_data_clear.assert_called_once_with('prices')
+    load_table_clear.assert_called_once_with('prices')
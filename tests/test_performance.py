@@ -0,0 +1,130 @@
+"""
+Suite di benchmark dei servizi su dati sintetici a più scale.
+
+I tempi vengono misurati solo con RUN_PERF=1 (sono lenti e dipendono dalla macchina):
+    RUN_PERF=1 python -m pytest -q tests/test_performance.py
+Ogni misura è il minimo su più ripetizioni e fallisce se supera il valore di riferimento
+in tests/perf_baseline.json moltiplicato per PERF_TOLERANCE (default 2.0).
+Per rigenerare i riferimenti sulla macchina corrente:
+    RUN_PERF=1 UPDATE_PERF_BASELINE=1 python -m pytest -q tests/test_performance.py
+"""
+import io
+import json
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+from services.budget_service import (
+    build_budget_cube,
+    get_yearly_and_general_summary,
+    get_monthly_summary,
+    get_category_averages,
+)
+from services.portfolio_service import calculate_portfolio_view, get_historical_portfolio
+from services.benchmark_service import run_benchmark_simulation
+from services.data_service import calculate_net_worth_snapshot, process_new_transactions
+from synthetic_data import SCALES, generate_portfolio_data, to_degiro_csv, benchmark_history
+
+BASELINE_PATH = Path(__file__).with_name('perf_baseline.json')
+RUN_PERF = os.environ.get('RUN_PERF') == '1'
+UPDATE_BASELINE = os.environ.get('UPDATE_PERF_BASELINE') == '1'
+TOLERANCE = float(os.environ.get('PERF_TOLERANCE', '2.0'))
+ROUNDS = 3
+
+_DATA_CACHE = {}
+
+
+def _data(scale: str) -> dict:
+    """Dati sintetici per scala, generati una sola volta per sessione di test."""
+    if scale not in _DATA_CACHE:
+        _DATA_CACHE[scale] = generate_portfolio_data(**SCALES[scale])
+    return _DATA_CACHE[scale]
+
+
+def _copies(data: dict, *names: str) -> list:
+    return [data[name].copy() for name in names]
+
+
+def _budget_summaries(data):
+    # Nessuna cache tra una ripetizione e l'altra: si misura il calcolo completo
+    cube = build_budget_cube.__wrapped__(data['budget'])
+    get_yearly_and_general_summary(cube)
+    get_category_averages(cube)
+    get_monthly_summary('2024-06', cube)
+
+
+def _net_worth_snapshot(data):
+    dfs = dict(zip(['df_trans', 'df_map', 'df_prices', 'df_budget'],
+                   _copies(data, 'transactions', 'mapping', 'prices', 'budget')))
+    calculate_net_worth_snapshot(pd.Timestamp('2024-06-28'), **dfs)
+
+
+def _process_new_transactions(data):
+    csv = data.setdefault('_degiro_csv', to_degiro_csv(data['transactions']))
+    existing = data['transactions'].iloc[: len(data['transactions']) // 2]
+    process_new_transactions(io.BytesIO(csv), existing)
+
+
+OPERATIONS = {
+    'calculate_portfolio_view': lambda d: calculate_portfolio_view(*_copies(d, 'transactions', 'mapping', 'prices')),
+    'get_historical_portfolio': lambda d: get_historical_portfolio(*_copies(d, 'transactions', 'mapping', 'prices')),
+    'run_benchmark_simulation': lambda d: run_benchmark_simulation.__wrapped__('SWDA.MI', *_copies(d, 'transactions', 'mapping', 'prices')),
+    'calculate_net_worth_snapshot': _net_worth_snapshot,
+    'budget_summaries': _budget_summaries,
+    'process_new_transactions': _process_new_transactions,
+}
+
+
+def _measure(fn, rounds: int = ROUNDS) -> float:
+    """Tempo minimo su più ripetizioni, a cache Streamlit vuota."""
+    best = float('inf')
+    for _ in range(rounds):
+        st.cache_data.clear()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _load_baseline() -> dict:
+    return json.loads(BASELINE_PATH.read_text(encoding='utf-8')) if BASELINE_PATH.exists() else {}
+
+
+def test_synthetic_data_is_deterministic():
+    """Stessi parametri e seed producono tabelle identiche; le vendite non superano il posseduto."""
+    a = generate_portfolio_data(n_assets=3, years=1, n_transactions=40, seed=1)
+    b = generate_portfolio_data(n_assets=3, years=1, n_transactions=40, seed=1)
+
+    for name in a:
+        pd.testing.assert_frame_equal(a[name], b[name])
+    holdings = a['transactions'].groupby('isin')['quantity'].cumsum()
+    assert (holdings >= 0).all()
+    assert a['prices']['mapping_id'].nunique() == 3
+
+
+@pytest.mark.perf
+@pytest.mark.skipif(not RUN_PERF, reason="Benchmark disattivati: impostare RUN_PERF=1")
+@pytest.mark.parametrize('scale', list(SCALES))
+@pytest.mark.parametrize('operation', list(OPERATIONS))
+def test_service_performance(operation, scale, mocker):
+    """Il tempo del servizio alla scala data non regredisce oltre la tolleranza rispetto al riferimento."""
+    data = _data(scale)
+    bench = benchmark_history(data['transactions']['date'].min(), data['prices']['date'].max())
+    mocker.patch('yfinance.download', return_value=bench)
+
+    elapsed = _measure(lambda: OPERATIONS[operation](data))
+
+    key = f"{operation}[{scale}]"
+    baseline = _load_baseline()
+    if UPDATE_BASELINE:
+        baseline[key] = round(elapsed, 5)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n", encoding='utf-8')
+        return
+    if key not in baseline:
+        pytest.skip(f"Nessun riferimento per {key}: rigenerare con UPDATE_PERF_BASELINE=1")
+    limit = baseline[key] * TOLERANCE
+    assert elapsed <= limit, f"{key}: {elapsed:.4f}s oltre il limite {limit:.4f}s (riferimento {baseline[key]:.4f}s)"
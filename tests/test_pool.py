@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+from database import pool
+from database.pool import ENGINE_OPTIONS, engine_options, install_pool_metrics, keep_warm, pool_status
+
+
+@pytest.fixture
+def fast_keep_alive(monkeypatch):
+    """Keep-alive con intervallo breve, che si ferma dopo il primo ping (nessuna attività successiva)."""
+    monkeypatch.setattr(pool, 'KEEP_ALIVE_INTERVAL_S', 0.01)
+    monkeypatch.setattr(pool, 'KEEP_ALIVE_IDLE_S', 0.0)
+    monkeypatch.setattr(pool, '_keep_alive_thread', None)
+
+
+def test_engine_options_secrets_override_defaults():
+    """I create_engine_kwargs dei secrets sovrascrivono i valori predefiniti, connect_args incluso."""
+    options = engine_options({'pool_size': 5, 'connect_args': {'connect_timeout': 3}})
+
+    assert options['pool_size'] == 5
+    assert options['pool_pre_ping'] is True
+    assert options['connect_args']['connect_timeout'] == 3
+    assert options['connect_args']['keepalives'] == 1
+    assert ENGINE_OPTIONS['connect_args']['connect_timeout'] == 10  # I predefiniti restano invariati
+
+
+def test_keep_warm_measures_handshake_and_latency(tmp_path, fast_keep_alive):
+    """Il keep-alive in background apre una connessione: handshake e latenza vengono registrati."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'warm.db'}", pool_pre_ping=True)
+    install_pool_metrics(engine)
+    before = pool_status()['handshakes']
+
+    keep_warm(engine).join(timeout=5)
+
+    status = pool_status(engine)
+    assert status['handshakes'] == before + 1
+    assert status['warm_up_ms'] is not None and status['warm_up_error'] is None
+    assert status['pool_idle'] == 1  # La connessione calda resta nel pool
+
+
+def test_keep_warm_connection_still_reaches_query_log(tmp_path, fast_keep_alive):
+    """Dopo il ping di keep-alive la stessa connessione (LIFO) torna nel log delle query."""
+    from database.query_log import install_query_log, query_stats, reset_query_log
+    engine = create_engine(f"sqlite:///{tmp_path / 'log.db'}", pool_use_lifo=True)
+    install_query_log(engine)
+    reset_query_log()
+
+    keep_warm(engine).join(timeout=5)
+    with engine.connect() as c:
+        c.exec_driver_sql("SELECT 42 AS probe_warm_up")
+
+    assert "select ? as probe_warm_up" in query_stats()['fingerprint'].tolist()
+
+
+def test_keep_alive_ping_replaces_connection_close_to_recycle(tmp_path):
+    """Il ping di keep-alive sostituisce la connessione che scadrebbe prima del ping successivo."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'recycle.db'}", pool_recycle=240, pool_use_lifo=True)
+    install_pool_metrics(engine)
+    pool._ping(engine, refresh=True)
+    handshakes = pool_status()['handshakes']
+
+    pool._ping(engine, refresh=True)
+    assert pool_status()['handshakes'] == handshakes  # Connessione giovane: riusata
+
+    with engine.connect() as c:
+        c.connection.info['connected_at'] -= 240 - pool.KEEP_ALIVE_INTERVAL_S + 1
+    pool._ping(engine, refresh=True)
+    assert pool_status()['handshakes'] == handshakes + 1
+    assert pool_status(engine)['pool_idle'] == 1
+
+
+def test_keep_alive_loop_stops_when_app_is_idle(monkeypatch):
+    """Il ciclo continua a fare ping finché c'è attività e si ferma quando supera KEEP_ALIVE_IDLE_S."""
+    monkeypatch.setattr(pool, 'KEEP_ALIVE_INTERVAL_S', 0.0)
+    monkeypatch.setattr(pool, '_last_activity', time.time())
+    pings = []
+
+    def fake_ping(engine, refresh=False):
+        pings.append(refresh)
+        if len(pings) == 3:
+            # Nessun rerun da più di KEEP_ALIVE_IDLE_S
+            pool._last_activity = time.time() - pool.KEEP_ALIVE_IDLE_S - 1
+
+    monkeypatch.setattr(pool, '_ping', fake_ping)
+
+    pool._keep_alive_loop(engine=None)
+
+    assert pings == [True, True, True]
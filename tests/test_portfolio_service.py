@@ -1,6 +1,6 @@
 import pandas as pd
 from datetime import datetime
-from services.portfolio_service import calculate_liquidity
+from services.portfolio_service import calculate_liquidity, build_liquidity_index, liquidity_at
 
 def test_calculate_liquidity_con_saldo_iniziale():
     """
@@ -41,6 +41,32 @@ def test_calculate_liquidity_senza_saldo_iniziale():
     # Entrate (1500) - Uscite (300) - Investimento (500) = 700
     assert final_liquidity == 700.0
 
+def test_liquidity_index_rispetta_saldo_iniziale():
+    """
+    Verifica che il saldo cumulato riparta dal 'Saldo Iniziale' e che la ricerca per data
+    restituisca il saldo a fine giornata.
+    """
+    # 1. Arrange
+    df_budget = pd.DataFrame([
+        {'date': datetime(2022, 12, 10), 'type': 'Entrata', 'category': 'Stipendio', 'amount': 300.0},
+        {'date': datetime(2023, 1, 1), 'type': 'Uscita', 'category': 'Spesa', 'amount': 50.0},
+        {'date': datetime(2023, 1, 1), 'type': 'Entrata', 'category': 'Saldo Iniziale', 'amount': 1000.0},
+        {'date': datetime(2023, 1, 15), 'type': 'Entrata', 'category': 'Stipendio', 'amount': 500.0},
+        {'date': datetime(2023, 1, 25), 'type': 'Uscita', 'category': 'Investimento', 'amount': 200.0},
+    ])
+
+    # 2. Act
+    liquidity_index = build_liquidity_index(df_budget)
+
+    # 3. Assert
+    assert liquidity_at(liquidity_index, datetime(2022, 1, 1)) == 0.0
+    # Prima del saldo iniziale: somma dei movimenti
+    assert liquidity_at(liquidity_index, datetime(2022, 12, 31)) == 300.0
+    # Dal giorno del saldo si riparte dal suo importo (la spesa dello stesso giorno è ignorata)
+    assert liquidity_at(liquidity_index, datetime(2023, 1, 1)) == 1000.0
+    assert liquidity_at(liquidity_index, datetime(2023, 1, 20)) == 1500.0
+    assert liquidity_at(liquidity_index, datetime(2023, 2, 1)) == 1300.0
+
 def test_allocation_display_logic():
     """
     Verifica che la logica di selezione degli elementi da mostrare funzioni correttamente
@@ -0,0 +1,68 @@
+from sqlalchemy import create_engine, text
+from database import query_log
+from database.query_log import fingerprint, install_query_log, query_stats, recent_queries, reset_query_log
+
+
+def test_fingerprint_groups_statements_with_different_values():
+    """Letterali, parametri e liste di valori non cambiano l'impronta."""
+    a = fingerprint("SELECT * FROM prices WHERE mapping_id = 3 AND date > '2024-01-01'")
+    b = fingerprint("select *   from prices where mapping_id = %(m)s and date > %(d)s;")
+    c = fingerprint("DELETE FROM transactions WHERE id IN (%s, %s, %s)")
+
+    assert a == b == "select * from prices where mapping_id = ? and date > ?"
+    assert c == "delete from transactions where id in (?, ...)"
+
+
+def test_fingerprint_keeps_postgres_casts():
+    """I cast di Postgres (::date, ::jsonb) restano nell'impronta; solo i bind parameter diventano '?'."""
+    as_date = fingerprint("SELECT :d::date AS giorno, x::date FROM t")
+    as_jsonb = fingerprint("SELECT :d::date AS giorno, x::jsonb FROM t")
+
+    assert as_date == "select ?::date as giorno, x::date from t"
+    assert as_date != as_jsonb
+
+
+def test_query_log_aggregates_by_fingerprint(mocker):
+    """Gli hook registrano durata, righe e forma dei parametri; gli statement lenti vengono campionati."""
+    reset_query_log()
+    mocker.patch.object(query_log, 'SLOW_QUERY_MS', 0.0)
+    engine = create_engine("sqlite://")
+    install_query_log(engine)
+    install_query_log(engine)  # Idempotente: nessun doppio conteggio
+
+    with engine.begin() as c:
+        c.execute(text("CREATE TABLE prices (mapping_id INTEGER, close_price REAL)"))
+        c.execute(text("INSERT INTO prices VALUES (:m, :p)"), [{'m': 1, 'p': 10.0}, {'m': 2, 'p': 20.0}])
+        for m in (1, 2):
+            c.execute(text("SELECT close_price FROM prices WHERE mapping_id = :m"), {'m': m}).fetchall()
+
+    stats = query_stats().set_index('fingerprint')
+    select_fp = "select close_price from prices where mapping_id = ?"
+    assert stats.loc[select_fp, 'chiamate'] == 2
+    assert recent_queries()[0]['parametri'].endswith('[1]')  # Un parametro, valori non registrati
+    assert any(q['parametri'].startswith('executemany×2') for q in recent_queries())
+    # Su SQLite non si esegue EXPLAIN ANALYZE, ma lo statement lento viene comunque registrato
+    assert select_fp in {s['fingerprint'] for s in query_log.slow_queries()}
+
+
+def test_skipped_and_failed_statements_leave_no_state_on_pooled_connection():
+    """L'esclusione dal log vale solo per la Connection che la chiede; gli errori non lasciano residui."""
+    reset_query_log()
+    engine = create_engine("sqlite://")  # Una sola connessione DBAPI riusata a ogni checkout
+    install_query_log(engine)
+
+    with engine.connect().execution_options(skip_query_log=True) as c:
+        c.exec_driver_sql("SELECT 1 AS probe_pool")
+    with engine.connect() as c:
+        try:
+            c.exec_driver_sql("SELECT * FROM tabella_inesistente")
+        except Exception:
+            pass
+    with engine.connect() as c:
+        c.exec_driver_sql("SELECT 2 AS probe_pool")
+
+    # Altri test possono lasciare thread che scrivono nel log: si guardano solo queste query
+    stats = query_stats().set_index('fingerprint')
+    assert stats.loc["select ? as probe_pool", 'chiamate'] == 1
+    with engine.connect() as c:
+        assert 'skip_query_log' not in c.info and 'query_start' not in c.info
@@ -0,0 +1,162 @@
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, event
+
+from database.job_store import MAX_ATTEMPTS, RETRY_AFTER_S, acquire_lock, release_lock, job_states
+from services.scheduler import SCHEDULE, JobSchedule, Scheduler, TIMEZONE
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+
+
+def _scheduler(engine, calls, status='ok', owner='test'):
+    def run(ctx, reporter, slot, previous):
+        calls.append(reporter.job)
+        return {'job': reporter.job, 'status': status}
+    schedule = [JobSchedule('sync-prices', run, hour=18, minute=30, weekdays=(0, 1, 2, 3, 4)),
+                JobSchedule('snapshot', run, hour=23)]
+    return Scheduler(engine, schedule=schedule, owner=owner)
+
+
+def test_last_slot_skips_non_scheduled_days():
+    """Di domenica l'ultimo orario di un job feriale è quello del venerdì precedente."""
+    job = JobSchedule('sync-prices', lambda ctx, r, slot, previous: {}, hour=18, minute=30, weekdays=(0, 1, 2, 3, 4))
+    sunday = datetime(2024, 6, 30, 12, 0, tzinfo=TIMEZONE)
+    assert job.last_slot(sunday) == datetime(2024, 6, 28, 18, 30, tzinfo=TIMEZONE)
+
+
+def test_lock_excludes_other_owners_until_expiry(engine):
+    """Un secondo processo non prende il lock finché il primo lo tiene e non è scaduto."""
+    Scheduler(engine, schedule=[])
+    assert acquire_lock(engine, 'snapshot', 'a', ttl_s=60, now=1000.0)
+    assert not acquire_lock(engine, 'snapshot', 'b', ttl_s=60, now=1030.0)
+    assert acquire_lock(engine, 'snapshot', 'b', ttl_s=60, now=1061.0)
+
+    release_lock(engine, 'snapshot', 'b', 'ok', {'status': 'ok'}, started_at=1061.0)
+    state = job_states(engine).iloc[0]
+    assert state['last_status'] == 'ok' and state['locked_by'] is None
+
+
+def test_run_pending_runs_due_jobs_once(engine):
+    """I job dovuti si eseguono una volta per orario previsto, anche recuperando un giro perso."""
+    calls = []
+    scheduler = _scheduler(engine, calls)
+    friday_night = datetime(2024, 6, 28, 23, 30, tzinfo=TIMEZONE)
+
+    results = scheduler.run_pending(friday_night)
+
+    assert calls == ['sync-prices', 'snapshot']
+    assert [r['status'] for r in results] == ['ok', 'ok']
+    assert scheduler.run_pending(friday_night) == []
+
+
+def test_run_pending_skips_job_locked_elsewhere(engine):
+    """Se un'altra istanza tiene il lock il job non parte e resta dovuto al controllo successivo."""
+    calls = []
+    scheduler = _scheduler(engine, calls)
+    acquire_lock(engine, 'snapshot', 'altra-istanza', ttl_s=3600)
+    friday_night = datetime(2024, 6, 28, 23, 30, tzinfo=TIMEZONE)
+
+    scheduler.run_pending(friday_night)
+
+    assert calls == ['sync-prices']
+    assert [j.name for j in scheduler.due_jobs(friday_night)] == ['snapshot']
+
+
+def test_two_schedulers_run_a_slot_once(engine):
+    """Due istanze che vedono lo stesso job dovuto lo eseguono una volta sola: il lock prende lo slot."""
+    calls = []
+    first, second = _scheduler(engine, calls, owner='a'), _scheduler(engine, calls, owner='b')
+    friday_night = datetime(2024, 6, 28, 23, 30, tzinfo=TIMEZONE)
+    snapshot = [j for j in second.due_jobs(friday_night) if j.name == 'snapshot'][0]
+
+    first.run_job(snapshot, friday_night)
+    assert second.run_job(snapshot, friday_night) is None
+
+    assert calls == ['snapshot']
+
+
+def test_failed_run_is_retried_after_backoff(engine):
+    """Un'esecuzione fallita non segna lo slot come fatto: si riprova, ma non prima di RETRY_AFTER_S."""
+    Scheduler(engine, schedule=[])
+    slot = 1000.0
+    assert acquire_lock(engine, 'snapshot', 'a', ttl_s=60, slot=slot, now=1001.0)
+    release_lock(engine, 'snapshot', 'a', 'failed', {'status': 'failed'}, started_at=1001.0, now=1010.0)
+
+    state = job_states(engine).iloc[0]
+    assert state['last_status'] == 'failed' and pd.isna(state['last_run_at'])
+    assert not acquire_lock(engine, 'snapshot', 'b', ttl_s=60, slot=slot, now=1010.0 + RETRY_AFTER_S - 1)
+    assert acquire_lock(engine, 'snapshot', 'b', ttl_s=60, slot=slot, now=1010.0 + RETRY_AFTER_S + 1)
+
+
+def test_backoff_grows_and_slot_is_abandoned_after_max_attempts(engine):
+    """L'attesa raddoppia a ogni fallimento; dopo MAX_ATTEMPTS lo slot conta come eseguito."""
+    Scheduler(engine, schedule=[])
+    slot, now, waits = 1000.0, 1001.0, []
+    for _ in range(MAX_ATTEMPTS):
+        assert acquire_lock(engine, 'snapshot', 'a', ttl_s=60, slot=slot, now=now)
+        retry_at = release_lock(engine, 'snapshot', 'a', 'failed', {'status': 'failed'}, started_at=now, now=now)
+        if retry_at is not None:
+            waits.append(retry_at - now)
+            now = retry_at + 1
+
+    assert waits == [RETRY_AFTER_S * 2 ** i for i in range(MAX_ATTEMPTS - 1)]
+    assert not acquire_lock(engine, 'snapshot', 'a', ttl_s=60, slot=slot, now=now + 1)
+    state = job_states(engine).iloc[0]
+    assert state['failures'] == 0 and state['last_status'] == 'failed'
+
+
+def test_jobs_table_gets_new_columns(engine):
+    """Una tabella scheduled_jobs creata prima della colonna failures viene aggiornata all'avvio."""
+    with engine.begin() as c:
+        c.exec_driver_sql("CREATE TABLE scheduled_jobs (name TEXT PRIMARY KEY, last_run_at DOUBLE PRECISION, "
+                          "last_status TEXT, last_result TEXT, locked_by TEXT, locked_until DOUBLE PRECISION)")
+    Scheduler(engine, schedule=[])
+
+    assert acquire_lock(engine, 'snapshot', 'a', ttl_s=60, slot=1000.0, now=1001.0)
+    assert release_lock(engine, 'snapshot', 'a', 'failed', {}, started_at=1001.0, now=1001.0) == 1001.0 + RETRY_AFTER_S
+
+
+def _snapshot_scheduler(engine):
+    return Scheduler(engine, schedule=[j for j in SCHEDULE if j.name == 'snapshot'], owner='test')
+
+
+def test_missed_snapshot_is_saved_for_its_slot_date(engine, mocker):
+    """Recuperato la mattina dopo, lo snapshot delle 23 si salva con la data della sera prima."""
+    run_snapshot = mocker.patch('services.jobs.run_snapshot', return_value={'job': 'snapshot', 'status': 'ok'})
+
+    _snapshot_scheduler(engine).run_pending(datetime(2024, 6, 29, 8, 0, tzinfo=TIMEZONE))
+
+    assert run_snapshot.call_args[0][0] == date(2024, 6, 28)
+
+
+def test_several_missed_snapshots_are_backfilled_daily(engine, mocker):
+    """Se sono saltati più slot, il recupero ricostruisce ogni giorno dopo l'ultimo snapshot eseguito."""
+    backfill = mocker.patch('services.jobs.run_backfill_networth', return_value={'job': 'backfill-networth', 'status': 'ok'})
+    scheduler = _snapshot_scheduler(engine)
+    last_run = datetime(2024, 6, 25, 23, 0, 5, tzinfo=TIMEZONE).timestamp()
+    assert acquire_lock(engine, 'snapshot', 'test', ttl_s=60, now=last_run)
+    release_lock(engine, 'snapshot', 'test', 'ok', {}, started_at=last_run)
+
+    scheduler.run_pending(datetime(2024, 6, 29, 8, 0, tzinfo=TIMEZONE))
+
+    kwargs = backfill.call_args.kwargs
+    assert (kwargs['start'], kwargs['end'], kwargs['freq']) == (date(2024, 6, 26), date(2024, 6, 28), 'D')
+
+
+def test_idle_checks_do_not_query_the_database(engine):
+    """Tra uno slot e l'altro i controlli usano la copia locale: nessuna query, attesa fino allo slot."""
+    scheduler = _scheduler(engine, [])
+    saturday = datetime(2024, 6, 29, 22, 30, tzinfo=TIMEZONE)
+    scheduler.run_pending(saturday)
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+
+    assert scheduler.run_pending(saturday) == []
+    assert scheduler.seconds_until_next(saturday) == 1800.0  # Fino allo snapshot delle 23
+
+    assert statements == []
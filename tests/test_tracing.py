@@ -0,0 +1,44 @@
+import json
+import time
+import pandas as pd
+from services.tracing import span, traced, start_trace, get_last_trace, summarize_trace, trace_to_json
+
+
+def test_traced_records_rows_and_nested_self_time():
+    """Gli span annidati registrano righe in/out e il riepilogo non conta due volte il tempo dei figli."""
+    start_trace()
+
+    @traced('db')
+    def fake_read():
+        time.sleep(0.02)
+        return pd.DataFrame({'a': range(5)})
+
+    @traced('service')
+    def compute(df):
+        return fake_read().head(2)
+
+    compute(pd.DataFrame({'x': range(3)}))
+
+    spans = get_last_trace()['spans']
+    db_span = next(s for s in spans if s['kind'] == 'db')
+    service_span = next(s for s in spans if s['kind'] == 'service')
+    assert db_span['parent'] == service_span['id']
+    assert db_span['rows_out'] == 5 and db_span['bytes'] > 0
+    assert service_span['rows_in'] == 3 and service_span['rows_out'] == 2
+
+    summary = summarize_trace(spans).set_index('tipo')
+    assert summary.loc['Database', 'tempo_ms'] >= 20
+    assert summary.loc['Calcolo (pandas)', 'tempo_ms'] < summary.loc['Database', 'tempo_ms']
+    assert json.loads(trace_to_json(get_last_trace()))['spans']
+
+
+def test_span_records_errors():
+    """Un'eccezione nel blocco viene registrata nello span e poi rilanciata."""
+    start_trace()
+    try:
+        with span('yahoo.download', 'network'):
+            raise ConnectionError("offline")
+    except ConnectionError:
+        pass
+
+    assert get_last_trace()['spans'][0]['error'] == 'ConnectionError'
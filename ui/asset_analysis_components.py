@@ -3,7 +3,7 @@ import pandas as pd
 import plotly.express as px
 from typing import List, Dict, Any, Optional
 from ui.components import style_chart_for_mobile
-from ui.charts import render_geo_map, plot_price_history, render_allocation_card, ALLOCATION_CONFIG
+from ui.charts import render_geo_map, plot_price_history, render_allocation_card, render_period_selector, filter_period, ALLOCATION_CONFIG
 
 # ========== COMPONENTI UI ==========
 
@@ -101,7 +101,9 @@ def render_price_history(ticker: str, asset_prices: pd.DataFrame, df_asset_trans
     st.divider()
     st.subheader("📉 Storico Prezzo")
     if not asset_prices.empty:
-        fig = plot_price_history(asset_prices, ticker, df_asset_trans)
+        period = render_period_selector("asset_price_period")
+        prices_window = filter_period(asset_prices, 'date', period)
+        fig = plot_price_history(prices_window, ticker, df_asset_trans)
         if fig:
             st.plotly_chart(fig, use_container_width=True)
     else:
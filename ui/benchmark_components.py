@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from ui.components import style_chart_for_mobile
+from ui.charts import downsample_timeseries, filter_period, render_period_selector
 
 def render_benchmark_selector() -> str:
     """Renderizza il selettore del ticker per il benchmark."""
@@ -40,6 +41,8 @@ def render_transaction_log(df_log: pd.DataFrame, bench_ticker: str):
 def render_performance_chart(df_chart: pd.DataFrame, bench_ticker: str):
     """Mostra il grafico dell'andamento del valore nel tempo."""
     st.subheader("📈 Gara di Rendimento")
+    period = render_period_selector("bench_performance_period")
+    df_chart = downsample_timeseries(filter_period(df_chart, 'Data', period), 'Data', ['Tu', 'Benchmark'])
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df_chart['Data'], y=df_chart['Tu'], name='Il Tuo Portafoglio', line=dict(color='#00CC96', width=3)))
     fig.add_trace(go.Scatter(x=df_chart['Data'], y=df_chart['Benchmark'], name=f'Benchmark ({bench_ticker})', line=dict(color='#A0A0A0', width=2, dash='dot')))
@@ -58,6 +61,10 @@ def render_drawdown_chart(df_chart: pd.DataFrame):
     df_dd['Bench_DD'] = ((df_dd['Benchmark'] - df_dd['Bench_Max']) / df_dd['Bench_Max'].replace(0, pd.NA)) * 100
     df_dd = df_dd.fillna(0)
 
+    # Drawdown calcolato sull'intera storia, poi finestra e riduzione dei punti solo per il grafico
+    period = render_period_selector("bench_drawdown_period")
+    df_dd = downsample_timeseries(filter_period(df_dd, 'Data', period), 'Data', ['Tu_DD', 'Bench_DD'])
+
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df_dd['Data'], y=df_dd['Tu_DD'], name='Il Tuo Drawdown', fill='tozeroy', line=dict(color='#EF553B', width=1)))
     fig.add_trace(go.Scatter(x=df_dd['Data'], y=df_dd['Bench_DD'], name='Benchmark Drawdown', line=dict(color='#A0A0A0', width=1, dash='dot')))
@@ -3,13 +3,15 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from database.connection import save_data
-from services.budget_service import calculate_net_worth_trend
+from services.budget_service import (
+    TREND_METHODS, calculate_net_worth_trend, get_cube_month, get_cube_last_months, get_cube_year, summarize_flows
+)
 from ui.components import style_chart_for_mobile
+from ui.charts import cache_figure
 
-def render_month_selector(df_budget: pd.DataFrame) -> str:
+def render_month_selector(budget_cube: pd.DataFrame) -> str:
     """Renderizza il selettore del mese e il messaggio di aiuto."""
-    df_budget['mese_anno'] = df_budget['date'].dt.strftime('%Y-%m')
-    mesi_disponibili = sorted(df_budget['mese_anno'].unique(), reverse=True)
+    mesi_disponibili = [str(m) for m in sorted(budget_cube['mese'].unique(), reverse=True)]
     
     col_sel, col_msg = st.columns([1, 3])
     selected_month = col_sel.selectbox("Seleziona Mese:", mesi_disponibili)
@@ -25,15 +27,21 @@ def render_monthly_kpis(summary: dict, liquidity: float, liquidity_help: str):
     k4.metric("Investito Mese", f"€ {summary['investito_mese']:,.2f}", delta=f"{(summary['investito_mese']/summary['risparmio'])*100:.1f}% del risparmio" if summary['risparmio'] > 0 else "")
     k5.metric("Liquidità Totale", f"€ {liquidity:,.2f}", help=liquidity_help)
 
-def render_monthly_charts(df_month: pd.DataFrame, summary: dict):
-    """Renderizza i grafici a torta e a barre per il mese."""
+@cache_figure
+def _build_expense_pie_figure(df_spese: pd.DataFrame) -> go.Figure:
+    """Torta delle spese per categoria."""
+    fig_pie = px.pie(df_spese, values='amount', names='category', hole=0.4)
+    fig_pie.update_layout(showlegend=False, margin=dict(l=10, r=10, t=10, b=10))
+    return fig_pie
+
+def render_monthly_charts(month_cube: pd.DataFrame, summary: dict):
+    """Renderizza i grafici a torta e a barre per il mese (month_cube: fetta mensile del cubo budget)."""
     c1, c2 = st.columns(2)
     with c1:
         st.write("###### Spese per Categoria")
-        df_spese = df_month[df_month['type'] == 'Uscita']
+        df_spese = month_cube[month_cube['type'] == 'Uscita']
         if not df_spese.empty:
-            fig_pie = px.pie(df_spese, values='amount', names='category', hole=0.4)
-            fig_pie.update_layout(showlegend=False, margin=dict(l=10, r=10, t=10, b=10))
+            fig_pie = _build_expense_pie_figure(df_spese)
             st.plotly_chart(style_chart_for_mobile(fig_pie), width='stretch')
         else:
             st.info("Nessuna spesa registrata.")
@@ -46,6 +54,13 @@ def render_monthly_charts(df_month: pd.DataFrame, summary: dict):
         fig_bar.update_layout(barmode='group', margin=dict(l=10, r=10, t=10, b=10))
         st.plotly_chart(style_chart_for_mobile(fig_bar), width='stretch')
 
+@cache_figure
+def _build_net_worth_increase_figure(df_chart: pd.DataFrame) -> go.Figure:
+    """Barre dell'incremento mensile del patrimonio (verde se positivo, rosso se negativo)."""
+    fig_increase = px.bar(df_chart[df_chart['monthly_increase'].notna() & (df_chart['monthly_increase'] != 0)], x='date', y='monthly_increase', title="Incremento Mensile del Patrimonio")
+    fig_increase.update_traces(marker_color=['#28a745' if x >= 0 else '#dc3545' for x in df_chart['monthly_increase'].dropna()])
+    return fig_increase
+
 def render_net_worth_section(df_nw: pd.DataFrame):
     """Renderizza la sezione completa del patrimonio netto (grafici e tabella)."""
     st.subheader("📈 Andamento Patrimonio Netto")
@@ -58,20 +73,23 @@ def render_net_worth_section(df_nw: pd.DataFrame):
     
     df_chart = df_nw.dropna(subset=['net_worth']).copy()
     df_goals = df_nw.dropna(subset=['goal']).copy()
-    df_trend, _ = calculate_net_worth_trend(df_chart)
+    trend_method = st.radio("Trend", list(TREND_METHODS), format_func=TREND_METHODS.get, horizontal=True, key="nw_trend_method")
+    df_trend, _ = calculate_net_worth_trend(df_chart, method=trend_method)
 
     fig_nw = go.Figure()
     fig_nw.add_trace(go.Scatter(x=df_chart['date'], y=df_chart['net_worth'], name='Patrimonio Netto', mode='lines+markers', line=dict(color='#00CC96', width=3)))
     if not df_goals.empty:
         fig_nw.add_trace(go.Scatter(x=df_goals['date'], y=df_goals['goal'], name='Obiettivo', mode='lines', line=dict(color='#EF553B', dash='dash')))
     if not df_trend.empty:
+        if df_trend['lower'].notna().any():
+            fig_nw.add_trace(go.Scatter(x=df_trend['date'], y=df_trend['upper'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+            fig_nw.add_trace(go.Scatter(x=df_trend['date'], y=df_trend['lower'], mode='lines', line=dict(width=0), fill='tonexty', fillcolor='rgba(255,255,0,0.12)', name='Banda 95%', hoverinfo='skip'))
         fig_nw.add_trace(go.Scatter(x=df_trend['date'], y=df_trend['trend'], name='Trend', line=dict(dash='dot', color='rgba(255,255,0,0.6)')))
     
     fig_nw.update_layout(title="Patrimonio Netto vs Obiettivo")
     st.plotly_chart(style_chart_for_mobile(fig_nw), width='stretch')
 
-    fig_increase = px.bar(df_chart[df_chart['monthly_increase'].notna() & (df_chart['monthly_increase'] != 0)], x='date', y='monthly_increase', title="Incremento Mensile del Patrimonio")
-    fig_increase.update_traces(marker_color=['#28a745' if x >= 0 else '#dc3545' for x in df_chart['monthly_increase'].dropna()])
+    fig_increase = _build_net_worth_increase_figure(df_chart)
     st.plotly_chart(style_chart_for_mobile(fig_increase), width='stretch')
 
     st.write("###### Tabella Riassuntiva")
@@ -111,25 +129,20 @@ def render_transactions_editor(df_month: pd.DataFrame, df_budget_full: pd.DataFr
 # NUOVI GRAFICI PER ANALISI BUDGET
 # =============================================
 
-def render_expense_trend_chart(df_budget: pd.DataFrame, months: int = 6):
+def render_expense_trend_chart(budget_cube: pd.DataFrame, months: int = 6):
     """Mostra il trend delle spese negli ultimi N mesi."""
     st.subheader(f"📊 Trend Spese (Ultimi {months} Mesi)")
     
-    if df_budget.empty:
+    if budget_cube.empty:
         st.info("Nessun dato disponibile.")
         return
     
-    df = df_budget.copy()
-    df['mese'] = df['date'].dt.to_period('M').astype(str)
-    
     # Filtra ultimi N mesi
-    mesi_unici = sorted(df['mese'].unique(), reverse=True)[:months]
-    df_filtered = df[df['mese'].isin(mesi_unici)]
+    df_filtered = get_cube_last_months(budget_cube, months)
     
     # Aggrega per mese e tipo
-    df_agg = df_filtered.groupby(['mese', 'type'])['amount'].sum().reset_index()
-    df_pivot = df_agg.pivot(index='mese', columns='type', values='amount').fillna(0).reset_index()
-    df_pivot = df_pivot.sort_values('mese')
+    df_pivot = df_filtered.pivot_table(index='mese', columns='type', values='amount', aggfunc='sum', observed=True).fillna(0).sort_index().reset_index()
+    df_pivot['mese'] = df_pivot['mese'].astype(str)
     
     # Crea grafico
     fig = go.Figure()
@@ -159,28 +172,25 @@ def render_expense_trend_chart(df_budget: pd.DataFrame, months: int = 6):
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
 
-def render_investment_trend(df_budget: pd.DataFrame, months: int = 6):
+def render_investment_trend(budget_cube: pd.DataFrame, months: int = 6):
     """Mostra il trend degli investimenti negli ultimi N mesi."""
     st.subheader(f"📈 Trend Investimenti (Ultimi {months} Mesi)")
     
-    if df_budget.empty:
+    if budget_cube.empty:
         st.info("Nessun dato disponibile.")
         return
     
-    df = df_budget.copy()
-    df['mese'] = df['date'].dt.to_period('M').astype(str)
-    
     # Filtra ultimi N mesi e solo investimenti
-    mesi_unici = sorted(df['mese'].unique(), reverse=True)[:months]
-    df_filtered = df[(df['mese'].isin(mesi_unici)) & (df['type'] == 'Uscita') & (df['category'] == 'Investimento')]
+    df_last = get_cube_last_months(budget_cube, months)
+    df_filtered = df_last[(df_last['type'] == 'Uscita') & (df_last['category'] == 'Investimento')]
     
     if df_filtered.empty:
         st.info("Nessun investimento registrato negli ultimi mesi.")
         return
     
     # Aggrega per mese
-    df_agg = df_filtered.groupby('mese')['amount'].sum().reset_index()
-    df_agg = df_agg.sort_values('mese')
+    df_agg = df_filtered.groupby('mese')['amount'].sum().sort_index().reset_index()
+    df_agg['mese'] = df_agg['mese'].astype(str)
     
     # Crea grafico
     fig = go.Figure()
@@ -207,23 +217,44 @@ def render_investment_trend(df_budget: pd.DataFrame, months: int = 6):
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
 
-def render_savings_rate_trend(df_budget: pd.DataFrame, months: int = 6):
+def render_liquidity_trend(liquidity_index: pd.Series):
+    """Mostra l'andamento del saldo di cassa nel tempo."""
+    st.subheader("💶 Andamento Liquidità")
+
+    if liquidity_index.empty:
+        st.info("Nessun dato disponibile.")
+        return
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=liquidity_index.index,
+        y=liquidity_index.values,
+        mode='lines',
+        line=dict(color='#28a745', width=2, shape='hv'),
+        name='Liquidità'
+    ))
+    fig.update_layout(
+        title=None,
+        xaxis_title="Data",
+        yaxis_title="Liquidità (€)",
+        margin=dict(l=10, r=10, t=10, b=10)
+    )
+    st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
+
+
+def render_savings_rate_trend(budget_cube: pd.DataFrame, months: int = 6):
     """Mostra l'andamento del tasso di risparmio."""
     st.subheader(f"📈 Andamento Tasso di Risparmio")
     
-    if df_budget.empty:
+    if budget_cube.empty:
         st.info("Nessun dato disponibile.")
         return
     
-    df = df_budget.copy()
-    df['mese'] = df['date'].dt.to_period('M').astype(str)
-    
     # Calcola entrate e uscite per mese
-    mesi_unici = sorted(df['mese'].unique(), reverse=True)[:months]
-    df_filtered = df[df['mese'].isin(mesi_unici)]
+    df_filtered = get_cube_last_months(budget_cube, months)
     
-    df_agg = df_filtered.groupby(['mese', 'type'])['amount'].sum().reset_index()
-    df_pivot = df_agg.pivot(index='mese', columns='type', values='amount').fillna(0).reset_index()
+    df_pivot = df_filtered.pivot_table(index='mese', columns='type', values='amount', aggfunc='sum', observed=True).fillna(0).reset_index()
+    df_pivot['mese'] = df_pivot['mese'].astype(str)
     
     # Calcola savings rate
     if 'Entrata' in df_pivot.columns and 'Uscita' in df_pivot.columns:
@@ -261,7 +292,7 @@ def render_savings_rate_trend(df_budget: pd.DataFrame, months: int = 6):
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
 
-def render_budget_rule_check(df_budget: pd.DataFrame, selected_month: str):
+def render_budget_rule_check(budget_cube: pd.DataFrame, selected_month: str):
     """Verifica la regola 50/30/20: 50% necessità, 30% desideri, 20% risparmio+investimento."""
     st.subheader("🎯 Verifica Regola 50/30/20")
     
@@ -269,13 +300,14 @@ def render_budget_rule_check(df_budget: pd.DataFrame, selected_month: str):
     NECESSITA = ["Affitto/Casa", "Spesa Alimentare", "Trasporti", "Bollette", "Salute"]
     DESIDERI = ["Ristoranti/Svago", "Shopping", "Viaggi"]
     
-    df_month = df_budget[df_budget['date'].dt.strftime('%Y-%m') == selected_month].copy()
+    df_month = get_cube_month(budget_cube, selected_month)
     
     if df_month.empty:
         st.info("Nessun dato per questo mese.")
         return
     
-    entrate = df_month[df_month['type'] == 'Entrata']['amount'].sum()
+    flows = summarize_flows(df_month)
+    entrate = flows['entrate']
     if entrate == 0:
         st.warning("Nessuna entrata registrata per questo mese.")
         return
@@ -286,8 +318,8 @@ def render_budget_rule_check(df_budget: pd.DataFrame, selected_month: str):
     spese_desideri = df_spese[df_spese['category'].isin(DESIDERI)]['amount'].sum()
     
     # Investimenti e risparmio
-    investimenti = df_month[(df_month['type'] == 'Uscita') & (df_month['category'] == 'Investimento')]['amount'].sum()
-    spese_totali = df_spese['amount'].sum()
+    investimenti = flows['investito']
+    spese_totali = flows['uscite']
     risparmio_puro = entrate - spese_totali - investimenti  # Liquidità risparmiata
     risparmio_totale = risparmio_puro + investimenti  # Risparmio + Investimento per regola 50/30/20
     
@@ -364,28 +396,9 @@ def render_budget_rule_check(df_budget: pd.DataFrame, selected_month: str):
         st.info(f"💡 Risparmio + Investimento positivo ma sotto l'obiettivo. Mancano {20 - pct_risparmio_totale:.1f}% per raggiungere il 20%.")
 
 
-def render_expense_breakdown(df_budget: pd.DataFrame, months: int = 3):
-    """Mostra le top 5 categorie di spesa."""
-    st.subheader("🔥 Top Categorie di Spesa")
-    
-    if df_budget.empty:
-        st.info("Nessun dato disponibile.")
-        return
-    
-    df = df_budget.copy()
-    df['mese'] = df['date'].dt.to_period('M').astype(str)
-    
-    # Ultimi N mesi
-    mesi_unici = sorted(df['mese'].unique(), reverse=True)[:months]
-    df_filtered = df[(df['mese'].isin(mesi_unici)) & (df['type'] == 'Uscita')]
-    
-    if df_filtered.empty:
-        st.info("Nessuna spesa negli ultimi mesi.")
-        return
-    
-    # Top 5 categorie
-    df_cat = df_filtered.groupby('category')['amount'].sum().sort_values(ascending=False).head(5)
-    
+@cache_figure
+def _build_top_expenses_figure(df_cat: pd.Series) -> go.Figure:
+    """Barre orizzontali delle categorie con più spesa (df_cat: totale per categoria)."""
     fig = px.bar(
         x=df_cat.values,
         y=df_cat.index,
@@ -403,6 +416,29 @@ def render_expense_breakdown(df_budget: pd.DataFrame, months: int = 3):
         margin=dict(l=10, r=10, t=10, b=10)
     )
     fig.update_traces(textposition='outside')
+    return fig
+
+
+def render_expense_breakdown(budget_cube: pd.DataFrame, months: int = 3):
+    """Mostra le top 5 categorie di spesa."""
+    st.subheader("🔥 Top Categorie di Spesa")
+    
+    if budget_cube.empty:
+        st.info("Nessun dato disponibile.")
+        return
+    
+    # Ultimi N mesi
+    df_last = get_cube_last_months(budget_cube, months)
+    df_filtered = df_last[df_last['type'] == 'Uscita']
+    
+    if df_filtered.empty:
+        st.info("Nessuna spesa negli ultimi mesi.")
+        return
+    
+    # Top 5 categorie
+    df_cat = df_filtered.groupby('category', observed=True)['amount'].sum().sort_values(ascending=False).head(5)
+    
+    fig = _build_top_expenses_figure(df_cat)
     
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
@@ -432,16 +468,15 @@ def render_general_kpis(summary: dict):
     m4.metric("💵 Media Risparmio", f"€ {summary['media_risparmio']:,.0f}")
 
 
-def render_income_vs_expense_totals(df_budget: pd.DataFrame):
+def render_income_vs_expense_totals(budget_cube: pd.DataFrame):
     """Grafico a barre con totali entrate/uscite/investimenti/risparmio."""
-    if df_budget.empty:
+    if budget_cube.empty:
         st.info("Nessun dato disponibile.")
         return
     
     # Calcola totali
-    entrate = df_budget[df_budget['type'] == 'Entrata']['amount'].sum()
-    uscite = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] != 'Investimento')]['amount'].sum()
-    investito = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] == 'Investimento')]['amount'].sum()
+    flows = summarize_flows(budget_cube)
+    entrate, uscite, investito = flows['entrate'], flows['uscite'], flows['investito']
     risparmio = entrate - uscite - investito
     
     df_chart = pd.DataFrame({
@@ -470,12 +505,9 @@ def render_income_vs_expense_totals(df_budget: pd.DataFrame):
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
 
-def render_category_averages_chart(df_averages: pd.DataFrame):
-    """Grafico a barre orizzontali delle medie per categoria."""
-    if df_averages.empty:
-        st.info("Nessun dato disponibile.")
-        return
-    
+@cache_figure
+def _build_category_averages_figure(df_averages: pd.DataFrame) -> go.Figure:
+    """Barre orizzontali delle prime 10 categorie per media mensile."""
     fig = px.bar(
         df_averages.head(10),  # Top 10 categorie
         x='media_mensile',
@@ -495,6 +527,16 @@ def render_category_averages_chart(df_averages: pd.DataFrame):
         margin=dict(l=10, r=10, t=40, b=10)
     )
     fig.update_traces(textposition='outside')
+    return fig
+
+
+def render_category_averages_chart(df_averages: pd.DataFrame):
+    """Grafico a barre orizzontali delle medie per categoria."""
+    if df_averages.empty:
+        st.info("Nessun dato disponibile.")
+        return
+    
+    fig = _build_category_averages_figure(df_averages)
     
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
@@ -533,28 +575,27 @@ def render_yearly_summary_chart(df_yearly: pd.DataFrame):
         st.dataframe(df_display, use_container_width=True, hide_index=True)
 
 
-def render_sankey_flow(df_budget: pd.DataFrame, year: int = None):
+def render_sankey_flow(budget_cube: pd.DataFrame, year: int = None):
     """Diagramma Sankey del flusso di denaro."""
-    if df_budget.empty:
+    if budget_cube.empty:
         st.info("Nessun dato disponibile.")
         return
     
-    df = df_budget.copy()
-    if year:
-        df = df[df['date'].dt.year == year]
+    df = get_cube_year(budget_cube, year)
     
     if df.empty:
         st.info(f"Nessun dato per l'anno {year}.")
         return
     
     # Calcola valori
-    entrate = df[df['type'] == 'Entrata']['amount'].sum()
+    flows = summarize_flows(df)
+    entrate = flows['entrate']
     
     # Spese per categoria (escluso investimento)
     df_spese = df[(df['type'] == 'Uscita') & (df['category'] != 'Investimento')]
-    spese_per_cat = df_spese.groupby('category')['amount'].sum().to_dict()
+    spese_per_cat = df_spese.groupby('category', observed=True)['amount'].sum().to_dict()
     
-    investito = df[(df['type'] == 'Uscita') & (df['category'] == 'Investimento')]['amount'].sum()
+    investito = flows['investito']
     totale_spese = sum(spese_per_cat.values())
     risparmio = entrate - totale_spese - investito
     
@@ -619,11 +660,11 @@ def render_sankey_flow(df_budget: pd.DataFrame, year: int = None):
     st.plotly_chart(fig, use_container_width=True)
 
 
-def render_general_50_30_20(df_budget: pd.DataFrame):
+def render_general_50_30_20(budget_cube: pd.DataFrame):
     """Verifica la regola 50/30/20 su tutto il periodo."""
     st.subheader("🎯 Regola 50/30/20 (Generale)")
     
-    if df_budget.empty:
+    if budget_cube.empty:
         st.info("Nessun dato disponibile.")
         return
     
@@ -631,18 +672,19 @@ def render_general_50_30_20(df_budget: pd.DataFrame):
     NECESSITA = ['Affitto/Casa', 'Spesa Alimentare', 'Trasporti', 'Bollette', 'Salute']
     DESIDERI = ['Ristoranti/Svago', 'Viaggi', 'Shopping', 'Altro']
     
-    entrate = df_budget[df_budget['type'] == 'Entrata']['amount'].sum()
+    flows = summarize_flows(budget_cube)
+    entrate = flows['entrate']
     
     if entrate == 0:
         st.warning("Nessuna entrata registrata.")
         return
     
-    df_spese = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] != 'Investimento')]
-    investimenti = df_budget[(df_budget['type'] == 'Uscita') & (df_budget['category'] == 'Investimento')]['amount'].sum()
+    df_spese = budget_cube[(budget_cube['type'] == 'Uscita') & (budget_cube['category'] != 'Investimento')]
+    investimenti = flows['investito']
     
     spese_necessita = df_spese[df_spese['category'].isin(NECESSITA)]['amount'].sum()
     spese_desideri = df_spese[df_spese['category'].isin(DESIDERI)]['amount'].sum()
-    spese_totali = df_spese['amount'].sum()
+    spese_totali = flows['uscite']
     risparmio_puro = entrate - spese_totali - investimenti
     risparmio_totale = risparmio_puro + investimenti
     
@@ -1,8 +1,16 @@
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+import numpy as np
 import pandas as pd
 import streamlit as st
-import pycountry
+import hashlib
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache, wraps
+from pathlib import Path
 from typing import Dict, Optional
 
 
@@ -48,6 +56,152 @@ ALLOCATION_CONFIG_DASH = {
 }
 
 
+# ========== CACHE DELLE FIGURE ==========
+
+# Numero massimo di figure serializzate tenute in memoria (condivise tra sessioni)
+FIGURE_CACHE_MAX_ENTRIES = 128
+_FIGURE_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+_FIGURE_CACHE_LOCK = threading.Lock()
+
+
+def _update_fingerprint(h, value) -> None:
+    """Aggiunge all'hash un valore: DataFrame/Series via hash vettoriale, contenitori in modo ricorsivo."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        try:
+            hashed = pd.util.hash_pandas_object(value, index=True)
+        except TypeError:
+            # Celle non hashabili (es. dict/list): si passa dalla rappresentazione testuale
+            hashed = pd.util.hash_pandas_object(value.astype(str), index=True)
+        h.update(hashed.to_numpy().tobytes())
+        h.update(repr(value.dtypes.to_dict() if isinstance(value, pd.DataFrame) else value.dtype).encode())
+        h.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+    elif isinstance(value, dict):
+        h.update(b'{')
+        for k in sorted(value, key=repr):
+            h.update(repr(k).encode())
+            _update_fingerprint(h, value[k])
+        h.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        h.update(b'[')
+        for item in value:
+            _update_fingerprint(h, item)
+        h.update(b']')
+    else:
+        h.update(repr(value).encode())
+
+
+def figure_fingerprint(*values) -> str:
+    """Hash economico degli input di un grafico (dati + configurazione)."""
+    h = hashlib.blake2b(digest_size=16)
+    for value in values:
+        _update_fingerprint(h, value)
+    return h.hexdigest()
+
+
+def cache_figure(builder):
+    """
+    Decoratore per le funzioni che costruiscono una figura Plotly a partire dai dati.
+    La figura viene salvata come JSON con chiave l'impronta degli argomenti: ai rerun causati
+    da widget non correlati si ricostruisce la figura dal JSON invece di rieseguire la costruzione
+    (Plotly Express, cicli sulle righe). Ogni chiamata restituisce una figura nuova, modificabile.
+    Conviene per le figure costose da costruire, non per semplici tracce go.Scatter con molti punti.
+    """
+    @wraps(builder)
+    def wrapper(*args, **kwargs):
+        key = (builder.__module__, builder.__qualname__, figure_fingerprint(args, kwargs))
+        with _FIGURE_CACHE_LOCK:
+            fig_json = _FIGURE_CACHE.get(key)
+            if fig_json is not None:
+                _FIGURE_CACHE.move_to_end(key)
+        if fig_json is None:
+            fig = builder(*args, **kwargs)
+            if fig is None:
+                return None
+            fig_json = fig.to_json()
+            with _FIGURE_CACHE_LOCK:
+                _FIGURE_CACHE[key] = fig_json
+                while len(_FIGURE_CACHE) > FIGURE_CACHE_MAX_ENTRIES:
+                    _FIGURE_CACHE.popitem(last=False)
+        return pio.from_json(fig_json)
+    return wrapper
+
+
+# ========== DOWNSAMPLING SERIE TEMPORALI ==========
+
+# Larghezza tipica di un grafico nel layout "wide": oltre ~1 punto per pixel il browser
+# disegna punti sovrapposti, quindi è anche il budget massimo di punti per traccia
+CHART_WIDTH_PX = 1200
+
+# Finestre temporali selezionabili sopra i grafici storici (None = tutto lo storico)
+PERIOD_OPTIONS = {
+    "6M": pd.DateOffset(months=6),
+    "1A": pd.DateOffset(years=1),
+    "3A": pd.DateOffset(years=3),
+    "Tutto": None,
+}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: sceglie n_out indici che preservano la forma della serie.
+    Primo e ultimo punto sono sempre inclusi; per ogni bucket intermedio si tiene il punto che
+    forma il triangolo di area massima con il punto scelto prima e la media del bucket successivo.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out-2 bucket tra primo e ultimo
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_slice = slice(edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        avg_x, avg_y = x[next_slice].mean(), y[next_slice].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def downsample_timeseries(df: pd.DataFrame, x_col: str, y_cols: list, max_points: int = CHART_WIDTH_PX) -> pd.DataFrame:
+    """
+    Riduce una serie temporale a circa max_points righe per traccia con LTTB.
+    Gli indici scelti per ciascuna colonna y vengono uniti, così ogni linea mantiene picchi e minimi.
+    Le serie più corte del budget (es. finestre brevi) restano a piena risoluzione.
+    """
+    if len(df) <= max_points:
+        return df
+    x = pd.to_datetime(df[x_col]).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    keep = np.unique(np.concatenate([lttb_indices(x, df[col].to_numpy(dtype=float), max_points) for col in y_cols]))
+    return df.iloc[keep]
+
+
+def filter_period(df: pd.DataFrame, x_col: str, period: str) -> pd.DataFrame:
+    """Restituisce le righe nella finestra `period` (chiave di PERIOD_OPTIONS) fino all'ultima data."""
+    offset = PERIOD_OPTIONS.get(period)
+    if offset is None or df.empty:
+        return df
+    dates = pd.to_datetime(df[x_col])
+    return df[dates >= dates.max() - offset]
+
+
+def render_period_selector(key: str, default: str = "Tutto") -> str:
+    """Selettore compatto della finestra temporale di un grafico storico."""
+    period = st.segmented_control(
+        label="Periodo",
+        options=list(PERIOD_OPTIONS),
+        default=default,
+        label_visibility="collapsed",
+        key=key
+    )
+    return period or default
+
+
 # ========== CONVERSIONE IT -> ISO3 (per mappa geografica) ==========
 
 # Dizionario di alias per convertire nomi paesi italiani in inglesi
@@ -129,10 +283,68 @@ COUNTRY_ALIASES_IT = {
     "russia": "Russian Federation",
 }
 
+# Voci non-paese come "Altri" che non hanno senso su una mappa
+NON_COUNTRY_KEYS = {"altri", "altro", "resto", "resto del mondo"}
+
+# Indice precalcolato nome paese -> ISO3 (rigenerabile con scripts/build_country_index.py)
+COUNTRY_INDEX_PATH = Path(__file__).resolve().parent.parent / "config" / "country_iso3.json"
+
+
+def _normalize_country_key(name: str) -> str:
+    """Normalizza un nome paese come save_allocation_json: senza accenti, minuscolo, senza spazi ai bordi."""
+    normalized = unicodedata.normalize('NFD', str(name))
+    return normalized.encode('ascii', 'ignore').decode('ascii').lower().strip()
+
+
+@lru_cache(maxsize=None)
+def _fuzzy_iso3(query: str) -> Optional[str]:
+    """Ricerca fuzzy con pycountry (scansione completa del database): il risultato viene memorizzato."""
+    import pycountry
+    try:
+        result = pycountry.countries.search_fuzzy(query)
+        return result[0].alpha_3  # Restituisce il codice ISO3 del primo risultato
+    except Exception:
+        return None  # Se non trova nulla, restituisce None
+
+
+def build_country_iso3_index() -> Dict[str, str]:
+    """
+    Costruisce l'indice nome paese -> ISO3 con nomi, nomi comuni e nomi ufficiali di pycountry
+    e con gli alias di COUNTRY_ALIASES_IT. Ogni nome compare sia in minuscolo sia nella forma
+    normalizzata (senza accenti) usata da save_allocation_json.
+    """
+    import pycountry
+    index = {}
+
+    def add(name: str, iso3: str):
+        for key in (str(name).strip().lower(), _normalize_country_key(name)):
+            index.setdefault(key, iso3)
+
+    for country in pycountry.countries:
+        for attr in ("name", "common_name", "official_name"):
+            if hasattr(country, attr):
+                add(getattr(country, attr), country.alpha_3)
+    for alias, english_name in COUNTRY_ALIASES_IT.items():
+        iso3 = index.get(english_name.lower()) or _fuzzy_iso3(english_name)
+        if iso3:
+            index[alias] = index[_normalize_country_key(alias)] = iso3
+    return dict(sorted(index.items()))
+
+
+@lru_cache(maxsize=1)
+def _country_iso3_index() -> Dict[str, str]:
+    """Carica l'indice persistito (una sola volta per processo); se manca lo ricostruisce in memoria."""
+    try:
+        return json.loads(COUNTRY_INDEX_PATH.read_text(encoding='utf-8'))
+    except (OSError, json.JSONDecodeError):
+        return build_country_iso3_index()
+
+
 def _name_to_iso3(country_name: str) -> Optional[str]:
     """
     Converte nome paese (anche italiano) in ISO3.
-    Usa pycountry + alias minimi per i casi non riconosciuti.
+    Risolve con l'indice precalcolato; la ricerca fuzzy di pycountry
+    (memorizzata) resta solo per i nomi mai visti.
     """
     if not country_name:
         return None
@@ -141,18 +353,17 @@ def _name_to_iso3(country_name: str) -> Optional[str]:
     low = name.lower()
     
     # Escludi voci non-paese come "Altri" che non hanno senso su una mappa
-    if low in {"altri", "altro", "resto", "resto del mondo"}:
+    if low in NON_COUNTRY_KEYS:
         return None
     
-    # 1) Prova a tradurre con gli alias italiani
-    query = COUNTRY_ALIASES_IT.get(low, name)
+    # 1) Ricerca diretta nell'indice (nomi italiani, inglesi e normalizzati)
+    index = _country_iso3_index()
+    iso3 = index.get(low) or index.get(_normalize_country_key(name))
+    if iso3:
+        return iso3
     
-    # 2) Usa pycountry per ricerca fuzzy (approssimata)
-    try:
-        result = pycountry.countries.search_fuzzy(query)
-        return result[0].alpha_3  # Restituisce il codice ISO3 del primo risultato
-    except Exception:
-        return None  # Se non trova nulla, restituisce None
+    # 2) Nome mai visto: ricerca fuzzy (approssimata) con alias italiani
+    return _fuzzy_iso3(COUNTRY_ALIASES_IT.get(low, name))
 
 
 def style_chart_for_mobile(fig: go.Figure) -> go.Figure:
@@ -170,84 +381,10 @@ def style_chart_for_mobile(fig: go.Figure) -> go.Figure:
     return fig
 
 
-def render_geo_map(geo_dict: dict, value_type: str = "euro", toggle_key: str = "map_projection_toggle", include_others: bool = False):
-    """
-    Mappa geografica interattiva con Plotly - versione modulare e riutilizzabile.
-    
-    Args:
-        geo_dict: {nome_paese_IT: valore} - può essere in euro o percentuale.
-                  Le chiavi dovrebbero essere già normalizzate in minuscolo dalla funzione save_allocation_json.
-        value_type: "euro" o "percent" - determina il formato di visualizzazione
-        toggle_key: chiave univoca per il widget di toggle (evita conflitti)
-        include_others: se True, non esclude "Altri" e setta altri_value = 0
-    """
-    if not geo_dict:
-        return  # Se non ci sono dati, esci
-    
-    # ========== PREPARAZIONE DATI ==========
-    # Determina il nome della colonna valore basato sul tipo
-    value_col = "Valore" if value_type == "euro" else "Percentuale"
-    # Crea DataFrame dai dati (le chiavi dovrebbero essere già in minuscolo)
-    df_full = pd.DataFrame(list(geo_dict.items()), columns=["Paese_it", value_col])
-    # Normalizza ulteriormente per sicurezza (strip e lower)
-    df_full["key"] = df_full["Paese_it"].astype(str).str.strip().str.lower()
-    
-    # Calcola il totale originale (incluso "Altri")
-    total_original = df_full[value_col].sum()
-    
-    # Gestione del valore "Altri" (paesi non mappabili)
-    if include_others:
-        altri_value = 0  # Non escludere "Altri"
-        altri_perc = 0
-        df = df_full.copy()
-    else:
-        # Identifica righe "Altri"
-        altri_mask = df_full["key"].isin({"altri", "altro", "resto", "resto del mondo"})
-        altri_value = df_full[altri_mask][value_col].sum()
-        altri_perc = (altri_value / total_original * 100) if total_original > 0 and value_type == "euro" else altri_value
-        df = df_full[~altri_mask].copy()  # Escludi "Altri" dal DataFrame da mappare
-    
-    # Converte nomi paesi italiani in codici ISO3 per Plotly
-    df["iso3"] = df["Paese_it"].apply(_name_to_iso3)
-    df = df[df["iso3"].notna()].copy()  # Rimuovi paesi non riconosciuti
-    
-    if df.empty:
-        st.warning("Nessun paese riconosciuto per la mappa.")
-        return
-    
-    # ========== TOGGLE MINIMALE + AVVISO "ALTRI" ==========
-    # Crea colonne per toggle proiezione e avviso "Altri"
-    col_toggle, col_alert = st.columns([1, 4])
-    with col_toggle:
-        # Toggle per scegliere tra globo 3D e planisfero 2D
-        projection_choice = st.segmented_control(
-            label="Vista",
-            options=["🌐", "🗺️"],  # Globo e Mappa
-            default="🌐",
-            label_visibility="collapsed",
-            key=toggle_key
-        )
-    
-    with col_alert:
-        # Mostra avviso se c'è valore "Altri" non mappabile
-        if altri_value > 0:
-            if value_type == "euro":
-                st.caption(
-                    f"ℹ️ **{altri_perc:.1f}%** (€{altri_value:,.0f}) allocato in paesi non visualizzabili sulla mappa.",
-                    help="Questa quota include paesi non riconosciuti o voci generiche ('Altri', 'Resto del mondo', ecc.)"
-                )
-            else:
-                st.caption(
-                    f"ℹ️ **{altri_value:.1f}%** allocato in paesi non visualizzabili sulla mappa.",
-                    help="Questa quota include paesi non riconosciuti o voci generiche ('Altri', 'Resto del mondo', ecc.)"
-                )
-    
-    # Mappa icone -> proiezioni
-    projection_map = {
-        "🌐": "orthographic",      # Globo 3D
-        "🗺️": "natural earth"      # Planisfero 2D
-    }
-    projection_type = projection_map.get(projection_choice, "orthographic")
+@cache_figure
+def _build_geo_figure(df: pd.DataFrame, value_col: str, value_type: str, total_original: float, projection_type: str) -> go.Figure:
+    """Costruisce la mappa choropleth (df: paesi già convertiti in ISO3)."""
+    df = df.copy()
     
     # ========== CREAZIONE MAPPA ==========
     # Crea choropleth map con Plotly Express
@@ -339,9 +476,94 @@ def render_geo_map(geo_dict: dict, value_type: str = "euro", toggle_key: str = "
             marker_line_color="rgba(255,255,255,0.2)"
         )
     
+    return fig
+
+
+def render_geo_map(geo_dict: dict, value_type: str = "euro", toggle_key: str = "map_projection_toggle", include_others: bool = False):
+    """
+    Mappa geografica interattiva con Plotly - versione modulare e riutilizzabile.
+    
+    Args:
+        geo_dict: {nome_paese_IT: valore} - può essere in euro o percentuale.
+                  Le chiavi dovrebbero essere già normalizzate in minuscolo dalla funzione save_allocation_json.
+        value_type: "euro" o "percent" - determina il formato di visualizzazione
+        toggle_key: chiave univoca per il widget di toggle (evita conflitti)
+        include_others: se True, non esclude "Altri" e setta altri_value = 0
+    """
+    if not geo_dict:
+        return  # Se non ci sono dati, esci
+    
+    # ========== PREPARAZIONE DATI ==========
+    # Determina il nome della colonna valore basato sul tipo
+    value_col = "Valore" if value_type == "euro" else "Percentuale"
+    # Crea DataFrame dai dati (le chiavi dovrebbero essere già in minuscolo)
+    df_full = pd.DataFrame(list(geo_dict.items()), columns=["Paese_it", value_col])
+    # Normalizza ulteriormente per sicurezza (strip e lower)
+    df_full["key"] = df_full["Paese_it"].astype(str).str.strip().str.lower()
+    
+    # Calcola il totale originale (incluso "Altri")
+    total_original = df_full[value_col].sum()
+    
+    # Gestione del valore "Altri" (paesi non mappabili)
+    if include_others:
+        altri_value = 0  # Non escludere "Altri"
+        altri_perc = 0
+        df = df_full.copy()
+    else:
+        # Identifica righe "Altri"
+        altri_mask = df_full["key"].isin(NON_COUNTRY_KEYS)
+        altri_value = df_full[altri_mask][value_col].sum()
+        altri_perc = (altri_value / total_original * 100) if total_original > 0 and value_type == "euro" else altri_value
+        df = df_full[~altri_mask].copy()  # Escludi "Altri" dal DataFrame da mappare
+    
+    # Converte nomi paesi italiani in codici ISO3 per Plotly
+    df["iso3"] = df["Paese_it"].map(_name_to_iso3)
+    df = df[df["iso3"].notna()].copy()  # Rimuovi paesi non riconosciuti
+    
+    if df.empty:
+        st.warning("Nessun paese riconosciuto per la mappa.")
+        return
+    
+    # ========== TOGGLE MINIMALE + AVVISO "ALTRI" ==========
+    # Crea colonne per toggle proiezione e avviso "Altri"
+    col_toggle, col_alert = st.columns([1, 4])
+    with col_toggle:
+        # Toggle per scegliere tra globo 3D e planisfero 2D
+        projection_choice = st.segmented_control(
+            label="Vista",
+            options=["🌐", "🗺️"],  # Globo e Mappa
+            default="🌐",
+            label_visibility="collapsed",
+            key=toggle_key
+        )
+    
+    with col_alert:
+        # Mostra avviso se c'è valore "Altri" non mappabile
+        if altri_value > 0:
+            if value_type == "euro":
+                st.caption(
+                    f"ℹ️ **{altri_perc:.1f}%** (€{altri_value:,.0f}) allocato in paesi non visualizzabili sulla mappa.",
+                    help="Questa quota include paesi non riconosciuti o voci generiche ('Altri', 'Resto del mondo', ecc.)"
+                )
+            else:
+                st.caption(
+                    f"ℹ️ **{altri_value:.1f}%** allocato in paesi non visualizzabili sulla mappa.",
+                    help="Questa quota include paesi non riconosciuti o voci generiche ('Altri', 'Resto del mondo', ecc.)"
+                )
+    
+    # Mappa icone -> proiezioni
+    projection_map = {
+        "🌐": "orthographic",      # Globo 3D
+        "🗺️": "natural earth"      # Planisfero 2D
+    }
+    projection_type = projection_map.get(projection_choice, "orthographic")
+    
+    fig = _build_geo_figure(df, value_col, value_type, total_original, projection_type)
+    
     # Mostra il grafico con stile mobile
     st.plotly_chart(style_chart_for_mobile(fig), width='content')
 
+@cache_figure
 def plot_allocation_pie(data: Dict[str, float], title: str) -> go.Figure:
     """
     Crea un grafico a torta per l'allocazione geografica o settoriale.
@@ -359,6 +581,7 @@ def plot_allocation_pie(data: Dict[str, float], title: str) -> go.Figure:
     # Applica stile mobile
     return style_chart_for_mobile(fig)
 
+@cache_figure
 def plot_price_history(df_prices: pd.DataFrame, ticker: str, df_asset_trans: pd.DataFrame) -> go.Figure:
     """
     Crea il grafico storico dei prezzi per un asset con indicatori delle transazioni.
@@ -366,13 +589,14 @@ def plot_price_history(df_prices: pd.DataFrame, ticker: str, df_asset_trans: pd.
     if df_prices.empty:
         return None  # Se DataFrame vuoto, restituisci None
         
-    # Crea grafico a linea con Plotly Express
-    fig = px.line(df_prices, x='date', y='close_price', title=f"Andamento {ticker}")
+    # Crea grafico a linea con Plotly Express (linea ridotta a ~1 punto per pixel)
+    df_line = downsample_timeseries(df_prices, 'date', ['close_price'])
+    fig = px.line(df_line, x='date', y='close_price', title=f"Andamento {ticker}")
     fig.update_traces(line_color='#00CC96')  # Colore linea verde
     
     # Aggiungi punti rossi per le transazioni
     if not df_asset_trans.empty:
-        # Filtra le date delle transazioni che hanno un prezzo corrispondente
+        # Filtra le date delle transazioni che hanno un prezzo corrispondente (sulla serie completa)
         trans_dates = df_asset_trans['date'].dropna().unique()
         trans_prices = []
         trans_dates_filtered = []
@@ -401,7 +625,10 @@ def plot_portfolio_history(df_hist: pd.DataFrame) -> go.Figure:
     """
     if df_hist.empty:
         return None  # Se DataFrame vuoto, restituisci None
-        
+    
+    # Serie giornaliera ridotta a ~1 punto per pixel (piena risoluzione per le finestre brevi)
+    df_hist = downsample_timeseries(df_hist, 'Data', ['Valore', 'Investito'])
+    
     # Crea figura con due linee: Valore e Investito
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=df_hist['Data'], y=df_hist['Valore'], mode='lines', name='Valore', line=dict(color='#00CC96'), fill='tozeroy'))  # Linea verde con riempimento
@@ -409,6 +636,7 @@ def plot_portfolio_history(df_hist: pd.DataFrame) -> go.Figure:
     # Applica stile mobile
     return style_chart_for_mobile(fig)
 
+@cache_figure
 def plot_treemap(view_df: pd.DataFrame) -> go.Figure:
     """
     Crea la treemap del portafoglio.
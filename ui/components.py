@@ -1,10 +1,19 @@
 import streamlit as st
 from datetime import datetime
+from services.tracing import start_trace, get_last_trace, summarize_trace, trace_to_json
+from database.query_log import query_stats, index_usage
+from database.pool import pool_status
+from database.connection import warm_up_connection, get_mirror
+from database.job_store import job_states
+from services.scheduler import start_app_scheduler
 
 def make_sidebar():
     """
-    Crea la sidebar di navigazione.
+    Crea la sidebar di navigazione e apre la traccia dei tempi del rerun.
     """
+    start_trace()
+    warm_up_connection()
+    start_app_scheduler()
     with st.sidebar:
         st.page_link("app.py", label="Dashboard", icon="🏠")
         st.page_link("pages/1_Analisi_Asset.py", label="Analisi Asset", icon="🔎")
@@ -13,8 +22,79 @@ def make_sidebar():
         st.page_link("pages/4_Bilancio.py", label="Bilancio", icon="💰")
         st.page_link("pages/5_Ribilanciamento.py", label="Ribilancio", icon="🔄")
         st.divider()
+        render_trace_panel()
         st.caption(f"Portfolio Pro v1.2\n© {datetime.now().year}")
 
+def render_trace_panel():
+    """
+    Pannello opzionale con i tempi del rerun precedente: tempo per tipo (DB, rete, calcolo),
+    span più lenti ed esportazione JSON della traccia.
+    """
+    if not st.toggle("⏱️ Tempi di esecuzione", key="show_trace_panel"):
+        return
+    trace = get_last_trace()
+    if not trace or not trace['spans']:
+        st.caption("Nessuna misura disponibile: i tempi compaiono dal rerun successivo.")
+        return
+    summary = summarize_trace(trace['spans'])
+    for row in summary.itertuples(index=False):
+        st.metric(row.tipo, f"{row.tempo_ms:,.0f} ms", f"{row.chiamate} chiamate", delta_color="off")
+    slowest = sorted(trace['spans'], key=lambda s: s['duration_ms'], reverse=True)[:10]
+    st.dataframe(
+        [{'span': s['name'], 'ms': round(s['duration_ms'], 1), 'righe': s['rows_out']} for s in slowest],
+        hide_index=True, width='stretch'
+    )
+    st.download_button("📥 Esporta traccia JSON", trace_to_json(trace), file_name="trace.json", mime="application/json")
+
+    pool = pool_status()
+    if pool['handshakes'] or pool['warm_up_ms'] is not None:
+        avg = f"{pool['handshake_avg_ms']:,.0f} ms" if pool['handshake_avg_ms'] is not None else "-"
+        warm = f"{pool['warm_up_ms']:,.0f} ms" if pool['warm_up_ms'] is not None else "-"
+        st.caption(f"Connessioni DB: {pool['handshakes']} handshake (medio {avg}), "
+                   f"{pool['checkouts']} acquisizioni dal pool, warm-up {warm}")
+
+    # Stato del mirror locale: high-water mark ed età della copia per tabella
+    try:
+        mirror = get_mirror()
+    except Exception:
+        mirror = None
+    if mirror is not None:
+        mirror_state = mirror.status()
+        if not mirror_state.empty:
+            st.caption("Mirror locale (high-water mark per tabella)")
+            st.dataframe(mirror_state[['table_name', 'high_water', 'row_count', 'età_s', 'last_error']], hide_index=True, width='stretch')
+
+    # Job pianificati: ultima esecuzione ed esito (solo se lo scheduler gira in questo processo)
+    scheduler = start_app_scheduler()
+    if scheduler is not None:
+        jobs_state = job_states(scheduler.engine)
+        if not jobs_state.empty:
+            st.caption("Job pianificati (ultima esecuzione, UTC)")
+            st.dataframe(jobs_state[['name', 'last_run_at', 'last_status', 'locked_by']], hide_index=True, width='stretch')
+
+    # Query SQL aggregate per impronta dall'avvio del processo
+    stats = query_stats()
+    if not stats.empty:
+        st.caption("Query SQL per impronta (tempo totale)")
+        st.dataframe(stats[['fingerprint', 'chiamate', 'totale_ms', 'max_ms']].head(10).round(1), hide_index=True, width='stretch')
+        usage = index_usage()
+        if usage['seq_scans'] or usage['index_scans']:
+            st.caption(f"Indici usati: {', '.join(usage['index_scans']) or '-'} · "
+                       f"Scansioni sequenziali: {', '.join(usage['seq_scans']) or '-'}")
+
+def render_lazy_tabs(tabs: dict, key: str):
+    """
+    Crea dei tab in cui viene eseguito solo il contenuto del tab selezionato.
+    tabs: {etichetta: funzione senza argomenti che carica i dati e renderizza il tab}.
+    Il cambio di tab provoca un rerun; i dati restano in cache (get_data, st.cache_data),
+    quindi tornare su un tab già visto è immediato.
+    """
+    containers = st.tabs(list(tabs), key=key, on_change="rerun")
+    for container, render in zip(containers, tabs.values()):
+        if container.open:
+            with container:
+                render()
+
 def style_chart_for_mobile(fig):
     """
     Applica uno stile responsive e pulito ai grafici Plotly.
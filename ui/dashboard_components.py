@@ -4,8 +4,8 @@ import plotly.express as px
 import plotly.graph_objects as go
 import json
 from typing import Optional
-from ui.components import style_chart_for_mobile, color_pnl
-from ui.charts import plot_portfolio_history, render_allocation_card, ALLOCATION_CONFIG_DASH
+from ui.components import style_chart_for_mobile, color_pnl, render_lazy_tabs
+from ui.charts import cache_figure, plot_portfolio_history, render_period_selector, filter_period, render_allocation_card, ALLOCATION_CONFIG_DASH
 
 def render_kpis(assets_view: pd.DataFrame):
     """Renderizza i KPI principali basandosi SOLO sugli asset."""
@@ -22,7 +22,7 @@ def render_kpis(assets_view: pd.DataFrame):
 
 def _render_asset_class_pie(full_view: pd.DataFrame, color_map: dict):
     """Renderizza il grafico a torta della composizione per asset class."""
-    composition_data = full_view.groupby('category')['mkt_val'].sum().reset_index()
+    composition_data = full_view.groupby('category', observed=True)['mkt_val'].sum().reset_index()
     composition_data['percent'] = composition_data['mkt_val'] / composition_data['mkt_val'].sum() * 100
     
     fig_cat = go.Figure()
@@ -69,14 +69,10 @@ def _render_asset_class_pie(full_view: pd.DataFrame, color_map: dict):
     st.plotly_chart(style_chart_for_mobile(fig_cat), use_container_width=True)
 
 
-def _render_sunburst_chart(full_view: pd.DataFrame, color_map: dict):
-    """Renderizza il grafico sunburst per macro categorie e asset."""
-    categories_to_show = ['Azionario', 'Obbligazionario', 'Gold']
-    plot_df = full_view[(full_view['mkt_val'] > 0) & (full_view['category'].isin(categories_to_show))].copy()
-    
-    if plot_df.empty:
-        st.info("Nessun asset da mostrare per il grafico sunburst.")
-        return
+@cache_figure
+def _build_sunburst_figure(plot_df: pd.DataFrame, color_map: dict) -> go.Figure:
+    """Costruisce il sunburst macro categorie -> asset (plot_df: asset con valore > 0)."""
+    plot_df = plot_df.copy()
 
     def extract_ticker(ticker):
         return str(ticker).split('.')[0] if pd.notna(ticker) else 'N/A'
@@ -149,6 +145,19 @@ def _render_sunburst_chart(full_view: pd.DataFrame, color_map: dict):
             font=dict(size=12, color='#e8e8e8')
         )
     )
+    return fig_sunburst
+
+
+def _render_sunburst_chart(full_view: pd.DataFrame, color_map: dict):
+    """Renderizza il grafico sunburst per macro categorie e asset."""
+    categories_to_show = ['Azionario', 'Obbligazionario', 'Gold']
+    plot_df = full_view[(full_view['mkt_val'] > 0) & (full_view['category'].isin(categories_to_show))].copy()
+    
+    if plot_df.empty:
+        st.info("Nessun asset da mostrare per il grafico sunburst.")
+        return
+
+    fig_sunburst = _build_sunburst_figure(plot_df, color_map)
     st.plotly_chart(style_chart_for_mobile(fig_sunburst), use_container_width=True)
 
 
@@ -202,30 +211,12 @@ def _render_detail_pie_chart(full_view: pd.DataFrame, category: str, color_scale
     st.plotly_chart(style_chart_for_mobile(fig), use_container_width=True)
 
 
-def _render_xray_allocation_tab(full_view: pd.DataFrame, df_alloc: pd.DataFrame):
-    """Renderizza il tab con l'analisi X-Ray (geografica e settoriale)."""
-
-    # --- Toggle: Portafoglio Completo vs Solo Azionario ---
-    xray_mode = st.radio(
-        "Seleziona la vista X-Ray",
-        ["📊 Portafoglio Completo", "📈 Solo Azionario"],
-        horizontal=True,
-        key="xray_mode_toggle",
-        label_visibility="collapsed",
-    )
-    is_equity_only = xray_mode == "📈 Solo Azionario"
-
-    if is_equity_only:
-        st.caption(
-            "Esposizione geografica e settoriale della **sola componente azionaria**, "
-            "pesata per il valore di mercato di ogni ETF/azione."
-        )
-    else:
-        st.caption(
-            "Esposizione geografica e settoriale **dell'intero portafoglio**, "
-            "pesata per il valore di mercato di ogni asset."
-        )
-
+@st.cache_data(show_spinner=False)
+def _compute_xray_exposure(full_view: pd.DataFrame, df_alloc: pd.DataFrame, is_equity_only: bool):
+    """
+    Aggrega l'esposizione geografica e settoriale pesata per il valore di mercato.
+    Restituisce (esposizione_geo, esposizione_settori, valore_totale).
+    """
     # --- Prepara la vista con dati di allocazione ---
     view_alloc = full_view.merge(df_alloc, on='mapping_id', how='left') if not df_alloc.empty else full_view.copy()
 
@@ -235,8 +226,7 @@ def _render_xray_allocation_tab(full_view: pd.DataFrame, df_alloc: pd.DataFrame)
     total_val = view_alloc['mkt_val'].sum()
 
     if total_val <= 0:
-        st.warning("Il valore del portafoglio è zero o i prezzi non sono aggiornati.")
-        return
+        return {}, {}, total_val
 
     total_geo, total_sec = {}, {}
     for _, row in view_alloc.iterrows():
@@ -257,6 +247,43 @@ def _render_xray_allocation_tab(full_view: pd.DataFrame, df_alloc: pd.DataFrame)
         for sector, perc in s_map.items():
             total_sec[sector] = total_sec.get(sector, 0) + (val_etf * (float(perc) / 100))
 
+    return total_geo, total_sec, total_val
+
+
+@st.fragment
+def _render_xray_allocation_tab(full_view: pd.DataFrame, df_alloc: pd.DataFrame):
+    """
+    Renderizza il tab con l'analisi X-Ray (geografica e settoriale).
+    È un fragment: il cambio di vista o della proiezione della mappa riesegue solo questo tab.
+    """
+
+    # --- Toggle: Portafoglio Completo vs Solo Azionario ---
+    xray_mode = st.radio(
+        "Seleziona la vista X-Ray",
+        ["📊 Portafoglio Completo", "📈 Solo Azionario"],
+        horizontal=True,
+        key="xray_mode_toggle",
+        label_visibility="collapsed",
+    )
+    is_equity_only = xray_mode == "📈 Solo Azionario"
+
+    if is_equity_only:
+        st.caption(
+            "Esposizione geografica e settoriale della **sola componente azionaria**, "
+            "pesata per il valore di mercato di ogni ETF/azione."
+        )
+    else:
+        st.caption(
+            "Esposizione geografica e settoriale **dell'intero portafoglio**, "
+            "pesata per il valore di mercato di ogni asset."
+        )
+
+    total_geo, total_sec, total_val = _compute_xray_exposure(full_view, df_alloc, is_equity_only)
+
+    if total_val <= 0:
+        st.warning("Il valore del portafoglio è zero o i prezzi non sono aggiornati.")
+        return
+
     # Prefisso chiavi diverso per modalità, evita conflitti Streamlit
     mode_prefix = "eq" if is_equity_only else "all"
 
@@ -275,18 +302,15 @@ def _render_xray_allocation_tab(full_view: pd.DataFrame, df_alloc: pd.DataFrame)
         )
 
 
+@st.fragment
 def render_composition_tabs(full_view: pd.DataFrame, df_alloc: pd.DataFrame):
-    """Renderizza i tab con i grafici di composizione (inclusa liquidità)."""
+    """
+    Renderizza i tab con i grafici di composizione (inclusa liquidità).
+    Solo il tab selezionato viene calcolato; essendo un fragment, il cambio di tab
+    riesegue solo questa sezione e non l'intera Dashboard.
+    """
     st.subheader("🔬 Analisi Composizione Portafoglio")
     
-    tabs = st.tabs([
-        "Asset Class", 
-        "Macro + Dettaglio Asset", 
-        "Dettaglio Azionario", 
-        "Dettaglio Obbligazionario", 
-        "🌍 Allocazione (X-Ray)"
-    ])
-    
     color_map = {
         'Azionario': '#3B82F6', 
         'Obbligazionario': '#EF4444', 
@@ -295,33 +319,27 @@ def render_composition_tabs(full_view: pd.DataFrame, df_alloc: pd.DataFrame):
         'Altro': '#9CA3AF'
     }
     
-    with tabs[0]:
-        _render_asset_class_pie(full_view, color_map)
-    
-    with tabs[1]:
-        _render_sunburst_chart(full_view, color_map)
-    
-    with tabs[2]:
-        _render_detail_pie_chart(
+    render_lazy_tabs({
+        "Asset Class": lambda: _render_asset_class_pie(full_view, color_map),
+        "Macro + Dettaglio Asset": lambda: _render_sunburst_chart(full_view, color_map),
+        "Dettaglio Azionario": lambda: _render_detail_pie_chart(
             full_view, 
             category='Azionario', 
             color_scale=px.colors.sequential.Blues, 
             title='📈 Dettaglio Sezione Azionaria'
-        )
-    
-    with tabs[3]:
-        _render_detail_pie_chart(
+        ),
+        "Dettaglio Obbligazionario": lambda: _render_detail_pie_chart(
             full_view, 
             category='Obbligazionario', 
             color_scale=px.colors.sequential.Reds, 
             title='📉 Dettaglio Sezione Obbligazionaria'
-        )
-    
-    with tabs[4]:
-        _render_xray_allocation_tab(full_view, df_alloc)
+        ),
+        "🌍 Allocazione (X-Ray)": lambda: _render_xray_allocation_tab(full_view, df_alloc),
+    }, key="dash_composition_tab")
 
+@st.fragment
 def render_assets_table(full_view: pd.DataFrame):
-    """Renderizza la tabella con il dettaglio degli asset e gestisce la selezione."""
+    """Renderizza la tabella con il dettaglio degli asset e gestisce la selezione (fragment)."""
     st.divider()
     st.subheader("📋 Dettaglio Asset (Clicca per Analisi)")
     
@@ -349,14 +367,16 @@ def render_assets_table(full_view: pd.DataFrame):
             st.switch_page("pages/1_Analisi_Asset.py")
 
 
+@st.fragment
 def render_historical_chart(hdf: pd.DataFrame):
-    """Renderizza il grafico dell'andamento temporale."""
+    """Renderizza il grafico dell'andamento temporale (fragment: il cambio di periodo riesegue solo il grafico)."""
     st.divider()
     st.subheader("📉 Andamento Temporale")
     
     if not hdf.empty:
+        period = render_period_selector("dash_history_period")
         # SOSTITUITO: Il vecchio 'go.Figure(...)' è stato rimpiazzato da questa chiamata.
-        fig_hist = plot_portfolio_history(hdf)
+        fig_hist = plot_portfolio_history(filter_period(hdf, 'Data', period))
         if fig_hist:
             st.plotly_chart(fig_hist, use_container_width=True)
     else:
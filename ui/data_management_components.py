@@ -5,12 +5,13 @@ import numpy as np
 import uuid
 from datetime import date, datetime
 from database.connection import (
-    get_data, save_data, save_allocation_json, replace_all_mappings,
+    save_data, save_allocation_json, replace_all_mappings,
     insert_single_transaction, update_transaction, delete_transactions,
-    get_db_connection
+    import_transactions_staged, get_db_connection, invalidate_tables, upsert_networth_snapshots
 )
+from database.data_context import DataContext
 from services.data_service import (
-    process_new_transactions, 
+    process_transaction_files,
     calculate_net_worth_snapshot,
     sync_prices,
     fetch_justetf_allocation_robust
@@ -26,7 +27,7 @@ CATEGORIE_ASSET = ["Azionario", "Obbligazionario", "Gold", "Liquidità"]
 # TAB TRANSAZIONI (3 sub-tab: Import CSV, Inserimento Manuale, Gestione)
 # ============================================================
 
-def render_transactions_tab():
+def render_transactions_tab(ctx: DataContext):
     """Tab principale delle transazioni con 3 sub-tab."""
     sub1, sub2, sub3 = st.tabs([
         "📥 Importa CSV DEGIRO",
@@ -36,35 +37,43 @@ def render_transactions_tab():
     with sub1:
         _render_degiro_import()
     with sub2:
-        _render_manual_transaction_form()
+        _render_manual_transaction_form(ctx)
     with sub3:
-        _render_transactions_editor()
+        _render_transactions_editor(ctx)
 
 
 def _render_degiro_import():
-    """Sub-tab: importazione CSV DEGIRO (funzionalità originale)."""
-    st.write("Carica il file `Transactions.csv` di DEGIRO.")
-    up = st.file_uploader("Upload CSV", type=['csv'], key="csv_uploader")
-    if up and st.button("Importa Transazioni"):
-        with st.spinner("Importazione in corso..."):
-            df_trans = get_data("transactions")
-            new_df = process_new_transactions(up, df_trans)
-            if not new_df.empty:
-                save_data(new_df, "transactions", method='append')
-                st.success(f"✅ Importate {len(new_df)} nuove transazioni!")
-                st.rerun()
+    """Sub-tab: importazione CSV DEGIRO, anche di più file (conti diversi o export annuali) in un colpo solo."""
+    st.write("Carica uno o più file `Transactions.csv` di DEGIRO.")
+    st.caption("💡 Puoi caricare insieme export di conti diversi o di anni sovrapposti: "
+               "le operazioni ripetute vengono importate una sola volta.")
+    uploads = st.file_uploader("Upload CSV", type=['csv'], key="csv_uploader", accept_multiple_files=True)
+    if uploads and st.button("Importa Transazioni"):
+        with st.spinner(f"Importazione di {len(uploads)} file in corso..."):
+            parsed_df = process_transaction_files([up.getvalue() for up in uploads])
+            inserted_ids = import_transactions_staged(parsed_df)
+            if inserted_ids is None:
+                return
+            if inserted_ids:
+                new_df = parsed_df[parsed_df['id'].isin(inserted_ids)]
+                st.success(f"✅ Importate {len(new_df)} nuove transazioni "
+                           f"({len(parsed_df) - len(new_df)} già presenti ignorate).")
+                st.dataframe(
+                    new_df[['date', 'product', 'isin', 'quantity', 'local_value', 'fees']],
+                    width='stretch', hide_index=True
+                )
             else:
                 st.info("Nessuna nuova transazione trovata.")
 
 
-def _render_manual_transaction_form():
+def _render_manual_transaction_form(ctx: DataContext):
     """Sub-tab: inserimento manuale di una transazione."""
     st.write("Inserisci manualmente una transazione di acquisto o vendita.")
     st.caption("⚠️ Ricorda: per un **acquisto** il valore deve essere **negativo** (soldi usciti). "
                "Per una **vendita** il valore deve essere **positivo** (soldi entrati).")
 
-    df_map = get_data("mapping")
-    df_trans = get_data("transactions")
+    df_map = ctx.mapping
+    df_trans = ctx.transactions
 
     # Scegli se usare un asset già mappato o nuovo
     mode = st.radio(
@@ -157,11 +166,12 @@ def _render_manual_transaction_form():
                 st.error("❌ Errore durante l'inserimento.")
 
 
-def _render_transactions_editor():
+def _render_transactions_editor(ctx: DataContext):
     """Sub-tab: visualizza, modifica ed elimina transazioni esistenti."""
     st.write("Visualizza e gestisci tutte le transazioni nel database.")
 
-    df_trans = get_data("transactions")
+    # Copia con prodotto, ISIN e valuta come testo: l'editor deve accettare valori nuovi
+    df_trans = ctx.editable("transactions")
     if df_trans.empty:
         st.info("Nessuna transazione nel database.")
         return
@@ -290,12 +300,13 @@ def _render_transactions_editor():
             else:
                 st.info("Nessuna modifica rilevata.")
 
-def render_mapping_tab():
+def render_mapping_tab(ctx: DataContext):
     st.subheader("Modifica, Aggiungi o Elimina Mappature")
     st.caption("Fai doppio clic su una cella per modificarla. Aggiungi una riga in fondo per una nuova mappatura.")
 
-    df_map_full = get_data("mapping")
-    df_trans = get_data("transactions")
+    # Copia con ticker e categoria come testo: l'editor deve accettare valori nuovi
+    df_map_full = ctx.editable("mapping")
+    df_trans = ctx.transactions
 
     # Calcola ISIN posseduti vs venduti
     if not df_trans.empty:
@@ -379,10 +390,10 @@ def render_mapping_tab():
         replace_all_mappings(df_to_process)
         st.success("✅ Mappatura aggiornata con successo!")
 
-def render_prices_tab():
+def render_prices_tab(ctx: DataContext):
     st.write("Scarica gli ultimi prezzi di chiusura da Yahoo Finance per **tutti gli asset mappati** (posseduti e venduti).")
     if st.button("Avvia Sincronizzazione Prezzi"):
-        df_trans, df_map = get_data("transactions"), get_data("mapping")
+        df_trans, df_map = ctx.transactions, ctx.mapping
         if not df_map.empty and not df_trans.empty:
             n = sync_prices(df_trans, df_map)
             if n > 0: st.success(f"✅ Aggiornamento completato: {n} nuovi prezzi salvati.")
@@ -390,7 +401,7 @@ def render_prices_tab():
         else:
             st.error("Database transazioni o mappatura vuoto. Impossibile aggiornare i prezzi.")
 
-def render_budget_tab(initial_balance_exists: bool):
+def render_budget_tab(ctx: DataContext, initial_balance_exists: bool):
     st.header("➕ Inserimento Rapido Movimenti")
     CATEGORIE_ENTRATE_BASE = ["Stipendio", "Bonus", "Regali", "Dividendi", "Rimborso", "Altro", "Aggiustamento Liquidità"]
     CATEGORIE_USCITE = ["Affitto/Casa", "Spesa Alimentare", "Ristoranti/Svago", "Trasporti", "Viaggi", "Salute", "Shopping", "Bollette", "Altro", "Aggiustamento Liquidità", "Investimento"]
@@ -455,7 +466,7 @@ def render_budget_tab(initial_balance_exists: bool):
     
     # --- STORICO MOVIMENTI ---
     st.subheader("📊 Storico Movimenti (Modifica o Elimina)")
-    df_budget_all = get_data("budget")
+    df_budget_all = ctx.editable("budget")
     if not df_budget_all.empty:
         df_budget_all['date'] = pd.to_datetime(df_budget_all['date']).dt.date
         df_edit = df_budget_all.sort_values('date', ascending=False).copy()
@@ -490,7 +501,7 @@ def render_budget_tab(initial_balance_exists: bool):
                 conn = get_db_connection()
                 with conn.engine.begin() as c:
                     c.execute(sa_text("DELETE FROM budget"))
-                st.cache_data.clear()
+                invalidate_tables("budget")
                 st.success("✅ Tutti i movimenti eliminati!")
                 st.rerun()
             else:
@@ -503,19 +514,19 @@ def render_budget_tab(initial_balance_exists: bool):
     else:
         st.info("Nessun movimento presente. Inizia ad aggiungere le tue entrate e uscite!")
 
-def render_allocation_tab():
+def render_allocation_tab(ctx: DataContext):
     st.subheader("Scarica e Modifica Dati di Allocazione (X-Ray)")
 
     # Controlli per evitare comportamenti strani della pagina
     if 'allocation_data_modified' not in st.session_state:
         st.session_state.allocation_data_modified = False
 
-    df_map, df_trans, df_alloc = get_data("mapping"), get_data("transactions"), get_data("asset_allocation")
+    df_map, df_trans, df_alloc = ctx.mapping, ctx.transactions, ctx.asset_allocation
     if df_map.empty or df_trans.empty:
         st.warning("Mancano transazioni o mappatura.")
         return
     df_full = df_trans.merge(df_map, on='isin', how='left')
-    holdings = df_full.groupby(['product', 'ticker', 'isin']).agg(quantity=('quantity', 'sum')).reset_index()
+    holdings = df_full.groupby(['product', 'ticker', 'isin'], observed=True).agg(quantity=('quantity', 'sum')).reset_index()
     view = holdings[holdings['quantity'] > 0.001].copy()
     
     # Crea un dizionario per mappare la stringa visualizzata all'ISIN
@@ -695,7 +706,7 @@ def render_allocation_tab():
     else:
         st.info("Nessun dato di allocazione disponibile.")
 
-def render_net_worth_tab():
+def render_net_worth_tab(ctx: DataContext):
     st.subheader("🎯 Gestione Patrimonio Netto")
     
     # --- 1. SNAPSHOT AUTOMATICO ---
@@ -705,7 +716,7 @@ def render_net_worth_tab():
     if st.button("Calcola Patrimonio a questa data"):
         with st.spinner("Calcolo in corso..."):
             snapshot_date = pd.to_datetime(snapshot_date_input).normalize()
-            dfs = {name: get_data(name) for name in ["transactions", "mapping", "prices", "budget"]}
+            dfs = {name: ctx.table(name) for name in ["transactions", "mapping", "prices", "budget"]}
             st.session_state.calculated_snapshot = {"date": snapshot_date, "values": calculate_net_worth_snapshot(snapshot_date, **dfs)}
             
     if st.session_state.get('calculated_snapshot'):
@@ -714,11 +725,9 @@ def render_net_worth_tab():
         st.metric(f"Patrimonio Calcolato al {snap['date'].strftime('%d-%m-%Y')}", f"€ {net_worth:,.2f}", f"Asset: € {assets_val:,.2f} | Liquidità: € {liquidity_val:,.2f}")
         
         if st.button("💾 Salva questo Snapshot", type="primary"):
-            df_history = get_data("networth_history")
-            new_snapshot = pd.DataFrame([{'date': snap['date'], 'net_worth': net_worth}])
-            df_merged = pd.concat([df_history, new_snapshot]).drop_duplicates(subset='date', keep='last')
-            save_data(df_merged.sort_values('date'), "networth_history", method='replace')
-            st.success("Snapshot salvato!"); st.session_state.calculated_snapshot = None; st.rerun()
+            new_snapshot = pd.DataFrame([{'date': snap['date'], 'net_worth': net_worth, 'assets_value': assets_val, 'liquidity': liquidity_val}])
+            if upsert_networth_snapshots(new_snapshot):
+                st.success("Snapshot salvato!"); st.session_state.calculated_snapshot = None; st.rerun()
             
     st.divider()
 
@@ -730,7 +739,7 @@ def render_net_worth_tab():
         manual_nw = c2.number_input("Patrimonio Netto (€)", min_value=0.0, format="%.2f")
         
         if st.form_submit_button("➕ Aggiungi Valore Manuale") and manual_nw > 0:
-            df_history = get_data("networth_history")
+            df_history = ctx.networth_history
             new_entry = pd.DataFrame([{'date': pd.to_datetime(manual_date), 'net_worth': manual_nw}])
             df_merged = pd.concat([df_history, new_entry]).drop_duplicates(subset='date', keep='last')
             save_data(df_merged.sort_values('date'), "networth_history", method='replace')
@@ -740,7 +749,7 @@ def render_net_worth_tab():
 
     # --- 3. MODIFICA STORICO ---
     st.markdown("### 3. Modifica o Elimina Storico")
-    df_history_full = get_data("networth_history")
+    df_history_full = ctx.networth_history
     
     df_nw_edit = pd.DataFrame(columns=['date', 'net_worth'])
     if not df_history_full.empty and 'net_worth' in df_history_full.columns:
@@ -826,7 +835,7 @@ def render_net_worth_tab():
         if "id" in df_new_goals.columns: df_new_goals = df_new_goals.drop(columns=["id"])
 
         # Ricarica per sicurezza lo stato attuale
-        df_history_curr = get_data("networth_history")
+        df_history_curr = ctx.table("networth_history", refresh=True)
         
         if not df_new_goals.empty: 
             df_new_goals['date'] = pd.to_datetime(df_new_goals['date']).dt.normalize()